@@ -0,0 +1,109 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure the import time of ciso_agent modules with `python -X importtime` and check it against a budget.
+
+The harness starts a fresh process per scenario, so this time is paid on every run.
+The exit code is 1 if a module exceeds the budget or imports a forbidden package.
+
+    python benchmarks/bench_import_time.py --budget-ms 1500
+    python benchmarks/bench_import_time.py -m ciso_agent.llm --forbid crewai,langchain_openai,langchain_ibm
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+default_modules = ["ciso_agent.main", "ciso_agent.llm"]
+# these are needed only after a crew / an LLM provider is selected
+default_forbidden = ["crewai", "langchain_openai", "langchain_ibm", "langtrace_python_sdk"]
+
+
+def parse_importtime(stderr: str) -> list:
+    """Return a list of (package, self_us, cumulative_us, depth) from the `-X importtime` output"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:") :].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].strip())
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            # header line
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((name.strip(), self_us, cumulative_us, depth))
+    return entries
+
+
+def measure_module(module: str) -> list:
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise ValueError(f"failed to import `{module}`:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def summarize(module: str, runs: list, forbidden: list, top: int) -> dict:
+    totals = []
+    for entries in runs:
+        totals.append(sum(cumulative for _, _, cumulative, depth in entries if depth == 0) / 1000)
+    last = runs[-1]
+    top_level = {}
+    for name, _, cumulative, depth in last:
+        if depth == 0:
+            root = name.split(".")[0]
+            top_level[root] = top_level.get(root, 0) + cumulative / 1000
+    slowest = sorted(top_level.items(), key=lambda x: x[1], reverse=True)[:top]
+    imported = {name.split(".")[0] for name, _, _, _ in last}
+    return {
+        "module": module,
+        "median_ms": round(statistics.median(totals), 1),
+        "min_ms": round(min(totals), 1),
+        "slowest_packages_ms": {name: round(ms, 1) for name, ms in slowest},
+        "forbidden_imported": sorted(imported & set(forbidden)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import time budget check for ciso_agent")
+    parser.add_argument("-m", "--modules", default=",".join(default_modules), help="comma-separated modules to import")
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("CISO_IMPORT_BUDGET_MS", "1500")))
+    parser.add_argument("--forbid", default=",".join(default_forbidden), help="comma-separated packages which must not be imported")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    forbidden = [p for p in args.forbid.split(",") if p]
+    results = []
+    ok = True
+    for module in [m for m in args.modules.split(",") if m]:
+        runs = [measure_module(module) for _ in range(args.runs)]
+        result = summarize(module, runs, forbidden, args.top)
+        result["budget_ms"] = args.budget_ms
+        result["within_budget"] = result["median_ms"] <= args.budget_ms and not result["forbidden_imported"]
+        ok = ok and result["within_budget"]
+        results.append(result)
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the per-run setup overhead of a new CISOManager (cold) and the shared one (warm).
+
+The setup is everything `ciso_agent.main.run` does before the first node runs:
+building and compiling the graph, and preparing the per-run state.
+
+    python benchmarks/bench_manager_reuse.py -n 200
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+
+def measure(func, n: int) -> list:
+    durations = []
+    for _ in range(n):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def summarize(durations: list) -> dict:
+    durations = sorted(durations)
+    return {
+        "runs": len(durations),
+        "mean_ms": round(statistics.mean(durations) * 1000, 3),
+        "p50_ms": round(durations[len(durations) // 2] * 1000, 3),
+        "p90_ms": round(durations[int(len(durations) * 0.9) - 1] * 1000, 3),
+        "max_ms": round(durations[-1] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="cold vs warm CISOManager setup overhead")
+    parser.add_argument("-n", "--runs", type=int, default=100)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    from ciso_agent.manager import CISOManager, CISOState, get_manager, new_run_state
+
+    import_seconds = time.perf_counter() - start
+    state = CISOState(goal="benchmark goal")
+
+    def cold():
+        manager = CISOManager(eval_policy=False)
+        new_run_state(state)
+        return manager
+
+    def warm():
+        manager = get_manager(eval_policy=False)
+        new_run_state(state)
+        return manager
+
+    # the first call of get_manager() compiles the graph; it is the same cost as one cold run
+    warm()
+    cold_stats = summarize(measure(cold, args.runs))
+    warm_stats = summarize(measure(warm, args.runs))
+    result = {
+        "import_ms": round(import_seconds * 1000, 3),
+        "cold": cold_stats,
+        "warm": warm_stats,
+        "speedup": round(cold_stats["mean_ms"] / warm_stats["mean_ms"], 1) if warm_stats["mean_ms"] else None,
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# this module imports crewai; it is loaded by `ciso_agent.llm.init_agent_llm` only when a crew is used
+
+import time
+
+from crewai import LLM
+
+from ciso_agent.events import check_cancelled
+from ciso_agent.llm import emit_llm_call_event, llm_role_agent, record_llm_latency
+from ciso_agent.llm_cache import LLMResponseCache, get_llm_cache
+from ciso_agent.rate_limit import call_with_retry, estimate_tokens, get_rate_limiter
+from ciso_agent.tracing import span_kind_llm, trace_span
+
+
+class AgentLLM(LLM):
+    """crewAI LLM which looks up the LLM response cache and applies the rate limit / retry before calling the API"""
+
+    role: str = llm_role_agent
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None):
+        check_cancelled()
+        _messages = messages
+        if isinstance(_messages, str):
+            _messages = [{"role": "user", "content": _messages}]
+        prompts = [m.get("content") for m in _messages]
+
+        cache = get_llm_cache()
+        cache_key = ""
+        if cache:
+            params = {
+                "base_url": self.base_url,
+                "temperature": self.temperature,
+                "max_tokens": self.max_tokens,
+                "stop": self.stop,
+                "additional_params": getattr(self, "additional_params", {}),
+                "tools": tools,
+            }
+            cache_key = LLMResponseCache.make_key(model=self.model, messages=_messages, params=params)
+            answer = cache.get(cache_key)
+            if answer is not None:
+                emit_llm_call_event(role=self.role, model=self.model, duration=0.0, prompts=prompts, answer=answer, cached=True)
+                return answer
+
+        def _call():
+            return super(AgentLLM, self).call(messages, tools=tools, callbacks=callbacks, available_functions=available_functions)
+
+        start = time.monotonic()
+        prompt_chars = sum([len(p) for p in prompts if isinstance(p, str)])
+        with trace_span(f"llm:{self.role}", kind=span_kind_llm, model=self.model, prompt_chars=prompt_chars) as span:
+            answer = call_with_retry(
+                _call,
+                limiter=get_rate_limiter(api_url=self.base_url, model=self.model),
+                tokens=estimate_tokens(prompts),
+            )
+            if span:
+                span.set_attribute("answer_chars", len(answer) if isinstance(answer, str) else None)
+        duration = time.monotonic() - start
+        record_llm_latency(self.role, duration)
+        emit_llm_call_event(role=self.role, model=self.model, duration=duration, prompts=prompts, answer=answer)
+        if cache and isinstance(answer, str):
+            cache.put(cache_key, answer, meta={"model": self.model})
+        return answer
@@ -19,22 +19,16 @@ import shutil
 import string
 
 from crewai import Agent, Crew, Process, Task
-from dotenv import load_dotenv
-from langtrace_python_sdk import langtrace
 
-from ciso_agent.llm import init_agent_llm, extract_code
+from ciso_agent.agents.report_models import KubernetesKubectlOPAReport, dump_report
+from ciso_agent.llm import init_agent_llm, llm_role_reporter, parse_json_answer
 from ciso_agent.tools.generate_opa_rego import GenerateOPARegoTool
-from ciso_agent.tools.run_opa_rego import RunOPARegoTool
+from ciso_agent.tools.run_opa_rego import RunOPARegoBulkTool, RunOPARegoMultiTool, RunOPARegoTool
 from ciso_agent.tools.run_kubectl import RunKubectlTool
+from ciso_agent.tracing import init_langtrace, trace_crew
 
 
-load_dotenv()
-
-if os.getenv("LANGTRACE_API_HOST"):
-    langtrace.init(
-        api_host=os.getenv("LANGTRACE_API_HOST"),
-        api_key=os.getenv("LANGTRACE_API_KEY"),
-    )
+init_langtrace()
 
 
 class KubernetesKubectlOPACrew(object):
@@ -55,6 +49,8 @@ Once you get a final answer, you can quit the work.
 
     tool_description: str = """This agent has the following tools to use:
 - RunOPARegoTool
+- RunOPARegoBulkTool (to get the check result per item, e.g. per pod or per host)
+- RunOPARegoMultiTool (to check many policies against the same input data at once)
 - GenerateOPARegoTool
 - RunKubectlTool
 """
@@ -97,6 +93,14 @@ Once you get a final answer, you can quit the work.
             llm=llm,
             verbose=True,
         )
+        # reporting the filepaths is a trivial task, so it can use a smaller model
+        reporter_agent = Agent(
+            role="Reporter",
+            goal="Report the result of the previous task",
+            backstory="",
+            llm=init_agent_llm(role=llm_role_reporter),
+            verbose=True,
+        )
 
         target_task = Task(
             name="target_task",
@@ -105,6 +109,8 @@ Once you get a final answer, you can quit the work.
             agent=test_agent,
             tools=[
                 RunOPARegoTool(workdir=workdir),
+                RunOPARegoBulkTool(workdir=workdir),
+                RunOPARegoMultiTool(workdir=workdir),
                 GenerateOPARegoTool(workdir=workdir),
                 RunKubectlTool(workdir=workdir, read_only=True),
             ],
@@ -124,33 +130,33 @@ Just to report the result.
 }
 ```
 """,
+            output_pydantic=KubernetesKubectlOPAReport,
             context=[target_task],
-            agent=test_agent,
+            agent=reporter_agent,
         )
 
-        crew = Crew(
-            name="CISOCrew",
-            tasks=[
-                target_task,
-                report_task,
-            ],
-            agents=[
-                test_agent,
-            ],
-            process=Process.sequential,
-            verbose=True,
-        )
-        inputs = {}
-        output = crew.kickoff(inputs=inputs)
-        result_str = output.raw
-        if "```" in result_str:
-            result_str = extract_code(result_str, code_type="json")
-
-        result = None
-        try:
-            result = json.loads(result_str)
-        except Exception:
-            raise ValueError(f"Failed to parse this as JSON: {result_str}")
+        with trace_crew(type(self).__name__, task_names=["target_task", "report_task"]) as task_callback:
+            crew = Crew(
+                name="CISOCrew",
+                tasks=[
+                    target_task,
+                    report_task,
+                ],
+                agents=[
+                    test_agent,
+                    reporter_agent,
+                ],
+                process=Process.sequential,
+                verbose=True,
+                task_callback=task_callback,
+            )
+            inputs = {}
+            output = crew.kickoff(inputs=inputs)
+        if output.pydantic is not None:
+            result = dump_report(output.pydantic)
+        else:
+            # fallback when the structured output is not available
+            result = parse_json_answer(output.raw)
 
         # add workdir prefix here because agent does not know it
         for key, val in result.items():
@@ -20,21 +20,15 @@ import string
 import sys
 
 from crewai import Agent, Crew, Process, Task
-from dotenv import load_dotenv
-from langtrace_python_sdk import langtrace
 
-from ciso_agent.llm import init_agent_llm, extract_code
+from ciso_agent.agents.report_models import KubernetesKyvernoUpdateReport, dump_report
+from ciso_agent.llm import init_agent_llm, extract_code, llm_role_reporter
 from ciso_agent.tools.generate_kyverno import GenerateKyvernoTool
 from ciso_agent.tools.run_kubectl import RunKubectlTool
+from ciso_agent.tracing import init_langtrace, trace_crew
 
 
-load_dotenv()
-
-if os.getenv("LANGTRACE_API_HOST"):
-    langtrace.init(
-        api_host=os.getenv("LANGTRACE_API_HOST"),
-        api_key=os.getenv("LANGTRACE_API_KEY"),
-    )
+init_langtrace()
 
 
 class KubernetesKyvernoUpdateCrew(object):
@@ -100,6 +94,14 @@ Once you get a final answer, you can quit the work.
             llm=llm,
             verbose=True,
         )
+        # reporting the filepaths is a trivial task, so it can use a smaller model
+        reporter_agent = Agent(
+            role="Reporter",
+            goal="Report the result of the previous task",
+            backstory="",
+            llm=init_agent_llm(role=llm_role_reporter),
+            verbose=True,
+        )
 
         target_task = Task(
             name="target_task",
@@ -130,26 +132,44 @@ Just to report the result.
 ```
 You can omit `namespace` in `updated_resource` if the policy is a cluster-scope resource.
 """,
+            output_pydantic=KubernetesKyvernoUpdateReport,
             context=[target_task],
-            agent=test_agent,
+            agent=reporter_agent,
         )
 
-        crew = Crew(
-            name="CISOCrew",
-            tasks=[
-                target_task,
-                report_task,
-            ],
-            agents=[
-                test_agent,
-            ],
-            process=Process.sequential,
-            verbose=True,
-            cache=False,
-        )
-        inputs = {}
-        output = crew.kickoff(inputs=inputs)
-        result_str = output.raw.strip()
+        with trace_crew(type(self).__name__, task_names=["target_task", "report_task"]) as task_callback:
+            crew = Crew(
+                name="CISOCrew",
+                tasks=[
+                    target_task,
+                    report_task,
+                ],
+                agents=[
+                    test_agent,
+                    reporter_agent,
+                ],
+                process=Process.sequential,
+                verbose=True,
+                task_callback=task_callback,
+                cache=False,
+            )
+            inputs = {}
+            output = crew.kickoff(inputs=inputs)
+        if output.pydantic is not None:
+            result = dump_report(output.pydantic)
+        else:
+            # fallback when the structured output is not available
+            result = self.parse_raw_output(output.raw)
+
+        # add workdir prefix here because agent does not know it
+        for key, val in result.items():
+            if val and key.startswith("path_to_") and "/" not in val:
+                result[key] = os.path.join(workdir, val)
+
+        return {"result": result}
+
+    def parse_raw_output(self, raw: str):
+        result_str = raw.strip()
         if not result_str:
             raise ValueError("crew agent returned an empty string.")
 
@@ -158,20 +178,14 @@ You can omit `namespace` in `updated_resource` if the policy is a cluster-scope
         result_str = result_str.strip()
 
         if not result_str:
-            raise ValueError(f"crew agent returned an invalid string. This is the actual output: {output.raw}")
+            raise ValueError(f"crew agent returned an invalid string. This is the actual output: {raw}")
 
         result = {}
         try:
             result = json.loads(result_str)
         except Exception:
             print(f"Failed to parse this as JSON: {result_str}", file=sys.stderr)
-
-        # add workdir prefix here because agent does not know it
-        for key, val in result.items():
-            if val and key.startswith("path_to_") and "/" not in val:
-                result[key] = os.path.join(workdir, val)
-
-        return {"result": result}
+        return result
 
 
 def main(kubeconfig, output, workdir: str = "", current_compliance: str = "Ensure that the cluster-admin role is only used where required", updated_compliance: str = "Ensure that the cluster-admin role is only used where required"):
@@ -0,0 +1,60 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Structured outputs (`output_pydantic`) of the report tasks of the crews.
+
+Unset fields are None and dropped by `dump_report()`, so the result keeps the shape of the free-form JSON the reporter
+used to return: a missing path stays missing instead of becoming an empty path, and a cluster-scoped resource
+has no `namespace`. Keys which are not in the model are kept as they are.
+"""
+
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict
+
+
+class ReportModel(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+
+class KubernetesResource(ReportModel):
+    namespace: Optional[str] = None
+    kind: Optional[str] = None
+    name: Optional[str] = None
+
+
+class KubernetesKyvernoReport(ReportModel):
+    deployed_resource: Optional[KubernetesResource] = None
+    path_to_generated_kyverno_policy: Optional[str] = None
+
+
+class KubernetesKyvernoUpdateReport(ReportModel):
+    updated_resource: Optional[KubernetesResource] = None
+    path_to_generated_kyverno_policy: Optional[str] = None
+
+
+class KubernetesKubectlOPAReport(ReportModel):
+    path_to_generated_shell_script: Optional[str] = None
+    path_to_generated_rego_policy: Optional[str] = None
+    path_to_collected_data_by_script: Optional[str] = None
+
+
+class RHELPlaybookOPAReport(ReportModel):
+    path_to_generated_playbook: Optional[str] = None
+    path_to_generated_rego_policy: Optional[str] = None
+    path_to_collected_data_by_playbook: Optional[str] = None
+
+
+def dump_report(report: BaseModel) -> dict:
+    return report.model_dump(exclude_none=True)
@@ -0,0 +1,314 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run many goals / scenarios concurrently, each in its own process and workdir.
+
+The input is a JSONL file (one entry per line) or a JSON file (a list of entries, or a single scenario).
+An entry is one of the following:
+
+- a goal string, or `{"id": "...", "goal": "..."}`
+- a path to a `scenario_data.json` file, or `{"id": "...", "scenario_data": "<path>"}`
+- scenario data itself (`{"goal_template": "...", "vars": {"kubeconfig": "...", ...}}`)
+
+Scenario data is prepared in the same way as `agent-harness.yaml` does.
+
+    python -m ciso_agent.batch goals.jsonl -o /tmp/agent/batch -j 4 --timeout 200
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import re
+import signal
+import sys
+import tempfile
+import time
+import traceback
+from typing import Optional
+
+from ciso_agent.tools.opa import stop_opa_servers
+
+status_succeeded = "succeeded"
+status_failed = "failed"
+status_timed_out = "timed_out"
+
+default_timeout = 200.0
+# seconds to wait after SIGTERM before SIGKILL
+terminate_grace_period = 5.0
+
+
+def load_batch_items(path: str) -> list:
+    with open(path, "r") as f:
+        text = f.read()
+    if path.endswith(".jsonl"):
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        data = json.loads(text)
+        entries = data if isinstance(data, list) else [data]
+    base_dir = os.path.dirname(os.path.abspath(path))
+    return [normalize_batch_item(entry, index=i, base_dir=base_dir) for i, entry in enumerate(entries)]
+
+
+def normalize_batch_item(entry, index: int = 0, base_dir: str = "") -> dict:
+    """Return `{"id": ..., "goal": ..., "scenario_data": ...}` for an input entry"""
+    if isinstance(entry, str):
+        entry = {"scenario_data": entry} if entry.endswith(".json") else {"goal": entry}
+    if not isinstance(entry, dict):
+        raise ValueError(f"batch entry #{index} must be a string or an object, but got {type(entry).__name__}")
+
+    if "goal_template" in entry:
+        scenario_data = entry
+    else:
+        scenario_data = entry.get("scenario_data")
+    if isinstance(scenario_data, str):
+        fpath = scenario_data if os.path.isabs(scenario_data) else os.path.join(base_dir, scenario_data)
+        with open(fpath, "r") as f:
+            scenario_data = json.load(f)
+
+    goal = entry.get("goal", "")
+    if not goal and not scenario_data:
+        raise ValueError(f"batch entry #{index} has neither `goal` nor `scenario_data`")
+
+    item_id = str(entry.get("id") or (scenario_data or {}).get("id") or f"{index:04d}")
+    return {"id": item_id, "goal": goal, "scenario_data": scenario_data}
+
+
+def get_item_dirname(index: int, item_id: str) -> str:
+    safe_id = re.sub(r"[^A-Za-z0-9_.-]+", "_", item_id)[:64]
+    return f"{index:04d}-{safe_id}" if safe_id != f"{index:04d}" else safe_id
+
+
+def prepare_scenario(item: dict, workdir: str) -> str:
+    """Write the scenario inputs into the workdir and return the goal, like `agent-harness.yaml`"""
+    os.makedirs(workdir, exist_ok=True)
+    scenario_data = item.get("scenario_data")
+    if not scenario_data:
+        goal = item["goal"]
+    else:
+        with open(os.path.join(workdir, "scenario_data.json"), "w") as f:
+            json.dump(scenario_data, f)
+        variables = scenario_data.get("vars") or {}
+        kubeconfig_path = os.path.join(workdir, "kubeconfig.yaml")
+        inventory_path = os.path.join(workdir, "ansible.ini")
+        key_path = os.path.join(workdir, "user_key")
+        _write_text(kubeconfig_path, variables.get("kubeconfig"))
+        _write_text(key_path, variables.get("ansible_user_key"))
+        if os.path.exists(key_path):
+            os.chmod(key_path, 0o600)
+        inventory = variables.get("ansible_ini")
+        if inventory:
+            inventory = re.sub(r'(ansible_ssh_private_key_file=")[^"]*', lambda m: m.group(1) + key_path, inventory)
+        _write_text(inventory_path, inventory)
+
+        goal = scenario_data.get("goal_template", "")
+        goal = goal.replace("{{ kubeconfig }}", kubeconfig_path)
+        goal = goal.replace("{{ path_to_inventory }}", inventory_path)
+    goal = goal.rstrip("\n") + "\n" + f"You can use `{workdir}` as your workdir.\n"
+    with open(os.path.join(workdir, "goal.txt"), "w") as f:
+        f.write(goal)
+    return goal
+
+
+def run_goal(goal: str) -> dict:
+    from ciso_agent.main import run
+
+    return run(inputs={"goal": goal})
+
+
+def run_batch(
+    items: list,
+    output_dir: str,
+    workers: int = 4,
+    timeout: float = default_timeout,
+    target=None,
+    preload: bool = False,
+) -> dict:
+    """Run the items with at most `workers` processes at a time and return the summary.
+
+    Each item runs in its own process (and process group), so a timed-out scenario is killed
+    together with the commands it started. `target(goal) -> dict` runs one goal; the default is `ciso_agent.main.run`.
+    """
+    target = target or run_goal
+    os.makedirs(output_dir, exist_ok=True)
+    ctx = get_mp_context()
+    if preload and ctx.get_start_method() == "fork":
+        # forked workers inherit the imported modules instead of importing them again
+        importlib.import_module("ciso_agent.main")
+
+    pending = list(enumerate(items))
+    pending.reverse()
+    running = {}
+    records = [None] * len(items)
+    batch_start = time.monotonic()
+    while pending or running:
+        while pending and len(running) < workers:
+            index, item = pending.pop()
+            workdir = os.path.join(output_dir, get_item_dirname(index, item["id"]))
+            result_path = os.path.join(workdir, "batch-result.json")
+            os.makedirs(workdir, exist_ok=True)
+            process = ctx.Process(target=_run_item, args=(item, workdir, result_path, target), name=f"ciso-batch-{index}")
+            process.start()
+            running[process.sentinel] = {"index": index, "item": item, "process": process, "start": time.monotonic(), "result_path": result_path}
+
+        now = time.monotonic()
+        wait_timeout = None
+        if timeout:
+            wait_timeout = max(0.0, min(job["start"] + timeout for job in running.values()) - now)
+        ready = multiprocessing.connection.wait(list(running.keys()), timeout=wait_timeout)
+
+        now = time.monotonic()
+        for sentinel, job in list(running.items()):
+            elapsed = now - job["start"]
+            process = job["process"]
+            if sentinel in ready:
+                process.join()
+                record = _read_json(job["result_path"])
+                if not record:
+                    record = {"status": status_failed, "error": f"the worker process exited with code {process.exitcode}"}
+            elif timeout and elapsed >= timeout:
+                _kill_process_group(process)
+                record = {"status": status_timed_out, "error": f"timed out after {timeout} seconds"}
+            else:
+                continue
+            record.update({"id": job["item"]["id"], "index": job["index"], "duration": round(elapsed, 3)})
+            records[job["index"]] = record
+            del running[sentinel]
+            print(f"[{job['index'] + 1}/{len(items)}] {record['id']}: {record['status']} ({record['duration']}s)")
+
+    summary = summarize_batch(records, wall_time=time.monotonic() - batch_start)
+    with open(os.path.join(output_dir, "results.jsonl"), "w") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    with open(os.path.join(output_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def get_mp_context():
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+
+def _run_item(item: dict, workdir: str, result_path: str, target):
+    # a new process group, so that the parent can kill kubectl / opa / ansible started by this scenario together
+    os.setsid()
+    log_fd = os.open(os.path.join(workdir, "agent.log"), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+
+    record = {"workdir": workdir}
+    try:
+        goal = prepare_scenario(item, workdir)
+        record["goal"] = goal
+        output = target(goal)
+        with open(os.path.join(workdir, "agent-result.json"), "w") as f:
+            json.dump(output, f, indent=2)
+        record["status"] = status_succeeded
+        record["result"] = output.get("result") if isinstance(output, dict) else output
+    except Exception as e:
+        traceback.print_exc()
+        record["status"] = status_failed
+        record["error"] = f"{type(e).__name__}: {e}"
+    # multiprocessing ends the child by `os._exit()`, so the exit hooks (e.g. stopping the OPA servers) do not run
+    stop_opa_servers()
+    _write_json(result_path, record)
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+
+def _kill_process_group(process):
+    for sig, wait in [(signal.SIGTERM, terminate_grace_period), (signal.SIGKILL, None)]:
+        try:
+            os.killpg(process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+        process.join(wait)
+        if not process.is_alive():
+            return
+
+
+def get_percentile(values: list, percentile: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(1, math.ceil(percentile / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def summarize_batch(records: list, wall_time: float) -> dict:
+    records = [r for r in records if r]
+    durations = [r["duration"] for r in records]
+    counts = {s: len([r for r in records if r["status"] == s]) for s in [status_succeeded, status_failed, status_timed_out]}
+    return {
+        "total": len(records),
+        **counts,
+        "wall_time_seconds": round(wall_time, 3),
+        "throughput_per_minute": round(len(records) / wall_time * 60, 3) if wall_time > 0 else 0.0,
+        "latency_seconds": {
+            "mean": round(sum(durations) / len(durations), 3) if durations else 0.0,
+            "p50": get_percentile(durations, 50),
+            "p90": get_percentile(durations, 90),
+            "p99": get_percentile(durations, 99),
+            "max": max(durations) if durations else 0.0,
+        },
+    }
+
+
+def _write_text(fpath: str, text: Optional[str]):
+    if text is None:
+        return
+    with open(fpath, "w") as f:
+        f.write(text)
+
+
+def _read_json(fpath: str) -> Optional[dict]:
+    try:
+        with open(fpath, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(fpath: str, data: dict):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(fpath), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f, ensure_ascii=False, default=str)
+    os.replace(tmp_path, fpath)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many CISO agent goals / scenarios concurrently")
+    parser.add_argument("input", help="JSONL / JSON file of goals or scenario_data.json files")
+    parser.add_argument("-o", "--output-dir", default="", help="directory for the per-goal workdirs and the results")
+    parser.add_argument("-j", "--workers", type=int, default=int(os.getenv("CISO_BATCH_WORKERS", "4")))
+    parser.add_argument("--timeout", type=float, default=default_timeout, help="timeout per scenario in seconds (0 means no timeout)")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or os.path.join("/tmp/agent", "batch-" + datetime.datetime.now().strftime("%Y%m%d%H%M%S"))
+    items = load_batch_items(args.input)
+    summary = run_batch(items, output_dir=output_dir, workers=args.workers, timeout=args.timeout, preload=True)
+    print(json.dumps(summary, indent=2))
+    print("Results saved to", output_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextvars
+import functools
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import threading
+import uuid
+from typing import Optional
+
+from ciso_agent.events import emit_artifact
+from ciso_agent.tools.policy_store import get_data_fingerprint
+
+checkpoint_kind_nodes = "nodes"
+checkpoint_kind_tools = "tools"
+
+# ID of the run being executed; a retried run with the same ID replays the recorded node outputs and tool calls
+current_run_id = contextvars.ContextVar("ciso_agent_run_id", default="")
+# one execution of a run; only the entries recorded by an earlier attempt are replayed
+current_attempt = contextvars.ContextVar("ciso_agent_run_attempt", default=None)
+
+# tool arguments longer than this are not treated as file paths
+max_path_length = 4096
+
+
+class RunAttempt(object):
+    """One execution of a run. Counts the calls per key, so that the same tool call made twice in a run is
+    recorded as two entries and each of them is replayed at most once on retry."""
+
+    def __init__(self):
+        self.attempt_id = uuid.uuid4().hex
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def next_seq(self, key: str) -> int:
+        with self._lock:
+            seq = self._counts.get(key, 0)
+            self._counts[key] = seq + 1
+            return seq
+
+
+# used when no run attempt is set (e.g. a tool called outside of `CISOManager`)
+_default_attempt = RunAttempt()
+
+
+def get_attempt() -> RunAttempt:
+    return current_attempt.get() or _default_attempt
+
+
+class RunCheckpoint(object):
+    """Records node outputs and tool results of one run under `<checkpoint_dir>/<run_id>/`.
+
+    An entry also keeps the files which were created or modified in the workdir while the node / tool ran,
+    so that a replay can put them back even if the workdir was lost.
+    """
+
+    def __init__(self, checkpoint_dir: str, run_id: str):
+        self.checkpoint_dir = checkpoint_dir
+        self.run_id = run_id
+        self.run_dir = os.path.join(checkpoint_dir, get_safe_run_id(run_id))
+        self.blob_dir = os.path.join(self.run_dir, "blobs")
+
+    @staticmethod
+    def make_key(kind: str, name: str, key_data) -> str:
+        key_str = json.dumps({"kind": kind, "name": name, "data": key_data}, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
+
+    def get_path(self, kind: str, key: str) -> str:
+        return os.path.join(self.run_dir, kind, f"{key}.json")
+
+    def get(self, kind: str, key: str) -> Optional[dict]:
+        try:
+            with open(self.get_path(kind, key), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, kind: str, key: str, name: str, output, workdir: str = "", files: Optional[list] = None, attempt_id: str = ""):
+        blobs = {}
+        for relpath in files or []:
+            fpath = os.path.join(workdir, relpath)
+            try:
+                with open(fpath, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            blob_hash = hashlib.sha256(data).hexdigest()
+            blob_path = os.path.join(self.blob_dir, blob_hash)
+            if not os.path.exists(blob_path):
+                _write_atomic(blob_path, data)
+            blobs[relpath] = blob_hash
+        entry = {"kind": kind, "name": name, "output": output, "files": blobs, "attempt": attempt_id}
+        _write_atomic(self.get_path(kind, key), json.dumps(entry, ensure_ascii=False, default=str).encode("utf-8"))
+
+    def restore_files(self, entry: dict, workdir: str) -> list:
+        restored = []
+        if not workdir:
+            return restored
+        for relpath, blob_hash in (entry.get("files") or {}).items():
+            if not is_safe_relpath(relpath):
+                continue
+            fpath = os.path.join(workdir, relpath)
+            if hash_file(fpath) == blob_hash:
+                continue
+            with open(os.path.join(self.blob_dir, blob_hash), "rb") as f:
+                data = f.read()
+            _write_atomic(fpath, data)
+            restored.append(relpath)
+        return restored
+
+
+def get_checkpoint(run_id: str = "") -> Optional[RunCheckpoint]:
+    """Return the checkpoint of the current run, or None if `CISO_CHECKPOINT_DIR` or the run ID is not set"""
+    checkpoint_dir = os.getenv("CISO_CHECKPOINT_DIR", "")
+    run_id = run_id or current_run_id.get()
+    if not checkpoint_dir or not run_id:
+        return None
+    return RunCheckpoint(checkpoint_dir=checkpoint_dir, run_id=run_id)
+
+
+def run_with_checkpoint(kind: str, name: str, key_data, workdir: str, func):
+    """Return the recorded output of `func()` for the same key in this run, or run it and record the output.
+
+    Only the entries recorded by an earlier attempt of the run are replayed.
+    Failed calls (exceptions) are not recorded, so they run again on retry.
+    """
+    checkpoint = get_checkpoint()
+    if not checkpoint:
+        return func()
+
+    attempt_id = get_attempt().attempt_id
+    key = checkpoint.make_key(kind, name, key_data)
+    entry = checkpoint.get(kind, key)
+    if entry is not None and entry.get("attempt") != attempt_id:
+        restored = checkpoint.restore_files(entry, workdir)
+        for relpath in restored:
+            emit_artifact(os.path.join(workdir, relpath))
+        print(f"[checkpoint] replayed {kind[:-1]} `{name}` of run `{checkpoint.run_id}` (restored files: {restored})")
+        return entry["output"]
+
+    before = snapshot_files(workdir)
+    output = func()
+    files = get_changed_files(workdir, before)
+    checkpoint.put(kind, key, name, output, workdir=workdir, files=files, attempt_id=attempt_id)
+    return output
+
+
+def checkpointed_tool(input_file_args: tuple = (), data_file_args: tuple = ()):
+    """Decorator for `BaseTool._run`. The tool call is keyed by its workdir, its arguments, the files which
+    the input arguments point to, and the number of the same calls before it in the attempt.
+
+    `input_file_args` are hashed by their contents. `data_file_args` are keyed only by the data fingerprint
+    (`apiVersion/kind` or shape), because live data such as `kubectl` output is collected again in every attempt.
+    Output files are never hashed, so a partial output left by a failed attempt does not change the key.
+
+    Do not use this for tools which read a live cluster or host; their result must not be replayed.
+    """
+
+    def decorator(run):
+        signature = inspect.signature(run)
+
+        @functools.wraps(run)
+        def wrapper(self, *args, **kwargs):
+            if not get_checkpoint():
+                return run(self, *args, **kwargs)
+            workdir = getattr(self, "workdir", "") or ""
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = {k: v for k, v in bound.arguments.items() if k != "self"}
+            file_hashes = {}
+            for name in list(input_file_args) + list(data_file_args):
+                for relpath in get_file_paths(arguments.get(name)):
+                    fpath = os.path.join(workdir, relpath)
+                    file_hash = hash_data_file(fpath) if name in data_file_args else hash_file(fpath)
+                    if file_hash:
+                        file_hashes[relpath] = file_hash
+            key_data = {"workdir": workdir, "args": arguments, "files": file_hashes}
+            key_data["seq"] = get_attempt().next_seq(RunCheckpoint.make_key(checkpoint_kind_tools, type(self).__name__, key_data))
+            return run_with_checkpoint(checkpoint_kind_tools, type(self).__name__, key_data, workdir, lambda: run(self, *args, **kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+def get_file_paths(val) -> list:
+    """File paths in a tool argument: a path, or a list / map (or its JSON string) of paths"""
+    if isinstance(val, str) and val[:1] in ["[", "{"]:
+        try:
+            val = json.loads(val)
+        except ValueError:
+            return []
+    if isinstance(val, dict):
+        val = list(val.values())
+    if not isinstance(val, list):
+        val = [val]
+    paths = []
+    for path in val:
+        if isinstance(path, str):
+            path = path.strip().strip("'\"")
+            if path and len(path) < max_path_length and "\n" not in path:
+                paths.append(path)
+    return paths
+
+
+def hash_data_file(fpath: str) -> str:
+    if not os.path.isfile(fpath):
+        return ""
+    try:
+        with open(fpath, "r") as f:
+            data = f.read()
+    except (OSError, UnicodeDecodeError):
+        return ""
+    return get_data_fingerprint(data)
+
+
+def snapshot_files(workdir: str) -> dict:
+    snapshot = {}
+    if not workdir or not os.path.isdir(workdir):
+        return snapshot
+    for root, _, fnames in os.walk(workdir):
+        for fname in fnames:
+            fpath = os.path.join(root, fname)
+            try:
+                stat = os.stat(fpath)
+            except OSError:
+                continue
+            snapshot[os.path.relpath(fpath, workdir)] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def get_changed_files(workdir: str, before: dict) -> list:
+    after = snapshot_files(workdir)
+    return sorted([relpath for relpath, stat in after.items() if before.get(relpath) != stat])
+
+
+def hash_file(fpath: str) -> str:
+    if not os.path.isfile(fpath):
+        return ""
+    sha = hashlib.sha256()
+    try:
+        with open(fpath, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+    except OSError:
+        return ""
+    return sha.hexdigest()
+
+
+def is_safe_relpath(relpath: str) -> bool:
+    norm = os.path.normpath(relpath)
+    return not os.path.isabs(norm) and norm != ".." and not norm.startswith(".." + os.sep)
+
+
+def get_safe_run_id(run_id: str) -> str:
+    safe = "".join([c if c.isalnum() or c in "-_." else "_" for c in run_id])
+    if safe != run_id:
+        # keep different IDs apart even if they are sanitized into the same string
+        safe = f"{safe[:64]}-{hashlib.sha256(run_id.encode('utf-8')).hexdigest()[:12]}"
+    return safe
+
+
+def _write_atomic(fpath: str, data: bytes):
+    os.makedirs(os.path.dirname(fpath), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(fpath), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, fpath)
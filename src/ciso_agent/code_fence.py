@@ -0,0 +1,96 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# language tags which name the same code type as the key of `code_type_aliases[...]`
+code_type_aliases = {
+    "yml": "yaml",
+    "sh": "shell",
+    "bash": "shell",
+    "console": "shell",
+    "opa": "rego",
+}
+
+
+def normalize_code_type(lang: str) -> str:
+    """Canonical code type of a fence language tag (e.g. `yml` -> `yaml`); attributes after the tag are ignored"""
+    words = lang.strip().lower().split()
+    lang = words[0] if words else ""
+    return code_type_aliases.get(lang, lang)
+
+
+class CodeFenceParser(object):
+    """Incremental parser which detects the first complete fenced code block in streamed text.
+
+    Blocks whose language tag is neither `code_type` (or its alias, e.g. `yml` for `yaml`) nor empty are skipped.
+    `feed()` returns True once a matching block is closed; after that, `code` holds
+    the block contents and `text` holds the received text up to the closing fence.
+    """
+
+    def __init__(self, code_type: str = "", separator: str = "```"):
+        self.code_type = normalize_code_type(code_type)
+        self.separator = separator
+        self.code = None
+        self._buffer = ""
+        self._pos = 0
+        self._open_end = -1
+        self._lang = ""
+        self._end = -1
+
+    @property
+    def done(self) -> bool:
+        return self.code is not None
+
+    @property
+    def text(self) -> str:
+        if self.done:
+            return self._buffer[: self._end]
+        return self._buffer
+
+    def feed(self, chunk: str) -> bool:
+        if self.done:
+            return True
+        if not chunk:
+            return False
+        self._buffer += chunk
+        sep = self.separator
+        while True:
+            if self._open_end < 0:
+                start = self._buffer.find(sep, self._pos)
+                if start < 0:
+                    # keep the tail which may be the beginning of a separator
+                    self._pos = max(0, len(self._buffer) - len(sep) + 1)
+                    return False
+                newline = self._buffer.find("\n", start + len(sep))
+                if newline < 0:
+                    # wait for the rest of the opening line (language tag)
+                    self._pos = start
+                    return False
+                self._lang = normalize_code_type(self._buffer[start + len(sep) : newline])
+                self._open_end = newline + 1
+                self._pos = self._open_end
+
+            close = self._buffer.find(sep, self._pos)
+            if close < 0:
+                self._pos = max(self._open_end, len(self._buffer) - len(sep) + 1)
+                return False
+
+            if not self.code_type or self._lang in ["", self.code_type]:
+                self.code = self._buffer[self._open_end : close]
+                self._end = close + len(sep)
+                return True
+
+            # not the requested language; skip this block
+            self._open_end = -1
+            self._pos = close + len(sep)
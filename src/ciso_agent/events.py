@@ -0,0 +1,280 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Progress events of a manager run.
+
+Every event is a dict with `type`, `time` (epoch seconds) and `run_id`, plus the fields below.
+
+- `run_started` / `run_finished`: `goal`; `duration`, `status` (`ok`, `error` or `cancelled`)
+- `node_started` / `node_finished`: `node`; `duration`, `status`
+- `tool_started` / `tool_finished`: `tool`, `args`; `duration`, `status`, `output_size`
+- `llm_call`: `role`, `model`, `duration`, `prompt_tokens`, `completion_tokens`, `estimated` (the counts are estimated from the text
+  when the API does not report them), `cached`
+- `artifact_written`: `path`, `size`
+
+Events are emitted only while an `EventSink` is active in the current context, so they cost nothing otherwise.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import queue
+import threading
+import time
+from typing import Optional
+
+from ciso_agent.tracing import span_kind_tool, trace_span
+
+event_run_started = "run_started"
+event_run_finished = "run_finished"
+event_node_started = "node_started"
+event_node_finished = "node_finished"
+event_tool_started = "tool_started"
+event_tool_finished = "tool_finished"
+event_llm_call = "llm_call"
+event_artifact_written = "artifact_written"
+
+status_ok = "ok"
+status_error = "error"
+status_cancelled = "cancelled"
+
+# tool arguments are truncated to this length in the events
+max_arg_length = 200
+
+# seconds between the checks of the cancel flag while waiting for an LLM request or a subprocess
+cancel_poll_interval = 0.5
+
+
+class RunCancelledError(Exception):
+    pass
+
+
+class EventSink(object):
+    """Receives the events of one run; writes them as JSON lines to `events_file` and/or puts them into `event_queue`"""
+
+    def __init__(self, run_id: str = "", events_file: str = "", event_queue: Optional[queue.Queue] = None):
+        self.run_id = run_id
+        self.events_file = events_file
+        self.queue = event_queue
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._file = None
+        if events_file:
+            events_dir = os.path.dirname(events_file)
+            if events_dir:
+                os.makedirs(events_dir, exist_ok=True)
+            self._file = open(events_file, "a")
+
+    def emit(self, event_type: str, **data) -> dict:
+        event = {"type": event_type, "time": time.time(), "run_id": self.run_id, **data}
+        if self._file:
+            line = json.dumps(event, ensure_ascii=False, default=str)
+            with self._lock:
+                self._file.write(line + "\n")
+                self._file.flush()
+        if self.queue is not None:
+            self.queue.put(event)
+        return event
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise RunCancelledError(f"run `{self.run_id}` is cancelled")
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+current_event_sink = contextvars.ContextVar("ciso_agent_event_sink", default=None)
+
+
+@contextlib.contextmanager
+def event_sink(run_id: str = "", events_file: str = "", event_queue: Optional[queue.Queue] = None):
+    sink = EventSink(run_id=run_id, events_file=events_file, event_queue=event_queue)
+    token = current_event_sink.set(sink)
+    try:
+        yield sink
+    finally:
+        current_event_sink.reset(token)
+        sink.close()
+
+
+def emit_event(event_type: str, **data) -> Optional[dict]:
+    sink = current_event_sink.get()
+    if sink is None:
+        return None
+    return sink.emit(event_type, **data)
+
+
+def check_cancelled():
+    """Raise `RunCancelledError` if the current run is cancelled; called at node / tool / LLM call boundaries"""
+    sink = current_event_sink.get()
+    if sink is not None:
+        sink.check_cancelled()
+
+
+def emit_artifact(path: str):
+    if current_event_sink.get() is None:
+        return
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = None
+    emit_event(event_artifact_written, path=os.path.abspath(path), size=size)
+
+
+@contextlib.contextmanager
+def event_scope(started_type: str, finished_type: str, **data):
+    """Emit the started / finished events around the block. The block can add fields to the finished event
+    through the yielded dict."""
+    sink = current_event_sink.get()
+    extra = {}
+    if sink is None:
+        yield extra
+        return
+    sink.check_cancelled()
+    sink.emit(started_type, **data)
+    start = time.monotonic()
+    status = status_ok
+    try:
+        yield extra
+    except RunCancelledError:
+        status = status_cancelled
+        raise
+    except BaseException as e:
+        status = status_error
+        extra["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        sink.emit(finished_type, duration=round(time.monotonic() - start, 6), status=status, **data, **extra)
+
+
+def instrumented_tool(run):
+    """Decorator for `BaseTool._run` which emits the tool events and records the tool span"""
+
+    @functools.wraps(run)
+    def wrapper(self, *args, **kwargs):
+        tool_name = type(self).__name__
+        with trace_span(f"tool:{tool_name}", kind=span_kind_tool) as span:
+            if span:
+                span.set_attribute("args_size", sum([len(_to_str(v)) for v in list(args) + list(kwargs.values())]))
+            if current_event_sink.get() is None:
+                output = run(self, *args, **kwargs)
+            else:
+                tool_args = [_truncate(a) for a in args]
+                tool_kwargs = {k: _truncate(v) for k, v in kwargs.items()}
+                with event_scope(event_tool_started, event_tool_finished, tool=tool_name, args=tool_args, kwargs=tool_kwargs) as extra:
+                    output = run(self, *args, **kwargs)
+                    extra["output_size"] = len(_to_str(output))
+            if span:
+                span.set_attribute("output_size", len(_to_str(output)))
+        return output
+
+    return wrapper
+
+
+def _to_str(val) -> str:
+    return val if isinstance(val, str) else json.dumps(val, ensure_ascii=False, default=str)
+
+
+def _truncate(val):
+    val = _to_str(val)
+    return val if len(val) <= max_arg_length else val[:max_arg_length] + "..."
+
+
+_end_of_stream = object()
+
+
+class EventStream(object):
+    """Runs `target()` in a background thread and yields its events.
+
+    Iterate it with `for` or `async for`. `cancel()` (or closing the stream) stops the run
+    at the next node / tool / LLM call boundary. `wait()` returns the output of `target()`.
+    """
+
+    def __init__(self, target, run_id: str = "", events_file: str = ""):
+        self.run_id = run_id
+        self.events_file = events_file
+        self.sink = None
+        self.result = None
+        self.error = None
+        self._target = target
+        self._queue = queue.Queue()
+        self._sink_ready = threading.Event()
+        self._done = threading.Event()
+        self._cancel_requested = False
+        ctx = contextvars.copy_context()
+        self._thread = threading.Thread(target=ctx.run, args=(self._run,), name=f"ciso-agent-run-{run_id}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            with event_sink(run_id=self.run_id, events_file=self.events_file, event_queue=self._queue) as sink:
+                self.sink = sink
+                if self._cancel_requested:
+                    sink.cancel()
+                self._sink_ready.set()
+                self.result = self._target()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._sink_ready.set()
+            self._done.set()
+            self._queue.put(_end_of_stream)
+
+    def cancel(self):
+        self._cancel_requested = True
+        self._sink_ready.wait()
+        if self.sink:
+            self.sink.cancel()
+
+    def close(self):
+        if not self._done.is_set():
+            self.cancel()
+
+    def wait(self, timeout: Optional[float] = None):
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"run `{self.run_id}` did not finish in {timeout} seconds")
+        if self.error:
+            raise self.error
+        return self.result
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> dict:
+        event = self._queue.get()
+        if event is _end_of_stream:
+            # keep the end marker for other consumers / later calls
+            self._queue.put(_end_of_stream)
+            raise StopIteration
+        return event
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        event = await asyncio.to_thread(self._queue.get)
+        if event is _end_of_stream:
+            self._queue.put(_end_of_stream)
+            raise StopAsyncIteration
+        return event
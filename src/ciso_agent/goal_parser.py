@@ -0,0 +1,98 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+
+# ITBench goals (see `agent-harness.yaml`) give the paths like the following:
+#   The cluster's kubeconfig is at `/tmp/agent/20250101000000/kubeconfig.yaml`.
+#   The path to the inventory file is `/tmp/agent/20250101000000/ansible.ini`.
+#   You can use `/tmp/agent/20250101000000` as your workdir.
+quoted_path_pattern = re.compile(r"""[`'"]((?:/|~/|\./)[^`'"\s]*)[`'"]""")
+bare_path_pattern = re.compile(r"""(?<![\w`'"/.~])((?:/|~/)[\w.\-/~]+)""")
+
+# crews selected by the keywords of the goal (all of them must appear, at the start of a word), in the order of priority
+kubernetes_crew_keywords = [
+    ("kubernetes_kyverno", [r"\bkyverno"]),
+    ("kubernetes_kubectl_opa", [r"\bkubectl", r"\bopa\b"]),
+]
+rhel_crew_keywords = [
+    ("rhel_playbook_opa", [r"\brhel", r"\bplaybook"]),
+]
+
+workdir_keywords = ["workdir", "working directory", "work directory", "workspace"]
+kubeconfig_keywords = ["kubeconfig"]
+inventory_keywords = ["inventory", "ansible.ini", "ansible_ini"]
+
+
+def extract_paths_from_goal(goal: str) -> dict:
+    """Extract `kubeconfig`, `ansible_inventory` and `workdir` paths from the goal text.
+
+    Only absolute paths (or paths starting with `~/` or `./`) are considered, because the goal also
+    mentions relative filenames such as `kubeconfig.yaml` that are not the inputs.
+    A field is set to an empty string if it is not found.
+    """
+    data = {
+        "kubeconfig": "",
+        "ansible_inventory": "",
+        "workdir": "",
+    }
+    for line in goal.splitlines():
+        paths = quoted_path_pattern.findall(line) or bare_path_pattern.findall(line)
+        if not paths:
+            continue
+        line_lower = line.lower()
+        for path in paths:
+            path = path.rstrip(".,;:)")
+            if not path or path == "/":
+                continue
+            field = classify_path(path=path, line=line_lower)
+            if field and not data[field]:
+                data[field] = os.path.expanduser(path)
+    return data
+
+
+def classify_path(path: str, line: str) -> str:
+    basename = os.path.basename(path.rstrip("/")).lower()
+    # the filename is a stronger hint than the sentence
+    if "kubeconfig" in basename:
+        return "kubeconfig"
+    if basename.endswith(".ini") or "inventory" in basename:
+        return "ansible_inventory"
+    if any(k in line for k in workdir_keywords):
+        return "workdir"
+    if any(k in line for k in kubeconfig_keywords):
+        return "kubeconfig"
+    if any(k in line for k in inventory_keywords):
+        return "ansible_inventory"
+    return ""
+
+
+def select_agent_nodes(goal: str, kubeconfig: str = "", ansible_inventory: str = "") -> list:
+    """Return the crew nodes for the goal.
+
+    The first matching crew is selected, as before the parallel branches. Only a goal which names two independent
+    targets (both a kubeconfig and an Ansible inventory) selects a crew per target, to run them in parallel.
+    """
+    kubernetes_nodes = match_crews(goal, kubernetes_crew_keywords)
+    rhel_nodes = match_crews(goal, rhel_crew_keywords)
+    if kubeconfig and ansible_inventory and kubernetes_nodes and rhel_nodes:
+        return [kubernetes_nodes[0], rhel_nodes[0]]
+    nodes = kubernetes_nodes + rhel_nodes
+    return nodes[:1]
+
+
+def match_crews(goal: str, crew_keywords: list) -> list:
+    goal_lower = goal.lower()
+    return [node for node, patterns in crew_keywords if all([re.search(p, goal_lower) for p in patterns])]
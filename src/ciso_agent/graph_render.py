@@ -0,0 +1,111 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+import tempfile
+import threading
+
+# `api`: PNG by the mermaid.ink web service (the langgraph default; needs network access)
+# `graphviz`: PNG by pygraphviz, offline
+# `mermaid`: Mermaid text only (`graph.mmd`), offline; the default, so that a report never waits for the network
+graph_render_mode_api = "api"
+graph_render_mode_graphviz = "graphviz"
+graph_render_mode_mermaid = "mermaid"
+graph_render_modes = [graph_render_mode_api, graph_render_mode_graphviz, graph_render_mode_mermaid]
+
+_render_lock = threading.Lock()
+# modes whose PNG rendering failed in this process; they are not tried again (e.g. mermaid.ink on an offline cluster)
+_failed_modes = set()
+
+
+def get_graph_render_mode() -> str:
+    mode = os.getenv("GRAPH_RENDER_MODE", graph_render_mode_mermaid).lower()
+    if mode not in graph_render_modes:
+        raise ValueError(f"Env variable `GRAPH_RENDER_MODE` must be one of {graph_render_modes}, but got `{mode}`")
+    return mode
+
+
+def get_graph_cache_dir() -> str:
+    return os.getenv("GRAPH_CACHE_DIR", "") or os.path.join(tempfile.gettempdir(), "ciso-agent-graph")
+
+
+def get_graph_filename(mode: str) -> str:
+    """The file name expected for the mode; `render_graph()` may still fall back to the Mermaid text"""
+    return "graph.mmd" if mode == graph_render_mode_mermaid or mode in _failed_modes else "graph.png"
+
+
+def get_graph_hash(mermaid: str) -> str:
+    """Hash of the graph structure; the Mermaid text lists all nodes and edges"""
+    return hashlib.sha256(mermaid.encode("utf-8")).hexdigest()
+
+
+def render_graph(graph, mode: str = "", cache_dir: str = "") -> str:
+    """Render the graph (`langgraph` drawable graph) once per structure and return the path to the cached file.
+
+    If the PNG rendering fails, the Mermaid text file is returned instead, and the mode is not tried again in this process.
+    """
+    mode = mode or get_graph_render_mode()
+    cache_dir = cache_dir or get_graph_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+
+    mermaid = graph.draw_mermaid()
+    graph_hash = get_graph_hash(mermaid)
+    mmd_path = os.path.join(cache_dir, f"{graph_hash}.mmd")
+    png_path = os.path.join(cache_dir, f"{graph_hash}.{mode}.png")
+
+    with _render_lock:
+        if not os.path.exists(mmd_path):
+            _write_atomic(mmd_path, mermaid.encode("utf-8"))
+        if mode == graph_render_mode_mermaid:
+            return mmd_path
+        if os.path.exists(png_path):
+            return png_path
+        if mode in _failed_modes:
+            return mmd_path
+        try:
+            if mode == graph_render_mode_graphviz:
+                png = graph.draw_png()
+            else:
+                png = graph.draw_mermaid_png()
+        except Exception as e:
+            print(f"failed to render the graph as PNG with `{mode}`; using the Mermaid text instead in this process: {e}")
+            _failed_modes.add(mode)
+            return mmd_path
+        _write_atomic(png_path, png)
+        return png_path
+
+
+def reset_graph_render_failures():
+    with _render_lock:
+        _failed_modes.clear()
+
+
+def install_graph_file(cached_path: str, dest_path: str):
+    """Copy the cached file to `dest_path` so later changes to the workdir file never reach the cache"""
+    if os.path.abspath(cached_path) == os.path.abspath(dest_path):
+        return
+    dest_dir = os.path.dirname(dest_path)
+    if dest_dir:
+        os.makedirs(dest_dir, exist_ok=True)
+    with open(cached_path, "rb") as f:
+        data = f.read()
+    _write_atomic(dest_path, data)
+
+
+def _write_atomic(fpath: str, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(fpath), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, fpath)
@@ -12,36 +12,129 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import atexit
+import concurrent.futures
+import contextvars
 import os
 import json
+import threading
+import time
+import weakref
+from typing import Optional
 
-from crewai import LLM
-from langchain.schema import HumanMessage, SystemMessage
-from langchain_ibm import ChatWatsonx
-from langchain_openai import ChatOpenAI, AzureChatOpenAI
+from ciso_agent.code_fence import CodeFenceParser
+from ciso_agent.events import RunCancelledError, cancel_poll_interval, check_cancelled, current_event_sink, emit_event, event_llm_call
+from ciso_agent.llm_cache import LLMCacheMissError, LLMResponseCache, get_llm_cache
+from ciso_agent.rate_limit import acall_with_retry, estimate_tokens, get_rate_limiter, get_retry_params
+from ciso_agent.tracing import span_kind_llm, trace_span
+
+# crewai, langchain_openai and langchain_ibm take seconds to import, so they are imported
+# in the functions which use them; only the provider actually selected by the endpoint is loaded.
 
 api_domain_watsonx = "cloud.ibm.com"
 api_domain_azure = "azure.com"
 api_domain_azure_api = "azure-api.net"
 
+# process-wide registry of chat clients used by `call_llm`.
+# a client keeps its HTTP connection pool (and the IAM token for watsonx) alive,
+# so reusing it avoids a new TLS handshake / token exchange on every call.
+_llm_clients = {}
+_llm_clients_lock = threading.Lock()
+
+# all LLM requests run on one background event loop; sync callers submit coroutines to it.
+# the number of in-flight requests per endpoint is bounded by `LLM_MAX_CONCURRENCY`.
+_llm_loop = None
+_llm_loop_lock = threading.Lock()
+_llm_semaphores = weakref.WeakKeyDictionary()
+default_llm_max_concurrency = 8
+
+# roles of LLM calls; each role can use its own model via `LLM_<ROLE>_MODEL_NAME` etc.
+llm_role_selector = "selector"
+llm_role_agent = "agent"
+llm_role_generator = "generator"
+llm_role_reporter = "reporter"
+llm_roles = [llm_role_selector, llm_role_agent, llm_role_generator, llm_role_reporter]
+
+_llm_latency = {}
+_llm_latency_lock = threading.Lock()
+
 # Retreives and Returns Model, API URL and API key in that order from .env
-def get_llm_params(model: str = "", api_url: str = "", api_key: str = ""):
+# If `role` is given, `LLM_<ROLE>_MODEL_NAME`, `LLM_<ROLE>_BASE_URL` and `LLM_<ROLE>_API_KEY` are used when set
+def get_llm_params(model: str = "", api_url: str = "", api_key: str = "", role: str = ""):
+    if role and role not in llm_roles:
+        raise ValueError(f"unknown LLM role `{role}`; must be one of {llm_roles}")
+    prefix = f"LLM_{role.upper()}_" if role else ""
+
     # get model
-    model = model or os.getenv("LLM_MODEL_NAME") or os.getenv("OPENAI_MODEL_NAME")
+    model = model or (prefix and os.getenv(prefix + "MODEL_NAME")) or os.getenv("LLM_MODEL_NAME") or os.getenv("OPENAI_MODEL_NAME")
     if not model:
         raise ValueError("Env variable `OPENAI_MODEL_NAME` is not set")
 
     # get API URL
-    api_url = api_url or os.getenv("LLM_BASE_URL") or os.getenv("MODEL_API_URL")
+    api_url = api_url or (prefix and os.getenv(prefix + "BASE_URL")) or os.getenv("LLM_BASE_URL") or os.getenv("MODEL_API_URL")
 
     # get API key (if API is ollama, API key is not necessary)
-    api_key = api_key or os.getenv("LLM_API_KEY") or os.getenv("OPENAI_API_KEY")
+    api_key = api_key or (prefix and os.getenv(prefix + "API_KEY")) or os.getenv("LLM_API_KEY") or os.getenv("OPENAI_API_KEY")
 
     return model, api_url, api_key
 
-def init_agent_llm(model: str = "", api_url: str = "", api_key: str = ""):
+
+def record_llm_latency(role: str, seconds: float):
+    role = role or "default"
+    with _llm_latency_lock:
+        stats = _llm_latency.setdefault(role, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        stats["calls"] += 1
+        stats["total_seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+
+def get_llm_latency_stats() -> dict:
+    with _llm_latency_lock:
+        stats = {}
+        for role, s in _llm_latency.items():
+            stats[role] = {
+                "calls": s["calls"],
+                "total_seconds": round(s["total_seconds"], 3),
+                "avg_seconds": round(s["total_seconds"] / s["calls"], 3),
+                "max_seconds": round(s["max_seconds"], 3),
+            }
+        return stats
+
+
+def emit_llm_call_event(role: str, model: str, duration: float, prompts: list, answer, cached: bool = False, usage: Optional[dict] = None):
+    # the token counts reported by the API are used when available; otherwise they are estimated from the text
+    estimated = not usage
+    emit_event(
+        event_llm_call,
+        role=role or "",
+        model=model,
+        duration=round(duration, 6),
+        prompt_tokens=estimate_tokens(prompts) if estimated else usage["input_tokens"],
+        completion_tokens=estimate_tokens([answer]) if estimated else usage["output_tokens"],
+        estimated=estimated,
+        cached=cached,
+    )
+
+
+def get_usage(response) -> dict:
+    """Token counts in the `usage_metadata` of a LangChain message, or an empty dict if the API did not report them"""
+    usage = getattr(response, "usage_metadata", None)
+    if not isinstance(usage, dict) or not isinstance(usage.get("input_tokens"), int) or not isinstance(usage.get("output_tokens"), int):
+        return {}
+    return {"input_tokens": usage["input_tokens"], "output_tokens": usage["output_tokens"]}
+
+
+def reset_llm_latency_stats():
+    with _llm_latency_lock:
+        _llm_latency.clear()
+
+
+def init_agent_llm(model: str = "", api_url: str = "", api_key: str = "", role: str = llm_role_agent):
     # pass arguments
-    model, api_url, api_key = get_llm_params(model=model, api_url=api_url, api_key=api_key)
+    from ciso_agent.agent_llm import AgentLLM
+
+    model, api_url, api_key = get_llm_params(model=model, api_url=api_url, api_key=api_key, role=role)
 
     temperature = float(os.getenv("LLM_TEMPERATURE", "0.0"))
 
@@ -50,10 +143,11 @@ def init_agent_llm(model: str = "", api_url: str = "", api_key: str = ""):
         proj_id = get_watsonx_project_id()
         set_watsonx_env_vars(model, api_url, api_key, proj_id)
         params = get_watsonx_model_params(model=model)
-        llm = LLM(
+        llm = AgentLLM(
             model="watsonx/" + model,
             base_url=api_url,
             api_key=api_key,
+            timeout=get_llm_request_timeout(),
             **params,
         )
     elif is_azure_api(api_url=api_url):
@@ -61,19 +155,22 @@ def init_agent_llm(model: str = "", api_url: str = "", api_key: str = ""):
         kwargs = {}
         if "api-version" in params:
             kwargs["api_version"] = params["api-version"]
-        llm = LLM(
+        llm = AgentLLM(
             model="azure/" + model,
             base_url=api_url,
             api_key=api_key,
+            timeout=get_llm_request_timeout(),
             **kwargs,
         )
     else:
-        llm = LLM(
+        llm = AgentLLM(
             model=model,
             base_url=api_url,
             api_key=api_key,
+            timeout=get_llm_request_timeout(),
             temperature=temperature,
         )
+    llm.role = role
     return llm
 
 
@@ -92,14 +189,191 @@ def init_llm(model: str = "", api_url: str = "", api_key: str = ""):
         kwargs = {}
         if "api-version" in params:
             kwargs["api_version"] = params["api-version"]
-        return AzureChatOpenAI(temperature=temperature, model=model, api_key=api_key, base_url=api_url, **kwargs)
+        from langchain_openai import AzureChatOpenAI
+
+        return AzureChatOpenAI(
+            temperature=temperature,
+            model=model,
+            api_key=api_key,
+            base_url=api_url,
+            max_retries=get_client_max_retries(),
+            timeout=get_llm_request_timeout(),
+            **kwargs,
+        )
     elif "gpt" in model.lower():
-        return ChatOpenAI(temperature=temperature, model=model, api_key=api_key, base_url=api_url)
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(
+            temperature=temperature,
+            model=model,
+            api_key=api_key,
+            base_url=api_url,
+            max_retries=get_client_max_retries(),
+            timeout=get_llm_request_timeout(),
+        )
 
     return None
 
 
+def get_llm_client(model: str = "", api_url: str = "", api_key: str = ""):
+    model, api_url, api_key = get_llm_params(model=model, api_url=api_url, api_key=api_key)
+    key = get_llm_client_key(model=model, api_url=api_url, api_key=api_key)
+    with _llm_clients_lock:
+        client = _llm_clients.get(key)
+        if client is None:
+            client = init_llm(model=model, api_url=api_url, api_key=api_key)
+            if not client:
+                # other OpenAI-compatible endpoints (e.g. Ollama, the mock server in `ciso_agent.mock_llm_server`)
+                from langchain_openai import ChatOpenAI
+
+                client = ChatOpenAI(
+                    temperature=0,
+                    model=model,
+                    api_key=api_key,
+                    base_url=api_url,
+                    max_retries=get_client_max_retries(),
+                    timeout=get_llm_request_timeout(),
+                )
+            _llm_clients[key] = client
+    return client
+
+
+def get_client_max_retries() -> int:
+    """The clients do not retry by themselves while `acall_with_retry` retries (`LLM_MAX_RETRIES` > 0);
+    otherwise the retries would multiply"""
+    max_retries, _, _ = get_retry_params()
+    return 0 if max_retries > 0 else 2
+
+
+def get_llm_request_timeout() -> Optional[float]:
+    """Deadline of one LLM request in seconds (`LLM_REQUEST_TIMEOUT`; 0: none), so that a hung request cannot block a run forever"""
+    timeout = float(os.getenv("LLM_REQUEST_TIMEOUT", "300"))
+    return timeout if timeout > 0 else None
+
+
+def get_llm_client_key(model: str, api_url: str, api_key: str):
+    provider = "openai"
+    proj_id = ""
+    if is_watsonx_api(api_url=api_url):
+        provider = "watsonx"
+        proj_id = os.getenv("WATSONX_PROJECT_ID", "")
+    elif is_azure_api(api_url=api_url):
+        provider = "azure"
+    params = {
+        "temperature": os.getenv("LLM_TEMPERATURE", "0.0"),
+        "llm_params": get_params_from_env(),
+        "project_id": proj_id,
+        "max_retries": get_client_max_retries(),
+        "timeout": get_llm_request_timeout(),
+    }
+    return (provider, model, api_url or "", api_key or "", json.dumps(params, sort_keys=True))
+
+
+def close_llm_clients():
+    """Close the pooled connections of all cached clients and drop them from the registry."""
+    with _llm_clients_lock:
+        clients = list(_llm_clients.values())
+        _llm_clients.clear()
+    for client in clients:
+        close_llm_client(client)
+
+
+def reset_llm_clients():
+    """Drop all cached clients without closing them (e.g. in a forked child process)."""
+    with _llm_clients_lock:
+        _llm_clients.clear()
+
+
+def close_llm_client(client):
+    # ChatOpenAI / AzureChatOpenAI hold an `openai.OpenAI` client as `root_client`
+    # ChatWatsonx holds a `ModelInference` as `watsonx_model`
+    for attr, method in [("root_client", "close"), ("watsonx_model", "close_persistent_connection")]:
+        target = getattr(client, attr, None)
+        close_func = getattr(target, method, None)
+        if not callable(close_func):
+            continue
+        try:
+            close_func()
+        except Exception:
+            pass
+    return
+
+
+def get_llm_event_loop():
+    global _llm_loop
+    with _llm_loop_lock:
+        if _llm_loop is None or _llm_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="ciso-agent-llm-loop", daemon=True)
+            thread.start()
+            _llm_loop = loop
+    return _llm_loop
+
+
+def reset_llm_event_loop():
+    global _llm_loop
+    # the loop thread does not exist in a forked child, so just forget the loop
+    _llm_loop = None
+    _llm_semaphores.clear()
+
+
+def run_llm_coroutine(coro):
+    loop = get_llm_event_loop()
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+    if running_loop is loop:
+        coro.close()
+        raise RuntimeError("sync LLM call is not allowed inside the LLM event loop; use `acall_llm` instead")
+    # run the coroutine with the caller's context (run ID, event sink, ...) although it runs on the loop thread
+    future = asyncio.run_coroutine_threadsafe(_run_in_context(coro, contextvars.copy_context()), loop)
+    sink = current_event_sink.get()
+    if sink is None:
+        return future.result()
+    # wait in steps, so that cancelling the run (e.g. the job timeout of the service) also cancels a hung request
+    while True:
+        done, _ = concurrent.futures.wait([future], timeout=cancel_poll_interval)
+        if done:
+            return future.result()
+        if sink.cancelled.is_set():
+            future.cancel()
+            raise RunCancelledError(f"run `{sink.run_id}` is cancelled")
+
+
+async def _run_in_context(coro, ctx: contextvars.Context):
+    # the task has its own copy of the context, so this does not leak into other tasks
+    for var, value in ctx.items():
+        var.set(value)
+    return await coro
+
+
+def get_llm_semaphore(api_url: str = ""):
+    loop = asyncio.get_running_loop()
+    semaphores = _llm_semaphores.setdefault(loop, {})
+    endpoint = api_url or "default"
+    if endpoint not in semaphores:
+        semaphores[endpoint] = asyncio.Semaphore(get_llm_max_concurrency())
+    return semaphores[endpoint]
+
+
+def get_llm_max_concurrency():
+    max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", str(default_llm_max_concurrency)))
+    if max_concurrency <= 0:
+        raise ValueError(f"Env variable `LLM_MAX_CONCURRENCY` must be a positive integer, but got `{max_concurrency}`")
+    return max_concurrency
+
+
+atexit.register(close_llm_clients)
+if hasattr(os, "register_at_fork"):
+    # connections must not be shared with a child process
+    os.register_at_fork(after_in_child=reset_llm_clients)
+    os.register_at_fork(after_in_child=reset_llm_event_loop)
+
+
 def init_watsonx_llm(model: str = "", api_url: str = "", api_key: str = "", proj_id: str = ""):
+    from langchain_ibm import ChatWatsonx
+
     set_watsonx_env_vars(model, api_url, api_key, proj_id)
     params = get_watsonx_model_params(model=model)
     llm = ChatWatsonx(
@@ -178,10 +452,225 @@ def set_watsonx_env_vars(model: str = "", api_url: str = "", api_key: str = "",
     return
 
 
-def call_llm(prompt: str, model: str = "", api_key: str = "", api_url: str = "") -> str:
-    _llm = init_llm(model=model, api_key=api_key, api_url=api_url)
-    if not _llm:
-        _llm = ChatOpenAI(temperature=0, model=model)
+def call_llm(
+    prompt: str,
+    model: str = "",
+    api_key: str = "",
+    api_url: str = "",
+    stop_at_code_block: str = "",
+    role: str = "",
+    response_schema: Optional[dict] = None,
+) -> str:
+    # sync wrapper of `acall_llm` for the existing callers
+    return run_llm_coroutine(
+        acall_llm(
+            prompt=prompt,
+            model=model,
+            api_key=api_key,
+            api_url=api_url,
+            stop_at_code_block=stop_at_code_block,
+            role=role,
+            response_schema=response_schema,
+        )
+    )
+
+
+def call_llm_json(prompt: str, schema: dict, model: str = "", api_key: str = "", api_url: str = "", role: str = "") -> dict:
+    # sync wrapper of `acall_llm_json`
+    return run_llm_coroutine(acall_llm_json(prompt=prompt, schema=schema, model=model, api_key=api_key, api_url=api_url, role=role))
+
+
+def generate_code(prompt: str, code_type: str, model: str = "", api_key: str = "", api_url: str = "", role: str = "") -> str:
+    # sync wrapper of `agenerate_code`
+    return run_llm_coroutine(agenerate_code(prompt=prompt, code_type=code_type, model=model, api_key=api_key, api_url=api_url, role=role))
+
+
+async def acall_llm(
+    prompt: str,
+    model: str = "",
+    api_key: str = "",
+    api_url: str = "",
+    stop_at_code_block: str = "",
+    role: str = "",
+    response_schema: Optional[dict] = None,
+) -> str:
+    """Call the LLM and return the answer text.
+
+    If `role` is given, the model / API URL / API key of the role are used unless they are passed explicitly,
+    and the latency is recorded per role (see `get_llm_latency_stats()`).
+
+    If `stop_at_code_block` is set to a code type (e.g. `rego`), the answer is streamed and
+    the request is cancelled once the first complete code block of that type is received.
+    The returned text then ends with the closing fence of the block.
+
+    If `response_schema` (a JSON schema) is given, the answer is requested as a JSON string in that schema
+    via the provider's structured output (`response_format`). Check `supports_structured_output()` first.
+    """
+    check_cancelled()
+    if not is_streaming_enabled() or response_schema:
+        stop_at_code_block = ""
+    model, api_url, api_key = get_llm_params(model=model, api_url=api_url, api_key=api_key, role=role)
+
+    messages = build_llm_messages(prompt=prompt, model=model)
+
+    cache = get_llm_cache()
+    cache_key = ""
+    if cache:
+        cache_key = LLMResponseCache.make_key(
+            model=model,
+            messages=[{"role": m.type, "content": m.content} for m in messages],
+            params=dict(
+                get_decoding_params(model=model, api_url=api_url),
+                stop_at_code_block=stop_at_code_block,
+                response_schema=response_schema,
+            ),
+        )
+        # a miss raises `LLMCacheMissError` in replay mode, before any client is created
+        answer = await asyncio.to_thread(cache.get, cache_key)
+        if answer is not None:
+            emit_llm_call_event(role=role, model=model, duration=0.0, prompts=[m.content for m in messages], answer=answer, cached=True)
+            return answer
+
+    # client creation may block (e.g. watsonx token exchange), so do it outside the event loop
+    _llm = await asyncio.to_thread(get_llm_client, model=model, api_key=api_key, api_url=api_url)
+
+    # a stream stopped early has no usage report, so only full responses update this
+    usage = {}
+
+    async def _request():
+        async with get_llm_semaphore(api_url=api_url):
+            if stop_at_code_block:
+                return await astream_until_code_block(_llm, messages, code_type=stop_at_code_block)
+            llm = _llm
+            if response_schema:
+                llm = _llm.bind(response_format=get_response_format(response_schema))
+            response = await llm.ainvoke(messages)
+            usage.update(get_usage(response))
+            return response.content
+
+    start = time.monotonic()
+    prompts = [m.content for m in messages]
+    with trace_span(f"llm:{role or 'default'}", kind=span_kind_llm, model=model, prompt_chars=sum([len(p) for p in prompts])) as span:
+        answer = await acall_with_retry(
+            _request,
+            limiter=get_rate_limiter(api_url=api_url, model=model),
+            tokens=estimate_tokens(prompts),
+        )
+        if span:
+            span.set_attribute("answer_chars", len(answer) if isinstance(answer, str) else None)
+    duration = time.monotonic() - start
+    record_llm_latency(role, duration)
+    emit_llm_call_event(role=role, model=model, duration=duration, prompts=prompts, answer=answer, usage=usage)
+    if cache:
+        # the file write (and the occasional eviction scan) must not block the shared event loop
+        await asyncio.to_thread(cache.put, cache_key, answer, meta={"model": model})
+    # print("[DEBUG] answer:", answer)
+    return answer
+
+
+async def acall_llm_json(prompt: str, schema: dict, model: str = "", api_key: str = "", api_url: str = "", role: str = "") -> dict:
+    """Call the LLM and return the answer as a dict.
+
+    Structured output is used if the provider supports it; otherwise (or if it fails),
+    the answer is parsed from a ```json code block in the free-text answer.
+    """
+    model, api_url, api_key = get_llm_params(model=model, api_url=api_url, api_key=api_key, role=role)
+    if supports_structured_output(model=model, api_url=api_url):
+        try:
+            answer = await acall_llm(prompt=prompt, model=model, api_key=api_key, api_url=api_url, role=role, response_schema=schema)
+            return json.loads(answer)
+        except (RunCancelledError, LLMCacheMissError):
+            raise
+        except Exception as e:
+            print(f"structured output failed, falling back to parsing the free-text answer: {e}")
+    answer = await acall_llm(prompt=prompt, model=model, api_key=api_key, api_url=api_url, role=role)
+    return parse_json_answer(answer)
+
+
+async def agenerate_code(prompt: str, code_type: str, model: str = "", api_key: str = "", api_url: str = "", role: str = "") -> str:
+    """Generate code and return only the code (without the code fence)"""
+    model, api_url, api_key = get_llm_params(model=model, api_url=api_url, api_key=api_key, role=role)
+    if supports_structured_output(model=model, api_url=api_url):
+        schema = get_code_schema(code_type=code_type)
+        try:
+            answer = await acall_llm(prompt=prompt, model=model, api_key=api_key, api_url=api_url, role=role, response_schema=schema)
+            code = json.loads(answer).get("code", "")
+            if code.strip():
+                return code
+        except (RunCancelledError, LLMCacheMissError):
+            raise
+        except Exception as e:
+            print(f"structured output failed, falling back to parsing the free-text answer: {e}")
+    answer = await acall_llm(prompt=prompt, model=model, api_key=api_key, api_url=api_url, stop_at_code_block=code_type, role=role)
+    return extract_code_block(answer, code_type=code_type)
+
+
+def supports_structured_output(model: str, api_url: str = "") -> bool:
+    """`LLM_STRUCTURED_OUTPUT` env variable: `auto` (default), `true` or `false`.
+    With `auto`, structured output is used for OpenAI / Azure OpenAI GPT-4o or later models."""
+    mode = os.getenv("LLM_STRUCTURED_OUTPUT", "auto").lower()
+    if mode in ["false", "0", "no"]:
+        return False
+    if mode in ["true", "1", "yes"]:
+        return True
+    if is_watsonx_api(api_url=api_url):
+        return False
+    model_name = model.lower().split("/")[-1]
+    return model_name.startswith(("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4"))
+
+
+def get_response_format(schema: dict, name: str = "output") -> dict:
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "schema": schema,
+            "strict": True,
+        },
+    }
+
+
+def get_code_schema(code_type: str) -> dict:
+    return {
+        "type": "object",
+        "properties": {
+            "code": {"type": "string", "description": f"the generated {code_type} code without any code fence"},
+        },
+        "required": ["code"],
+        "additionalProperties": False,
+    }
+
+
+def parse_json_answer(answer: str) -> dict:
+    answer = answer.strip()
+    if "```" in answer:
+        answer = extract_code_block(answer, code_type="json")
+    try:
+        return json.loads(answer)
+    except Exception:
+        raise ValueError(f"Failed to parse this as JSON: {answer}")
+
+
+async def astream_until_code_block(llm, messages: list, code_type: str) -> str:
+    parser = CodeFenceParser(code_type=code_type)
+    stream = llm.astream(messages)
+    try:
+        async for chunk in stream:
+            content = chunk.content
+            if isinstance(content, str) and parser.feed(content):
+                break
+    finally:
+        # closing the stream cancels the rest of the generation
+        await stream.aclose()
+    return parser.text
+
+
+def is_streaming_enabled():
+    return os.getenv("LLM_STREAM_EARLY_STOP", "true").lower() not in ["false", "0", "no"]
+
+
+def build_llm_messages(prompt: str, model: str = "") -> list:
+    from langchain.schema import HumanMessage, SystemMessage
 
     model_lower = model.lower()
     system_prompt = ""
@@ -224,11 +713,27 @@ You are helpful and harmless and you follow ethical guidelines and promote posit
         messages.append(SystemMessage(content=system_prompt))
 
     messages.append(HumanMessage(content=prompt))
+    return messages
 
-    response = _llm.invoke(messages)
-    answer = response.content
-    # print("[DEBUG] answer:", answer)
-    return answer
+
+def get_decoding_params(model: str, api_url: str = ""):
+    params = {
+        "api_url": api_url or "",
+        "temperature": float(os.getenv("LLM_TEMPERATURE", "0.0")),
+        "llm_params": get_params_from_env(),
+    }
+    if is_watsonx_api(api_url=api_url):
+        params["watsonx_params"] = get_watsonx_model_params(model=model)
+    return params
+
+
+def extract_code_block(txt: str, code_type: str) -> str:
+    """Return the first code block of `code_type` (or without a language tag); blocks of other languages are skipped
+    in the same way as the streaming early stop does"""
+    parser = CodeFenceParser(code_type=code_type)
+    if parser.feed(txt):
+        return parser.code
+    return extract_code(txt, code_type=code_type)
 
 
 def extract_code(txt: str, separator: str = "```", code_type: str = "yaml"):
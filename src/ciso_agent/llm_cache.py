@@ -0,0 +1,218 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Optional
+
+cache_mode_off = "off"
+cache_mode_readwrite = "readwrite"
+cache_mode_replay = "replay"
+
+
+# a full scan of the cache directory runs when the running total exceeds `max_bytes`, or at most once per this interval (seconds);
+# the scan evicts down to `evict_low_water` of `max_bytes`, so that the following puts do not scan again
+evict_interval = 60.0
+evict_low_water = 0.9
+
+
+class LLMCacheMissError(ValueError):
+    pass
+
+
+class LLMResponseCache(object):
+    """Content-addressed cache of LLM answers stored as one JSON file per key.
+
+    Entries older than `max_age` seconds are dropped. When the total size exceeds
+    `max_bytes`, the least recently used entries (by access time) are evicted.
+    The total size is kept as a running sum between the scans of the directory, so a put does not walk the cache.
+    In `replay_only` mode, nothing is written and a miss raises `LLMCacheMissError`.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 0, max_age: float = 0, replay_only: bool = False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.replay_only = replay_only
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # None until the first scan; entries written by other processes are counted by the periodic scan
+        self._total_size = None
+        self._last_evict = 0.0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(model: str, messages: list, params: Optional[dict] = None) -> str:
+        payload = {
+            "model": model,
+            "messages": messages,
+            "params": params or {},
+        }
+        payload_str = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload_str.encode("utf-8")).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        fpath = self.get_path(key)
+        entry = None
+        try:
+            stat = os.stat(fpath)
+            if self.max_age and not self.replay_only and time.time() - stat.st_mtime > self.max_age:
+                self._remove(fpath)
+            else:
+                with open(fpath, "r") as f:
+                    entry = json.load(f)
+                # access time is the LRU clock; mtime keeps the creation time for the age check
+                os.utime(fpath, (time.time(), stat.st_mtime))
+        except (OSError, ValueError):
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if entry is None:
+            if self.replay_only:
+                raise LLMCacheMissError(f"LLM cache is in replay mode but no cached answer is found for the key `{key}`")
+            return None
+        return entry.get("answer")
+
+    def put(self, key: str, answer: str, meta: Optional[dict] = None):
+        if self.replay_only:
+            return
+        fpath = self.get_path(key)
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        entry = {
+            "key": key,
+            "answer": answer,
+            "created": time.time(),
+        }
+        if meta:
+            entry["meta"] = meta
+        data = json.dumps(entry, ensure_ascii=False, default=str).encode("utf-8")
+        try:
+            old_size = os.path.getsize(fpath)
+        except OSError:
+            old_size = 0
+        # write to a temp file first so that concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(fpath), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, fpath)
+        self._evict_if_needed(len(data) - old_size)
+
+    def _evict_if_needed(self, added_size: int):
+        if not self.max_bytes and not self.max_age:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._total_size is not None:
+                self._total_size += added_size
+            over = self._total_size is None or (self.max_bytes and self._total_size > self.max_bytes)
+            if not over and now - self._last_evict < evict_interval:
+                return
+            self._last_evict = now
+        self.evict(target_bytes=int(self.max_bytes * evict_low_water))
+
+    def evict(self, target_bytes: int = 0):
+        """Scan the directory, drop expired entries and evict the least recently used ones down to `target_bytes` (default `max_bytes`)"""
+        if not self.max_bytes and not self.max_age:
+            return
+        target_bytes = target_bytes or self.max_bytes
+        now = time.time()
+        entries = []
+        total_size = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for fname in files:
+                if not fname.endswith(".json"):
+                    continue
+                fpath = os.path.join(root, fname)
+                try:
+                    stat = os.stat(fpath)
+                except OSError:
+                    continue
+                if self.max_age and now - stat.st_mtime > self.max_age:
+                    self._remove(fpath)
+                    continue
+                entries.append((stat.st_atime, stat.st_size, fpath))
+                total_size += stat.st_size
+
+        if self.max_bytes and total_size > self.max_bytes:
+            entries.sort()
+            for _, size, fpath in entries:
+                if total_size <= target_bytes:
+                    break
+                self._remove(fpath)
+                total_size -= size
+        with self._lock:
+            self._total_size = total_size
+            self._last_evict = time.monotonic()
+
+    def clear(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for fname in files:
+                if fname.endswith(".json"):
+                    self._remove(os.path.join(root, fname))
+
+    def _remove(self, fpath: str):
+        try:
+            os.remove(fpath)
+        except OSError:
+            pass
+
+
+_llm_cache = None
+_llm_cache_config = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Return the cache configured by env variables, or None if caching is disabled.
+
+    - LLM_CACHE_DIR: directory to store cached answers (caching is disabled if not set)
+    - LLM_CACHE_MODE: `readwrite` (default), `replay` (fail on a miss) or `off`
+    - LLM_CACHE_MAX_SIZE_MB: max total size of the cache directory (0 means unlimited)
+    - LLM_CACHE_MAX_AGE: max age of a cached answer in seconds (0 means unlimited)
+    """
+    global _llm_cache, _llm_cache_config
+
+    cache_dir = os.getenv("LLM_CACHE_DIR", "")
+    mode = os.getenv("LLM_CACHE_MODE", cache_mode_readwrite).lower()
+    if not cache_dir or mode == cache_mode_off:
+        return None
+    if mode not in [cache_mode_readwrite, cache_mode_replay]:
+        raise ValueError(f"Env variable `LLM_CACHE_MODE` must be one of `readwrite`, `replay` or `off`, but got `{mode}`")
+
+    max_bytes = int(float(os.getenv("LLM_CACHE_MAX_SIZE_MB", "0")) * 1024 * 1024)
+    max_age = float(os.getenv("LLM_CACHE_MAX_AGE", "0"))
+    config = (cache_dir, mode, max_bytes, max_age)
+    with _llm_cache_lock:
+        if _llm_cache is None or _llm_cache_config != config:
+            _llm_cache = LLMResponseCache(
+                cache_dir=cache_dir,
+                max_bytes=max_bytes,
+                max_age=max_age,
+                replay_only=mode == cache_mode_replay,
+            )
+            _llm_cache_config = config
+    return _llm_cache
@@ -13,7 +13,7 @@
 # limitations under the License.
 
 import json
-from ciso_agent.manager import CISOManager, CISOState
+from ciso_agent.manager import CISOState, get_manager
 from typing import Optional
 
 
@@ -27,7 +27,8 @@ def run(inputs: dict) -> dict:
     Returns:
         dict: The result returned by the agent after invocation.
     """
-    manager = CISOManager(eval_policy=False)
+    # reuse the compiled graph and the crews across runs in the same process
+    manager = get_manager(eval_policy=False)
     return manager.invoke(inputs)
 
 def main(goal: str = "", output: Optional[str] = None) -> None:
@@ -12,49 +12,182 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import concurrent.futures
+import contextvars
+import importlib
 import json
 import os
 import shutil
+import threading
+import time
 import traceback
-from typing import Literal, TypedDict
+import uuid
+from typing import Annotated, Optional, TypedDict
 
 import yaml
-from dotenv import load_dotenv
 from langgraph.graph import END, StateGraph
-
-from ciso_agent.agents.kubernetes_kubectl_opa import KubernetesKubectlOPACrew
-from ciso_agent.agents.kubernetes_kyverno import KubernetesKyvernoCrew
-from ciso_agent.agents.rhel_playbook_opa import RHELPlaybookOPACrew
-from ciso_agent.llm import get_llm_params, call_llm, extract_code
-
-load_dotenv()
-
-kubernetes_kyverno_crew = KubernetesKyvernoCrew()
-kubernetes_kubectl_opa_crew = KubernetesKubectlOPACrew()
-rhel_playbook_opa_crew = RHELPlaybookOPACrew()
-
-
-sub_agent_descs = {
-    "kubernetes_kyverno": {
-        "goal": kubernetes_kyverno_crew.agent_goal,
-        "tool": kubernetes_kyverno_crew.tool_description,
-        "input": kubernetes_kyverno_crew.input_description,
-        "output": kubernetes_kyverno_crew.output_description,
-    },
-    "kubernetes_kubectl_opa": {
-        "goal": kubernetes_kubectl_opa_crew.agent_goal,
-        "tool": kubernetes_kubectl_opa_crew.tool_description,
-        "input": kubernetes_kubectl_opa_crew.input_description,
-        "output": kubernetes_kubectl_opa_crew.output_description,
-    },
-    "rhel_playbook_opa": {
-        "goal": rhel_playbook_opa_crew.agent_goal,
-        "tool": rhel_playbook_opa_crew.tool_description,
-        "input": rhel_playbook_opa_crew.input_description,
-        "output": rhel_playbook_opa_crew.output_description,
+from langgraph.types import Send
+
+from ciso_agent.checkpoint import RunAttempt, checkpoint_kind_nodes, current_attempt, current_run_id, run_with_checkpoint
+from ciso_agent.events import (
+    EventStream,
+    RunCancelledError,
+    current_event_sink,
+    emit_artifact,
+    emit_event,
+    event_node_finished,
+    event_node_started,
+    event_run_finished,
+    event_run_started,
+    event_scope,
+    event_sink,
+    status_cancelled,
+    status_error,
+    status_ok,
+)
+from ciso_agent.goal_parser import extract_paths_from_goal, select_agent_nodes
+from ciso_agent.graph_render import get_graph_filename, get_graph_render_mode, install_graph_file, render_graph
+from ciso_agent.llm import call_llm, call_llm_json, get_llm_latency_stats, get_llm_params, llm_role_reporter, llm_role_selector
+from ciso_agent.tools.opa import stop_opa_servers
+from ciso_agent.tracing import export_trace, load_env, span_kind_node, trace_span
+
+load_env()
+
+# crew modules import crewai and the tools, so a crew is imported and instantiated only when its node runs
+crew_classes = {
+    "kubernetes_kyverno": "ciso_agent.agents.kubernetes_kyverno:KubernetesKyvernoCrew",
+    "kubernetes_kubectl_opa": "ciso_agent.agents.kubernetes_kubectl_opa:KubernetesKubectlOPACrew",
+    "rhel_playbook_opa": "ciso_agent.agents.rhel_playbook_opa:RHELPlaybookOPACrew",
+}
+_crews = {}
+_crews_lock = threading.Lock()
+
+task_selector_schema = {
+    "type": "object",
+    "properties": {
+        "kubeconfig": {"type": "string"},
+        "ansible_inventory": {"type": "string"},
+        "workdir": {"type": "string"},
     },
+    "required": ["kubeconfig", "ansible_inventory", "workdir"],
+    "additionalProperties": False,
 }
 
+report_mode_background = "background"
+report_mode_sync = "sync"
+report_mode_skip = "skip"
+
+# reports are written by these threads; pending ones are joined at interpreter exit
+_report_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="ciso-agent-report")
+_graph_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="ciso-agent-graph")
+
+
+def get_crew(name: str):
+    """Return the crew instance of the node `name`, importing its module on the first call"""
+    if name not in crew_classes:
+        raise ValueError(f"unknown crew `{name}`; must be one of {list(crew_classes)}")
+    with _crews_lock:
+        crew = _crews.get(name)
+        if crew is None:
+            module_name, class_name = crew_classes[name].split(":")
+            crew_class = getattr(importlib.import_module(module_name), class_name)
+            crew = crew_class()
+            _crews[name] = crew
+        return crew
+
+
+def get_sub_agent_desc(name: str) -> Optional[dict]:
+    if name not in crew_classes:
+        return None
+    crew = get_crew(name)
+    return {
+        "goal": crew.agent_goal,
+        "tool": crew.tool_description,
+        "input": crew.input_description,
+        "output": crew.output_description,
+    }
+
+
+def get_sub_agent_descs() -> dict:
+    """Descriptions of all crews; this imports all crew modules"""
+    return {name: get_sub_agent_desc(name) for name in crew_classes}
+
+
+def __getattr__(name: str):
+    # `sub_agent_descs` was a module attribute built at import time; it is still available, but built on first access
+    if name == "sub_agent_descs":
+        return get_sub_agent_descs()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def make_crew_node(name: str):
+    def _kickoff(inputs: dict):
+        if not inputs.get("fanout"):
+            return get_crew(name).kickoff(inputs)
+        # one of several parallel branches; results are keyed by the node so that they do not overwrite each other
+        output = get_crew(name).kickoff(get_branch_inputs(inputs, name))
+        return {"result": {name: output.get("result") or {}}}
+
+    def kickoff(inputs: dict):
+        workdir = inputs.get("workdir") or ""
+        if inputs.get("fanout") and workdir:
+            workdir = os.path.join(workdir, name)
+        return run_node(name, inputs, workdir, lambda: _kickoff(inputs))
+
+    kickoff.__name__ = name
+    return kickoff
+
+
+def make_node(name: str, func, checkpoint: bool = True):
+    def node(state: dict):
+        return run_node(name, state, state.get("workdir") or "", lambda: func(state), checkpoint=checkpoint)
+
+    node.__name__ = name
+    return node
+
+
+# the node output is reused on retry only if these inputs are the same
+node_key_fields = ["goal", "kubeconfig", "ansible_inventory", "workdir", "fanout"]
+
+
+def run_node(name: str, state: dict, workdir: str, func, checkpoint: bool = True):
+    """Run the node with the run ID of the state and emit the node events.
+    If `checkpoint` is True, the output is replayed if the same run already completed this node."""
+    token = current_run_id.set(state.get("run_id") or "")
+    try:
+        with event_scope(event_node_started, event_node_finished, node=name), trace_span(f"node:{name}", kind=span_kind_node) as span:
+            if not checkpoint:
+                output = func()
+            else:
+                key_data = {k: state.get(k) for k in node_key_fields}
+                output = run_with_checkpoint(checkpoint_kind_nodes, name, key_data, workdir, func)
+            if span:
+                span.set_attribute("output_size", len(json.dumps(output, default=str)))
+            return output
+    finally:
+        current_run_id.reset(token)
+
+
+def merge_results(left: Optional[dict], right: Optional[dict]) -> dict:
+    return {**(left or {}), **(right or {})}
+
+
+def get_branch_inputs(inputs: dict, name: str) -> dict:
+    """Give a parallel branch its own sub-workdir with copies of the kubeconfig and the inventory"""
+    workdir = inputs.get("workdir")
+    if not workdir:
+        return inputs
+    branch_workdir = os.path.join(workdir, name)
+    os.makedirs(branch_workdir, exist_ok=True)
+    branch_inputs = dict(inputs, workdir=branch_workdir)
+    for key, fname in [("kubeconfig", "kubeconfig.yaml"), ("ansible_inventory", "inventory.ansible.ini")]:
+        src_path = inputs.get(key)
+        if src_path and os.path.exists(src_path):
+            dest_path = os.path.join(branch_workdir, fname)
+            shutil.copyfile(src_path, dest_path)
+            branch_inputs[key] = dest_path
+    return branch_inputs
+
 
 class CISOState(TypedDict):
     # input params
@@ -62,16 +195,16 @@ class CISOState(TypedDict):
     kubeconfig: str
     ansible_inventory: str
     workdir: str
+    # checkpoints are recorded per run ID (needs `CISO_CHECKPOINT_DIR`); a retry with the same ID skips completed work
+    run_id: str
 
     # set by task_selector node
     action_sequence: list = []
-    task_index: int = 0
-    route: str
 
-    # set by Crew agent
-    result: dict = {}
+    # set by Crew agent; parallel branches are merged by `merge_results`
+    result: Annotated[dict, merge_results] = {}
 
-    # set by summary node
+    # set by reporter node; the Markdown report, or "" if it is written in the background (`CISO_REPORT_MODE`) or skipped
     summary: str
 
 
@@ -85,39 +218,89 @@ class Action(TypedDict):
 # TODO: add eval_policy
 class CISOManager:
     def __init__(self, eval_policy: bool = False):
+        self.eval_policy = eval_policy
+        self.report_futures = []
+        self._report_futures_lock = threading.Lock()
         workflow = StateGraph(CISOState)
 
-        workflow.add_node("task_selector", self.task_selector)
-        workflow.add_node("task_handler", self.task_handler)
-        workflow.add_node("kubernetes_kyverno", kubernetes_kyverno_crew.kickoff)
-        workflow.add_node("kubernetes_kubectl_opa", kubernetes_kubectl_opa_crew.kickoff)
-        workflow.add_node("rhel_playbook_opa", rhel_playbook_opa_crew.kickoff)
-        workflow.add_node("reporter", self.reporter)
+        workflow.add_node("task_selector", make_node("task_selector", self.task_selector))
+        for name in crew_classes:
+            workflow.add_node(name, make_crew_node(name))
+        workflow.add_node("reporter", make_node("reporter", self.reporter, checkpoint=False))
 
+        # the selected crews run as parallel branches (fan-out), and the reporter runs once all of them finish (fan-in)
         workflow.set_entry_point("task_selector")
-        workflow.add_edge("task_selector", "task_handler")
         workflow.add_conditional_edges(
-            "task_handler",
-            self.switch_routes,
+            "task_selector",
+            self.task_handler,
+            list(crew_classes) + ["reporter"],
         )
-        workflow.add_edge("kubernetes_kyverno", "task_handler")
-        workflow.add_edge("kubernetes_kubectl_opa", "task_handler")
-        workflow.add_edge("rhel_playbook_opa", "task_handler")
+        for name in crew_classes:
+            workflow.add_edge(name, "reporter")
         workflow.add_edge("reporter", END)
 
         self.app = workflow.compile()
 
-    def invoke(self, state: CISOState):
+    def invoke(self, state: CISOState, run_id: str = ""):
+        events_file = os.getenv("CISO_EVENTS_FILE", "")
+        if events_file and current_event_sink.get() is None:
+            with event_sink(run_id=get_run_id(state, run_id) or uuid.uuid4().hex, events_file=events_file):
+                return self._invoke(state, run_id=run_id)
+        return self._invoke(state, run_id=run_id)
+
+    def stream(self, state: CISOState, run_id: str = "", events_file: str = "") -> EventStream:
+        """Start the run in the background and return an iterator of its progress events (see `ciso_agent.events`).
+
+        The events are also written as JSON lines to `events_file` (or `CISO_EVENTS_FILE`).
+        Call `cancel()` of the returned stream to stop the run; `wait()` returns the same output as `invoke()`.
+        """
+        events_file = events_file or os.getenv("CISO_EVENTS_FILE", "")
+        stream_run_id = get_run_id(state, run_id) or uuid.uuid4().hex
+        return EventStream(lambda: self._invoke(state, run_id=run_id), run_id=stream_run_id, events_file=events_file)
+
+    async def astream(self, state: CISOState, run_id: str = "", events_file: str = ""):
+        """Async version of `stream()`; the run is cancelled if the consumer stops iterating early"""
+        stream = self.stream(state, run_id=run_id, events_file=events_file)
+        try:
+            async for event in stream:
+                yield event
+        finally:
+            stream.close()
+
+    def _invoke(self, state: CISOState, run_id: str = ""):
+        start = time.monotonic()
+        emit_event(event_run_started, goal=state.get("goal"))
+        # checkpoint entries recorded by this attempt are not replayed within it
+        attempt_token = current_attempt.set(RunAttempt())
+        output = None
+        try:
+            with trace_span("run", run_id=get_run_id(state, run_id)):
+                output = self._invoke_graph(state, run_id=run_id)
+        except RunCancelledError:
+            emit_event(event_run_finished, duration=round(time.monotonic() - start, 6), status=status_cancelled)
+            raise
+        except BaseException as e:
+            emit_event(event_run_finished, duration=round(time.monotonic() - start, 6), status=status_error, error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            current_attempt.reset(attempt_token)
+            # the OPA servers of the run are not used after it (the workdir is known after the task selector parsed the goal)
+            for workdir in {state.get("workdir") or "", (output or {}).get("workdir") or ""}:
+                if workdir:
+                    stop_opa_servers(workdir)
+            # write the spans after every run, so that a long-lived process does not depend on the exit hook
+            export_trace()
+        emit_event(event_run_finished, duration=round(time.monotonic() - start, 6), status=status_ok)
+        return output
+
+    def _invoke_graph(self, state: CISOState, run_id: str = ""):
         print("\033[36m" + "=" * 90 + "\033[0m")
         print("\033[36m # Goal:\033[0m")
         print("\033[36m" + "=" * 90 + "\033[0m")
         print("\033[36m" + state["goal"] + "\033[0m")
         print("")
-        state["action_sequence"] = []
-        state["task_index"] = 0
-        state["route"] = ""
-        state["result"] = {}
-        output = self.app.invoke(state)
+        # the compiled graph is shared by all runs of this manager, so each run starts from its own copy of the state
+        output = self.app.invoke(new_run_state(state, run_id=run_id))
         o_str = json.dumps(output)
         o_dict = json.loads(o_str)
         print("\033[36m" + "=" * 90 + "\033[0m")
@@ -125,43 +308,27 @@ class CISOManager:
         print("\033[36m" + "=" * 90 + "\033[0m")
         print("")
         print("\033[36m" + yaml.safe_dump(o_dict["result"], sort_keys=False, width=1024) + "\033[0m")
+        print("LLM latency per role:", json.dumps(get_llm_latency_stats()))
         return o_dict
 
-    def save_graph(self):
-        png_graph = self.app.get_graph().draw_mermaid_png()
-        fpath = "graph.png"
-        with open(fpath, "wb") as f:
-            f.write(png_graph)
+    def save_graph(self, workdir: str = "", mode: str = ""):
+        # the graph is static, so it is rendered once per graph structure and the cached file is reused
+        mode = mode or get_graph_render_mode()
+        cached_path = render_graph(self.app.get_graph(), mode=mode)
+        fname = os.path.basename(cached_path)
+        fname = "graph.mmd" if fname.endswith(".mmd") else "graph.png"
+        fpath = os.path.join(workdir, fname) if workdir else fname
+        install_graph_file(cached_path, fpath)
+        emit_artifact(fpath)
+        return fpath
 
     def task_selector(self, state: CISOState):
         goal = state["goal"]
 
-        manager_model, manager_api_url, manager_api_key = get_llm_params()
-        summary_prompt = f"""Extract some required information from the following goal.
-Please return a parsable JSON string.
-If some info is not provided, set empty string to it.
-
-Goal:
-{goal}
-
-Expected Output:
-```json
-{{
-    "kubeconfig": "if the path to kubeconfig is provided, set it to this",
-    "ansible_inventory": "if the path to Ansible inventory file is provided, set it to this",
-    "workdir": "if the path to workdir is provided, set it to this"
-}}
-```
-"""
-        answer = call_llm(
-            prompt=summary_prompt,
-            model=manager_model,
-            api_key=manager_api_key,
-            api_url=manager_api_url,
-        )
-        if "```" in answer:
-            answer = extract_code(answer, code_type="json")
-        data = json.loads(answer)
+        # the harness-generated goals contain the paths literally, so try the rule-based extraction first
+        data = extract_paths_from_goal(goal)
+        if not any(data.values()):
+            data = self.extract_paths_by_llm(goal)
         kubeconfig = data.get("kubeconfig")
         ansible_inventory = data.get("ansible_inventory")
         workdir = data.get("workdir")
@@ -180,35 +347,17 @@ Expected Output:
             if ansible_inventory != inventory_path:
                 shutil.copyfile(ansible_inventory, inventory_path)
 
-        # Task Selection
-        agent_task = None
-        goal_lower = goal.lower()
-        if "kyverno" in goal_lower:
-            agent_task = Action(
-                description="kubernetes_kyverno",
-                node="kubernetes_kyverno",
-            )
-        elif "kubectl" in goal_lower and "opa" in goal_lower:
-            agent_task = Action(
-                description="kubernetes_kubectl_opa",
-                node="kubernetes_kubectl_opa",
-            )
-        elif "rhel" in goal_lower and "playbook" in goal_lower:
-            agent_task = Action(
-                description="rhel_playbook_opa",
-                node="rhel_playbook_opa",
-            )
-        else:
+        # Task Selection; a goal covering several targets (a cluster and RHEL hosts) selects a task per target
+        agent_nodes = select_agent_nodes(goal, kubeconfig=kubeconfig, ansible_inventory=ansible_inventory)
+        agent_tasks = [Action(description=node, node=node) for node in agent_nodes]
+        if not agent_tasks:
             raise ValueError(f"failed to find an appropriate agent for this task goal: {goal}")
         reporter_task = Action(
             description="reporter",
             node="reporter",
         )
-        action_sequence = [
-            agent_task,
-            reporter_task,
-        ]
-        print("Task Selection Result:", agent_task.get("node"))
+        action_sequence = agent_tasks + [reporter_task]
+        print("Task Selection Result:", ", ".join([t.get("node") for t in agent_tasks]))
 
         return {
             "kubeconfig": kubecfg_path,
@@ -217,102 +366,82 @@ Expected Output:
             "action_sequence": action_sequence,
         }
 
-    def task_handler(self, state: CISOState):
-        task_index = state["task_index"]
-        action_sequence = state["action_sequence"]
-        route = None
-        for i, action in enumerate(action_sequence):
-            if i == task_index:
-                node = action["node"]
-                route = node.split(".")[-1]
-        next_index = task_index + 1
-        return {"route": route, "task_index": next_index}
-
-    def switch_routes(self, state: CISOState) -> Literal["kubernetes_kyverno", "kubernetes_kubectl_opa", "rhel_playbook_opa", "reporter"]:
-        route = state["route"]
-        crew_nodes = [
-            "kubernetes_kyverno",
-            "kubernetes_kubectl_opa",
-            "rhel_playbook_opa",
-            "reporter",
-        ]
-        if route and route in crew_nodes:
-            return route
-        return "reporter"
-
-    def reporter(self, state: CISOState):
-        # add workdir prefix first
-        result = state["result"]
-        
-        workdir = state.get("workdir")
-        if isinstance(result, dict) and workdir:
-            for key, val in result.items():
-                if val and key.startswith("path_to_") and "/" not in val:
-                    result[key] = os.path.join(workdir, val)
-
-        # save graph.png to use it in the report.md
-        self.save_graph()
-
-        policy_path_1 = os.path.join(workdir, "policy.yaml")
-        policy_path_2 = os.path.join(workdir, "policy.rego")
-        policy_block = ""
-        if os.path.exists(policy_path_1):
-            policy = ""
-            with open(policy_path_1, "r") as f:
-                policy = f.read()
-            policy_block = f"""
-Generated Policy:
-```yaml
-{policy}
-```
-
-"""
-        elif os.path.exists(policy_path_2):
-            policy = ""
-            with open(policy_path_2, "r") as f:
-                policy = f.read()
-            policy_block = f"""
-Generated Policy:
-```rego
-{policy}
-```
-
-"""
-        manager_model, manager_api_url, manager_api_key = get_llm_params()
-
-        goal = state["goal"]
-
-        prompt = f"""Make an output JSON string based on the goal and the results.
-Goal: {goal}
+    def extract_paths_by_llm(self, goal: str):
+        manager_model, manager_api_url, manager_api_key = get_llm_params(role=llm_role_selector)
+        summary_prompt = f"""Extract some required information from the following goal.
+Please return a parsable JSON string.
+If some info is not provided, set empty string to it.
 
-Result:
-{result}
+Goal:
+{goal}
 
-Output Format:
+Expected Output:
 ```json
 {{
-    "path_to_<FILE_DESCRIPTION>": <PLACEHOLDER>,
+    "kubeconfig": "if the path to kubeconfig is provided, set it to this",
+    "ansible_inventory": "if the path to Ansible inventory file is provided, set it to this",
+    "workdir": "if the path to workdir is provided, set it to this"
 }}
 ```
 """
-        answer = call_llm(
-            prompt=prompt,
+        data = call_llm_json(
+            prompt=summary_prompt,
+            schema=task_selector_schema,
             model=manager_model,
             api_key=manager_api_key,
             api_url=manager_api_url,
+            role=llm_role_selector,
         )
-        result_str = answer.strip()
-        if "```" in result_str:
-            result_str = extract_code(result_str, code_type="json")
-        result = state["result"]
-        try:
-            result = json.loads(result_str)
-        except Exception:
-            error = traceback.format_exc()
-            print(f"failed to parse `result_str` in reporter: {error}")
+        return data
+
+    def task_handler(self, state: CISOState):
+        agent_nodes = get_agent_nodes(state)
+        if not agent_nodes:
+            return "reporter"
+        fanout = len(agent_nodes) > 1
+        return [Send(node, dict(state, fanout=fanout)) for node in agent_nodes]
+
+    def reporter(self, state: CISOState):
+        workdir = state.get("workdir")
+        goal = state["goal"]
+
+        # the crews already return their outputs as `path_to_*` keys described in `output_description`,
+        # so the final result is built here without asking the LLM to reshape it
+        result = build_result(state=state)
+
+        report = ""
+        report_mode = get_report_mode()
+        if report_mode != report_mode_skip:
+            opath = os.path.join(workdir, "report.md") if workdir else "report.md"
+            if report_mode == report_mode_background:
+                # the run ID, the event sink and the current span are context variables, so carry them to the executor thread
+                ctx = contextvars.copy_context()
+                future = _report_executor.submit(ctx.run, self.write_report, goal, dict(result), workdir, opath)
+                with self._report_futures_lock:
+                    self.report_futures.append(future)
+                # added after appending, so that a future which is already done is removed as well
+                future.add_done_callback(self._on_report_done)
+            else:
+                report = self.write_report(goal, dict(result), workdir, opath)
+            result["path_to_generated_report"] = opath
+
+        return {"summary": report, "result": result}
+
+    def write_report(self, goal: str, result: dict, workdir: str, opath: str):
+        # save the graph image to use it in the report.md; render it while the LLM writes the report
+        graph_mode = get_graph_render_mode()
+        graph_fname = get_graph_filename(graph_mode)
+        graph_future = _graph_executor.submit(self.save_graph, workdir, graph_mode)
+
+        policy_block = ""
+        if workdir:
+            # parallel branches write their policies into the sub-workdirs
+            policy_dirs = [workdir] + [os.path.join(workdir, name) for name in crew_classes]
+            policy_block = "".join([get_policy_block(d) for d in policy_dirs if os.path.isdir(d)])
+        manager_model, manager_api_url, manager_api_key = get_llm_params(role=llm_role_reporter)
 
         prompt = f"""Make a Markdown summary based on the following information.
-At the begining of the report, please introduce the image of the graph architecture at `graph.png`.
+At the begining of the report, please introduce the image of the graph architecture at `{graph_fname}`.
 This graph represents how the Chief Information Security Officer (CISO) Agent performs to achieve the requested goal.
 Your answer will be saved as a Markdown file later.
 
@@ -329,14 +458,148 @@ Result:
             model=manager_model,
             api_key=manager_api_key,
             api_url=manager_api_url,
+            role=llm_role_reporter,
         )
         report = answer.strip()
         if "```markdown" in report:
             report = report.lstrip("```markdown").rstrip("```")
 
-        opath = os.path.join(workdir, "report.md") if workdir else "report.md"
+        try:
+            graph_path = graph_future.result()
+            # the PNG rendering may have fallen back to the Mermaid text; refer to the file which was actually written
+            actual_fname = os.path.basename(graph_path)
+            if actual_fname != graph_fname:
+                report = report.replace(graph_fname, actual_fname)
+        except Exception:
+            error = traceback.format_exc()
+            print(f"failed to save the graph image in reporter: {error}")
+
         with open(opath, "w") as f:
             f.write(report)
-        result["path_to_generated_report"] = opath
+        emit_artifact(opath)
+        return report
+
+    def _on_report_done(self, future: concurrent.futures.Future):
+        with self._report_futures_lock:
+            if future in self.report_futures:
+                self.report_futures.remove(future)
+        _print_report_error(future)
+
+    def wait_for_reports(self, timeout: Optional[float] = None):
+        """Wait until all reports being written in the background are saved"""
+        with self._report_futures_lock:
+            futures = list(self.report_futures)
+        concurrent.futures.wait(futures, timeout=timeout)
+
+
+def new_run_state(state: CISOState, run_id: str = "") -> CISOState:
+    """Return a fresh state for one run; the given state is not modified"""
+    run_state = CISOState(**state)
+    run_state["action_sequence"] = []
+    run_state["result"] = {}
+    run_state["run_id"] = get_run_id(state, run_id)
+    return run_state
+
+
+def get_run_id(state: CISOState, run_id: str = "") -> str:
+    return run_id or state.get("run_id") or os.getenv("CISO_RUN_ID", "")
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager(eval_policy: bool = False) -> CISOManager:
+    """Return the process-wide CISOManager.
+
+    The graph is compiled only on the first call and reused by later runs.
+    The manager itself keeps no per-run state, so it can run many goals one after another (or concurrently).
+    """
+    global _manager
+
+    with _manager_lock:
+        if _manager is None or _manager.eval_policy != eval_policy:
+            _manager = CISOManager(eval_policy=eval_policy)
+        return _manager
+
+
+def get_agent_nodes(state: CISOState) -> list:
+    return [action.get("node") for action in state.get("action_sequence") or [] if action.get("node") in crew_classes]
+
+
+def build_result(state: CISOState) -> dict:
+    result = state.get("result") or {}
+    if not isinstance(result, dict):
+        return {}
+
+    workdir = state.get("workdir")
+    agent_nodes = get_agent_nodes(state)
+    if len(agent_nodes) > 1:
+        # the results of parallel branches are keyed by the node, and each branch has its own sub-workdir
+        new_result = {}
+        for node in agent_nodes:
+            branch_workdir = os.path.join(workdir, node) if workdir else workdir
+            new_result[node] = build_crew_result(result.get(node) or {}, agent_nodes=[node], workdir=branch_workdir)
+        return new_result
+    return build_crew_result(result, agent_nodes=agent_nodes, workdir=workdir)
+
+
+def build_crew_result(result: dict, agent_nodes: list, workdir: str) -> dict:
+    output_keys = []
+    for node in agent_nodes:
+        desc = get_sub_agent_desc(node)
+        if desc:
+            output_keys.extend(desc["output"].keys())
+
+    new_result = {}
+    for key, val in result.items():
+        if output_keys and key not in output_keys and not key.startswith("path_to_"):
+            continue
+        # add workdir prefix because agent does not know it
+        if val and workdir and key.startswith("path_to_") and isinstance(val, str) and "/" not in val:
+            val = os.path.join(workdir, val)
+        new_result[key] = val
+    return new_result
+
+
+def get_policy_block(workdir: str) -> str:
+    policy_path_1 = os.path.join(workdir, "policy.yaml")
+    policy_path_2 = os.path.join(workdir, "policy.rego")
+    policy_block = ""
+    if os.path.exists(policy_path_1):
+        policy = ""
+        with open(policy_path_1, "r") as f:
+            policy = f.read()
+        policy_block = f"""
+Generated Policy:
+```yaml
+{policy}
+```
 
-        return {"summary": report, "result": result}
+"""
+    elif os.path.exists(policy_path_2):
+        policy = ""
+        with open(policy_path_2, "r") as f:
+            policy = f.read()
+        policy_block = f"""
+Generated Policy:
+```rego
+{policy}
+```
+
+"""
+    return policy_block
+
+
+def get_report_mode():
+    """`CISO_REPORT_MODE` env variable: `background` (default), `sync` or `skip`"""
+    report_mode = os.getenv("CISO_REPORT_MODE", report_mode_background).lower()
+    if report_mode not in [report_mode_background, report_mode_sync, report_mode_skip]:
+        raise ValueError(f"Env variable `CISO_REPORT_MODE` must be one of `background`, `sync` or `skip`, but got `{report_mode}`")
+    return report_mode
+
+
+def _print_report_error(future: concurrent.futures.Future):
+    error = future.exception()
+    if error:
+        print(f"failed to write the report in background: {error}")
@@ -0,0 +1,289 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A local OpenAI-compatible chat-completions server serving scripted responses.
+
+Fixture file format (JSON):
+
+```json
+{
+    "default": "answer for prompts that do not match any entry",
+    "responses": [
+        {"prompt_hash": "<sha256 of the messages>", "response": "..."},
+        {"contains": "a substring of the last message", "response": "..."}
+    ]
+}
+```
+
+Point the agent at the server with `LLM_BASE_URL=http://127.0.0.1:<port>/v1`,
+`LLM_MODEL_NAME=openai/<any name>` and `LLM_API_KEY=<any string>`.
+With `--upstream-url`, prompts without a fixture are forwarded to a real API and
+the answers are recorded into the fixture file.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+default_answer = "This is a mock answer."
+
+
+def get_prompt_hash(messages: list) -> str:
+    _messages = [{"role": m.get("role", ""), "content": m.get("content", "")} for m in messages]
+    messages_str = json.dumps(_messages, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(messages_str.encode("utf-8")).hexdigest()
+
+
+def count_tokens(text: str) -> int:
+    # roughly 4 characters per token
+    return len(text) // 4 + 1 if text else 0
+
+
+def split_tokens(text: str, size: int = 4) -> list:
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+class MockLLMFixtures(object):
+    def __init__(self, fixture_file: str = "", default: Optional[str] = None):
+        self.fixture_file = fixture_file
+        self.default = default_answer if default is None else default
+        self.responses = []
+        self._lock = threading.Lock()
+        if fixture_file and os.path.exists(fixture_file):
+            with open(fixture_file, "r") as f:
+                data = json.load(f)
+            self.default = data.get("default", self.default)
+            self.responses = data.get("responses", [])
+
+    def find(self, messages: list) -> Optional[str]:
+        prompt_hash = get_prompt_hash(messages)
+        last_content = messages[-1].get("content", "") if messages else ""
+        if not isinstance(last_content, str):
+            last_content = json.dumps(last_content)
+        with self._lock:
+            for entry in self.responses:
+                if entry.get("prompt_hash") == prompt_hash:
+                    return entry.get("response", "")
+            for entry in self.responses:
+                if entry.get("contains") and entry["contains"] in last_content:
+                    return entry.get("response", "")
+        return None
+
+    def record(self, messages: list, response: str):
+        with self._lock:
+            self.responses.append({"prompt_hash": get_prompt_hash(messages), "response": response})
+            if self.fixture_file:
+                with open(self.fixture_file, "w") as f:
+                    json.dump({"default": self.default, "responses": self.responses}, f, indent=2, ensure_ascii=False)
+
+
+class MockLLMServer(object):
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        fixtures: Optional[MockLLMFixtures] = None,
+        latency: float = 0.0,
+        tokens_per_second: float = 0.0,
+        upstream_url: str = "",
+        upstream_api_key: str = "",
+    ):
+        self.fixtures = fixtures or MockLLMFixtures()
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.upstream_url = upstream_url.rstrip("/")
+        self.upstream_api_key = upstream_api_key
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def get_answer(self, body: dict) -> str:
+        with self._lock:
+            self.request_count += 1
+        messages = body.get("messages", [])
+        answer = self.fixtures.find(messages)
+        if answer is not None:
+            return answer
+        if self.upstream_url:
+            answer = self.call_upstream(body)
+            self.fixtures.record(messages, answer)
+            return answer
+        print(f"[mock-llm-server] no fixture for prompt_hash {get_prompt_hash(messages)}; returning the default answer")
+        return self.fixtures.default
+
+    def call_upstream(self, body: dict) -> str:
+        upstream_body = dict(body, stream=False)
+        req = urllib.request.Request(
+            self.upstream_url + "/chat/completions",
+            data=json.dumps(upstream_body).encode("utf-8"),
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {self.upstream_api_key}"},
+            method="POST",
+        )
+        with urllib.request.urlopen(req) as resp:
+            data = json.loads(resp.read())
+        return data["choices"][0]["message"]["content"]
+
+    def wait_for_tokens(self, num_tokens: int):
+        if self.tokens_per_second > 0 and num_tokens > 0:
+            time.sleep(num_tokens / self.tokens_per_second)
+
+
+def _make_handler(server: MockLLMServer):
+    class MockLLMRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json({"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+                return
+            self._send_json({"error": {"message": f"not found: {self.path}"}}, status=404)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json({"error": {"message": f"not found: {self.path}"}}, status=404)
+                return
+            length = int(self.headers.get("Content-Length", "0"))
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json({"error": {"message": "invalid JSON body"}}, status=400)
+                return
+
+            answer = server.get_answer(body)
+            model = body.get("model", "mock")
+            prompt_tokens = sum(count_tokens(m.get("content", "")) for m in body.get("messages", []) if isinstance(m.get("content"), str))
+            if server.latency > 0:
+                time.sleep(server.latency)
+            if body.get("stream"):
+                self._send_stream(answer, model, prompt_tokens)
+            else:
+                server.wait_for_tokens(count_tokens(answer))
+                self._send_json(
+                    {
+                        "id": f"chatcmpl-{uuid.uuid4().hex}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": count_tokens(answer),
+                            "total_tokens": prompt_tokens + count_tokens(answer),
+                        },
+                    }
+                )
+
+        def _send_json(self, data: dict, status: int = 200):
+            payload = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _send_stream(self, answer: str, model: str, prompt_tokens: int):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+            created = int(time.time())
+            try:
+                for token in split_tokens(answer):
+                    server.wait_for_tokens(1)
+                    self._send_event(chunk_id, created, model, {"content": token}, None)
+                self._send_event(chunk_id, created, model, {}, "stop")
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # the client cancelled the stream (e.g. early stop after a code block)
+                pass
+            self.close_connection = True
+
+        def _send_event(self, chunk_id: str, created: int, model: str, delta: dict, finish_reason: Optional[str]):
+            chunk = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+    return MockLLMRequestHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server for offline benchmarks and tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("-f", "--fixtures", default="", help="path to the fixture JSON file")
+    parser.add_argument("--default", default=None, help="answer for prompts without a fixture")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="generation speed (0 means no delay)")
+    parser.add_argument("--upstream-url", default="", help="forward prompts without a fixture to this API and record the answers")
+    parser.add_argument("--upstream-api-key", default=os.getenv("LLM_API_KEY", ""))
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        host=args.host,
+        port=args.port,
+        fixtures=MockLLMFixtures(fixture_file=args.fixtures, default=args.default),
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        upstream_url=args.upstream_url,
+        upstream_api_key=args.upstream_api_key,
+    )
+    print(f"Mock LLM server is listening at {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
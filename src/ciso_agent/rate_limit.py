@@ -0,0 +1,327 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import email.utils
+import fcntl
+import hashlib
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from ciso_agent.events import check_cancelled, current_event_sink
+
+retryable_status_codes = [408, 409, 429, 500, 502, 503, 504]
+retryable_error_names = ["RateLimitError", "APITimeoutError", "APIConnectionError", "Timeout", "ServiceUnavailableError", "InternalServerError"]
+
+
+class RateLimitMetrics(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.throttled_requests = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.retries = 0
+            self.rate_limited_errors = 0
+
+    def record_wait(self, wait: float):
+        with self._lock:
+            self.requests += 1
+            if wait > 0:
+                self.throttled_requests += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def record_retry(self, rate_limited: bool):
+        with self._lock:
+            self.retries += 1
+            if rate_limited:
+                self.rate_limited_errors += 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "throttled_requests": self.throttled_requests,
+                "total_queue_wait_seconds": round(self.total_wait, 3),
+                "avg_queue_wait_seconds": round(self.total_wait / self.requests, 3) if self.requests else 0.0,
+                "max_queue_wait_seconds": round(self.max_wait, 3),
+                "retries": self.retries,
+                "rate_limited_errors": self.rate_limited_errors,
+            }
+
+
+rate_limit_metrics = RateLimitMetrics()
+
+
+class RateLimiter(object):
+    """Token bucket limiter for requests/min and tokens/min.
+
+    The bucket state is kept in a small JSON file guarded by `flock`, so that
+    all processes using the same `state_dir` share one budget per endpoint.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0, state_dir: str = ""):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.state_dir = state_dir or os.path.join(tempfile.gettempdir(), "ciso-agent-rate-limit")
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.state_path = os.path.join(self.state_dir, f"{name}.json")
+
+    def acquire(self, tokens: int = 0) -> float:
+        start = time.monotonic()
+        while True:
+            wait = self.try_acquire(tokens=tokens)
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        waited = time.monotonic() - start
+        rate_limit_metrics.record_wait(waited)
+        return waited
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        start = time.monotonic()
+        while True:
+            # `try_acquire` blocks on the file lock, so keep it off the shared event loop
+            wait = await asyncio.to_thread(self.try_acquire, tokens=tokens)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        waited = time.monotonic() - start
+        rate_limit_metrics.record_wait(waited)
+        return waited
+
+    def try_acquire(self, tokens: int = 0) -> float:
+        """Take one request and `tokens` tokens from the buckets if available.
+        Returns 0 on success, otherwise the seconds to wait before trying again."""
+        with self._locked_state() as state:
+            now = time.time()
+            blocked_until = state.get("blocked_until", 0)
+            if blocked_until > now:
+                return blocked_until - now
+
+            waits = []
+            buckets = [("requests", self.requests_per_minute, 1), ("tokens", self.tokens_per_minute, tokens)]
+            for key, per_minute, amount in buckets:
+                if not per_minute:
+                    continue
+                bucket = state.get(key, {"level": per_minute, "updated": now})
+                level = min(per_minute, bucket["level"] + (now - bucket["updated"]) * per_minute / 60)
+                state[key] = {"level": level, "updated": now}
+                # a single request larger than the whole bucket waits for a full bucket
+                amount = min(amount, per_minute)
+                if level < amount:
+                    waits.append((amount - level) * 60 / per_minute)
+
+            if waits:
+                return max(waits)
+
+            for key, per_minute, amount in buckets:
+                if per_minute:
+                    state[key]["level"] -= min(amount, per_minute)
+            return 0
+
+    def penalize(self, seconds: float):
+        """Block all processes sharing this limiter for `seconds` (e.g. after a 429 with Retry-After)"""
+        with self._locked_state() as state:
+            state["blocked_until"] = max(state.get("blocked_until", 0), time.time() + seconds)
+
+    def _locked_state(self):
+        return _LockedJSONFile(self.state_path)
+
+
+class _LockedJSONFile(object):
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+        self.state = {}
+
+    def __enter__(self) -> dict:
+        self.file = open(self.path, "a+")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        self.file.seek(0)
+        try:
+            self.state = json.loads(self.file.read() or "{}")
+        except ValueError:
+            self.state = {}
+        return self.state
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.file.seek(0)
+                self.file.truncate()
+                self.file.write(json.dumps(self.state))
+                self.file.flush()
+        finally:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+        return False
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_url: str = "", model: str = "") -> Optional[RateLimiter]:
+    """Return the limiter for the endpoint, or None if no limit is configured.
+
+    - LLM_RATE_LIMIT_RPM: max requests per minute per endpoint
+    - LLM_RATE_LIMIT_TPM: max (estimated) prompt tokens per minute per endpoint
+    - LLM_RATE_LIMIT_DIR: directory of the shared state files; processes using the same directory share the limits
+    """
+    rpm = float(os.getenv("LLM_RATE_LIMIT_RPM", "0"))
+    tpm = float(os.getenv("LLM_RATE_LIMIT_TPM", "0"))
+    if not rpm and not tpm:
+        return None
+    state_dir = os.getenv("LLM_RATE_LIMIT_DIR", "")
+    name = hashlib.sha256(f"{api_url or ''}|{model or ''}".encode("utf-8")).hexdigest()[:16]
+    key = (name, rpm, tpm, state_dir)
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = RateLimiter(name=name, requests_per_minute=rpm, tokens_per_minute=tpm, state_dir=state_dir)
+        return _rate_limiters[key]
+
+
+def estimate_tokens(texts: list) -> int:
+    # roughly 4 characters per token; good enough for budgeting
+    return sum(len(t) for t in texts if isinstance(t, str)) // 4 + 1
+
+
+def get_status_code(error: Exception) -> int:
+    status_code = getattr(error, "status_code", None)
+    if not isinstance(status_code, int):
+        response = getattr(error, "response", None)
+        status_code = getattr(response, "status_code", None)
+    return status_code if isinstance(status_code, int) else 0
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            delay = float(retry_after_ms) / 1000
+            return max(0.0, delay) if math.isfinite(delay) else None
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            delay = float(retry_after)
+            return max(0.0, delay) if math.isfinite(delay) else None
+        except ValueError:
+            # HTTP-date format
+            retry_at = email.utils.parsedate_to_datetime(retry_after)
+            return max(0.0, retry_at.timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return get_status_code(error) == 429 or "RateLimit" in type(error).__name__
+
+
+def is_retryable_error(error: Exception) -> bool:
+    if get_status_code(error) in retryable_status_codes:
+        return True
+    return any(name in type(error).__name__ for name in retryable_error_names)
+
+
+def get_backoff_delay(attempt: int, base_delay: float = 1.0, max_delay: float = 60.0, retry_after: Optional[float] = None) -> float:
+    if retry_after is not None:
+        # respect the server's hint, plus a little jitter to avoid a thundering herd
+        return min(max_delay, max(0.0, retry_after)) + random.uniform(0, base_delay)
+    # "full jitter" exponential backoff
+    return random.uniform(0, min(max_delay, base_delay * (2**attempt)))
+
+
+def get_retry_params():
+    max_retries = int(os.getenv("LLM_MAX_RETRIES", "5"))
+    base_delay = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+    max_delay = float(os.getenv("LLM_RETRY_MAX_DELAY", "60.0"))
+    return max_retries, base_delay, max_delay
+
+
+def _handle_error(error: Exception, attempt: int, max_retries: int, base_delay: float, max_delay: float, limiter: Optional[RateLimiter]):
+    if attempt >= max_retries or not is_retryable_error(error):
+        raise error
+    retry_after = get_retry_after(error)
+    if retry_after is not None:
+        # the server's hint is clamped to [0, max_delay] like the backoff itself
+        retry_after = min(max(0.0, retry_after), max_delay)
+    rate_limited = is_rate_limit_error(error)
+    if limiter and rate_limited and retry_after:
+        limiter.penalize(retry_after)
+    rate_limit_metrics.record_retry(rate_limited=rate_limited)
+    delay = get_backoff_delay(attempt, base_delay=base_delay, max_delay=max_delay, retry_after=retry_after)
+    print(f"LLM request failed with {type(error).__name__} (status: {get_status_code(error)}); retrying in {delay:.1f}s")
+    return delay
+
+
+def call_with_retry(func, limiter: Optional[RateLimiter] = None, tokens: int = 0):
+    max_retries, base_delay, max_delay = get_retry_params()
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire(tokens=tokens)
+        try:
+            return func()
+        except Exception as e:
+            delay = _handle_error(e, attempt, max_retries, base_delay, max_delay, limiter)
+        sleep_unless_cancelled(delay)
+        attempt += 1
+
+
+def sleep_unless_cancelled(delay: float):
+    """Sleep for the backoff, but raise `RunCancelledError` as soon as the current run is cancelled"""
+    sink = current_event_sink.get()
+    if sink is None:
+        time.sleep(delay)
+        return
+    sink.cancelled.wait(delay)
+    check_cancelled()
+
+
+async def acall_with_retry(afunc, limiter: Optional[RateLimiter] = None, tokens: int = 0):
+    max_retries, base_delay, max_delay = get_retry_params()
+    attempt = 0
+    while True:
+        if limiter:
+            await limiter.aacquire(tokens=tokens)
+        try:
+            return await afunc()
+        except Exception as e:
+            # `limiter.penalize()` in the error handling also takes the file lock
+            delay = await asyncio.to_thread(_handle_error, e, attempt, max_retries, base_delay, max_delay, limiter)
+        await asyncio.sleep(delay)
+        check_cancelled()
+        attempt += 1
+
+
+def get_rate_limit_metrics() -> dict:
+    return rate_limit_metrics.to_dict()
@@ -0,0 +1,413 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A long-running agent service which keeps the manager, the crews and the LLM clients warm across jobs.
+
+Goals are submitted into a bounded priority queue over HTTP (on localhost or a Unix socket)
+and run by a pool of worker threads.
+
+    python -m ciso_agent.service --socket /tmp/agent/ciso.sock -j 2
+
+Endpoints (JSON):
+
+- `POST /jobs`: `{"goal": "...", "priority": 0, "id": "...", "timeout": 200, "output": "<path>"}`;
+  instead of `goal`, `{"scenario_data": {...}, "workdir": "<dir>"}` prepares the scenario like `agent-harness.yaml`.
+  Jobs with a larger `priority` run first. Returns 202, or 503 if the queue is full.
+- `GET /jobs`, `GET /jobs/<id>`: status and progress
+- `GET /jobs/<id>/result`: the agent output (409 until the job is finished)
+- `GET /jobs/<id>/events`: the latest progress events (see `ciso_agent.events`)
+- `POST /jobs/<id>/cancel` (or `DELETE /jobs/<id>`): cancel a queued or running job
+- `GET /health`
+"""
+
+import argparse
+import collections
+import heapq
+import itertools
+import json
+import os
+import queue
+import signal
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+job_status_queued = "queued"
+job_status_running = "running"
+job_status_succeeded = "succeeded"
+job_status_failed = "failed"
+job_status_cancelled = "cancelled"
+job_status_timed_out = "timed_out"
+
+finished_job_statuses = [job_status_succeeded, job_status_failed, job_status_cancelled, job_status_timed_out]
+
+# the number of the latest progress events kept per job
+max_job_events = 200
+
+
+class Job(object):
+    def __init__(self, goal: str, job_id: str = "", priority: int = 0, timeout: float = 0.0, output: str = ""):
+        self.id = job_id or uuid.uuid4().hex
+        self.goal = goal
+        self.priority = priority
+        self.timeout = timeout
+        self.output = output
+        self.status = job_status_queued
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = ""
+        self.events = collections.deque(maxlen=max_job_events)
+        self.event_count = 0
+        self.stream = None
+        self._cancel_status = ""
+        self._lock = threading.Lock()
+
+    def add_event(self, event: dict):
+        with self._lock:
+            self.events.append(event)
+            self.event_count += 1
+
+    def cancel(self, status: str = job_status_cancelled) -> bool:
+        with self._lock:
+            if self.status in finished_job_statuses:
+                return False
+            self._cancel_status = status
+            if self.status == job_status_queued:
+                # the worker skips the job when it is dequeued
+                self.status = status
+                self.finished = time.time()
+                return True
+            stream = self.stream
+        if stream:
+            stream.cancel()
+        return True
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            last_event = self.events[-1] if self.events else None
+            return {
+                "id": self.id,
+                "status": self.status,
+                "priority": self.priority,
+                "submitted": self.submitted,
+                "started": self.started,
+                "finished": self.finished,
+                "duration": round((self.finished or time.time()) - self.started, 3) if self.started else None,
+                "event_count": self.event_count,
+                "last_event": last_event,
+                "error": self.error,
+            }
+
+
+class AgentService(object):
+    """Runs the submitted jobs with `workers` threads. `manager` is shared by all jobs
+    (the default is `ciso_agent.manager.get_manager()`); it needs `stream(state, run_id=...)`."""
+
+    def __init__(self, workers: int = 2, queue_size: int = 100, manager=None, max_jobs: int = 1000):
+        if workers < 1:
+            raise ValueError(f"the number of workers must be 1 or more, but got {workers}")
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_jobs = max_jobs
+        self.manager = manager
+        self.jobs = collections.OrderedDict()
+        # heap of (-priority, seq, job); a cancelled job is removed at once, so it does not hold a slot of the queue
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._queue_changed = threading.Condition(self._lock)
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if self.manager is None:
+            # build the graph, the crews and the LLM clients once, before the first job arrives
+            from ciso_agent.manager import get_manager
+
+            self.manager = get_manager(eval_policy=False)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ciso-service-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop accepting jobs, cancel the queued and running ones and wait for the workers"""
+        self._stopped.set()
+        with self._lock:
+            jobs = list(self.jobs.values())
+            self._queue = []
+            self._queue_changed.notify_all()
+        for job in jobs:
+            job.cancel()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, goal: str, job_id: str = "", priority: int = 0, timeout: float = 0.0, output: str = "") -> Job:
+        if self._stopped.is_set():
+            raise RuntimeError("the service is stopping")
+        if not goal:
+            raise ValueError("`goal` is empty")
+        job = Job(goal=goal, job_id=job_id, priority=priority, timeout=timeout, output=output)
+        with self._lock:
+            if job.id in self.jobs:
+                raise ValueError(f"job `{job.id}` already exists")
+            if len(self._queue) >= self.queue_size:
+                raise queue.Full(f"the job queue is full ({self.queue_size} jobs)")
+            heapq.heappush(self._queue, (-priority, next(self._seq), job))
+            self._queue_changed.notify()
+            self.jobs[job.id] = job
+            self._forget_old_jobs()
+        return job
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get_job(job_id)
+        if job:
+            job.cancel()
+            with self._lock:
+                queued = [item for item in self._queue if item[2] is not job]
+                if len(queued) != len(self._queue):
+                    heapq.heapify(queued)
+                    self._queue = queued
+        return job
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            **{s: statuses.count(s) for s in [job_status_queued, job_status_running] + finished_job_statuses},
+        }
+
+    def _forget_old_jobs(self):
+        if len(self.jobs) <= self.max_jobs:
+            return
+        for job_id in [j.id for j in self.jobs.values() if j.status in finished_job_statuses]:
+            del self.jobs[job_id]
+            if len(self.jobs) <= self.max_jobs:
+                return
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._stopped.is_set():
+                    self._queue_changed.wait()
+                if self._stopped.is_set():
+                    return
+                _, _, job = heapq.heappop(self._queue)
+            try:
+                self._run_job(job)
+            except Exception as e:
+                print(f"[service] job `{job.id}` failed: {type(e).__name__}: {e}")
+
+    def _run_job(self, job: Job):
+        with job._lock:
+            if job.status != job_status_queued:
+                return
+            job.status = job_status_running
+            job.started = time.time()
+            job.stream = self.manager.stream({"goal": job.goal}, run_id=job.id)
+        timer = None
+        if job.timeout:
+            timer = threading.Timer(job.timeout, job.cancel, kwargs={"status": job_status_timed_out})
+            timer.daemon = True
+            timer.start()
+
+        # the stream ends when the run finishes, so collecting the events also waits for the run
+        for event in job.stream:
+            job.add_event(event)
+        if timer:
+            timer.cancel()
+
+        status = job_status_succeeded
+        error = ""
+        result = None
+        try:
+            result = job.stream.wait()
+        except Exception as e:
+            status = job._cancel_status or job_status_failed
+            error = f"{type(e).__name__}: {e}"
+        if result is not None and job.output:
+            with open(job.output, "w") as f:
+                json.dump(result, f, indent=2)
+        with job._lock:
+            job.status = status
+            job.result = result
+            job.error = error
+            job.finished = time.time()
+            job.stream = None
+        print(f"[service] job `{job.id}`: {status} ({round(job.finished - job.started, 3)}s)")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_http_server(service: AgentService, host: str = "127.0.0.1", port: int = 8765, socket_path: str = ""):
+    handler = _make_handler(service)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return UnixHTTPServer(socket_path, handler)
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    return httpd
+
+
+def _make_handler(service: AgentService):
+    class AgentServiceRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def address_string(self):
+            # Unix socket clients have no address
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            parts = self._get_path_parts()
+            if parts == ["health"]:
+                self._send_json({"status": "ok", **service.get_stats()})
+            elif parts == ["jobs"]:
+                with service._lock:
+                    jobs = list(service.jobs.values())
+                self._send_json({"jobs": [job.to_dict() for job in jobs]})
+            elif len(parts) in [2, 3] and parts[0] == "jobs":
+                job = service.get_job(parts[1])
+                if not job:
+                    self._send_json({"error": f"job `{parts[1]}` is not found"}, status=404)
+                elif len(parts) == 2:
+                    self._send_json(job.to_dict())
+                elif parts[2] == "events":
+                    with job._lock:
+                        events = list(job.events)
+                    self._send_json({"id": job.id, "events": events})
+                elif parts[2] == "result":
+                    if job.status not in finished_job_statuses:
+                        self._send_json({"id": job.id, "status": job.status, "error": "the job is not finished"}, status=409)
+                    else:
+                        self._send_json({"id": job.id, "status": job.status, "result": job.result, "error": job.error})
+                else:
+                    self._send_json({"error": f"not found: {self.path}"}, status=404)
+            else:
+                self._send_json({"error": f"not found: {self.path}"}, status=404)
+
+        def do_POST(self):
+            parts = self._get_path_parts()
+            if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+                self._cancel(parts[1])
+                return
+            if parts != ["jobs"]:
+                self._send_json({"error": f"not found: {self.path}"}, status=404)
+                return
+            length = int(self.headers.get("Content-Length", "0"))
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(body, dict):
+                    raise ValueError("the body must be a JSON object")
+                goal = body.get("goal", "")
+                if not goal and body.get("scenario_data"):
+                    from ciso_agent.batch import prepare_scenario
+
+                    if not body.get("workdir"):
+                        raise ValueError("`workdir` is required with `scenario_data`")
+                    goal = prepare_scenario({"scenario_data": body["scenario_data"]}, body["workdir"])
+                job = service.submit(
+                    goal=goal,
+                    job_id=str(body.get("id") or ""),
+                    priority=int(body.get("priority", 0)),
+                    timeout=float(body.get("timeout", 0)),
+                    output=body.get("output", ""),
+                )
+            except queue.Full as e:
+                self._send_json({"error": str(e)}, status=503)
+                return
+            except RuntimeError as e:
+                self._send_json({"error": str(e)}, status=503)
+                return
+            except (ValueError, TypeError, OSError) as e:
+                self._send_json({"error": str(e)}, status=400)
+                return
+            self._send_json(job.to_dict(), status=202)
+
+        def do_DELETE(self):
+            parts = self._get_path_parts()
+            if len(parts) == 2 and parts[0] == "jobs":
+                self._cancel(parts[1])
+                return
+            self._send_json({"error": f"not found: {self.path}"}, status=404)
+
+        def _cancel(self, job_id: str):
+            job = service.cancel(job_id)
+            if not job:
+                self._send_json({"error": f"job `{job_id}` is not found"}, status=404)
+                return
+            self._send_json(job.to_dict())
+
+        def _get_path_parts(self) -> list:
+            return [p for p in self.path.split("?")[0].split("/") if p]
+
+        def _send_json(self, data: dict, status: int = 200):
+            payload = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return AgentServiceRequestHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the CISO agent as a long-running service with a job queue")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("CISO_SERVICE_PORT", "8765")))
+    parser.add_argument("--socket", default=os.getenv("CISO_SERVICE_SOCKET", ""), help="listen on this Unix socket instead of TCP")
+    parser.add_argument("-j", "--workers", type=int, default=int(os.getenv("CISO_SERVICE_WORKERS", "2")))
+    parser.add_argument("--queue-size", type=int, default=int(os.getenv("CISO_SERVICE_QUEUE_SIZE", "100")))
+    args = parser.parse_args()
+
+    service = AgentService(workers=args.workers, queue_size=args.queue_size).start()
+    httpd = make_http_server(service, host=args.host, port=args.port, socket_path=args.socket)
+
+    def _shutdown(signum, frame):
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    address = args.socket or f"http://{args.host}:{args.port}"
+    print(f"CISO agent service is listening at {address} with {args.workers} workers")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.stop(timeout=30)
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
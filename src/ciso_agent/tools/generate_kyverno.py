@@ -16,7 +16,10 @@ import json
 import os
 from typing import Callable, Union
 
-from ciso_agent.llm import get_llm_params, call_llm, extract_code
+from ciso_agent.checkpoint import checkpointed_tool
+from ciso_agent.events import emit_artifact, instrumented_tool
+from ciso_agent.llm import generate_code, get_llm_params, llm_role_generator
+from ciso_agent.tools.policy_store import get_policy_store, policy_kind_kyverno
 from ciso_agent.tools.utils import trim_quote
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
@@ -53,6 +56,8 @@ class GenerateKyvernoTool(BaseTool):
         if "workdir" in kwargs:
             self.workdir = kwargs["workdir"]
 
+    @instrumented_tool
+    @checkpointed_tool(input_file_args=("current_policy_file",))
     def _run(self, sentence: Union[str, dict], policy_file: str, current_policy_file: str = "") -> str:
         print("GenerateKyvernoTool is called")
         policy_file = trim_quote(policy_file)
@@ -108,17 +113,34 @@ spec:
           namespace: "!default"
 ```
 """
-        model, api_url, api_key = get_llm_params()
-        print(f"Generating Kyverno policy code with '{model}'")
-        print("Prompt:", prompt)
-        answer = call_llm(prompt, model=model, api_key=api_key, api_url=api_url)
-        code = extract_code(answer, code_type="yaml")
+        # reuse a policy that was already deployed successfully for the same requirement.
+        # updating an existing policy depends on its contents, so the store is not used for it.
+        store = None
+        if not current_policy_file:
+            store = get_policy_store()
+        store_key = ""
+        code = None
+        if store:
+            store_key = store.make_key(kind=policy_kind_kyverno, requirement=spec)
+            code = store.get(store_key)
+            if code:
+                print("Found a validated policy in the policy store")
+
+        if not code:
+            model, api_url, api_key = get_llm_params(role=llm_role_generator)
+            print(f"Generating Kyverno policy code with '{model}'")
+            print("Prompt:", prompt)
+            code = generate_code(prompt, code_type="yaml", model=model, api_key=api_key, api_url=api_url, role=llm_role_generator)
+            if store:
+                store.put_candidate(store_key, code, meta={"requirement": spec})
+
         policy_file = policy_file.strip('"').strip("'").lstrip("{").rstrip("}")
         if not policy_file:
             policy_file = "policy.yaml"
         fpath = os.path.join(self.workdir, policy_file)
         with open(fpath, "w") as f:
             f.write(code)
+        emit_artifact(fpath)
         print("Code in answer:", code)
 
         tool_output = f"""The generated policy is below:
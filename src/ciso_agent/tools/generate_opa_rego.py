@@ -16,7 +16,11 @@ import json
 import os
 from typing import Callable, Union
 
-from ciso_agent.llm import get_llm_params, call_llm, extract_code
+from ciso_agent.checkpoint import checkpointed_tool
+from ciso_agent.events import emit_artifact, instrumented_tool
+from ciso_agent.llm import generate_code, get_llm_params, llm_role_generator
+from ciso_agent.tools.opa import check_rego_policy
+from ciso_agent.tools.policy_store import get_data_fingerprint, get_policy_store, policy_kind_rego
 from ciso_agent.tools.utils import trim_quote
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
@@ -48,6 +52,8 @@ class GenerateOPARegoTool(BaseTool):
         if "workdir" in kwargs:
             self.workdir = kwargs["workdir"]
 
+    @instrumented_tool
+    @checkpointed_tool(data_file_args=("input_file",))
     def _run(self, sentence: Union[str, dict], policy_file: str, input_file: str) -> str:
         print("GenerateOPARegoTool is called")
         policy_file = trim_quote(policy_file)
@@ -62,6 +68,7 @@ class GenerateOPARegoTool(BaseTool):
         prompt = f"""Generate a very simple OPA Rego policy to evaluate the following condition:
     {spec}
 """
+        input_fingerprint = ""
         if input_file:
             input_data = ""
             fpath = os.path.join(self.workdir, input_file)
@@ -71,6 +78,7 @@ class GenerateOPARegoTool(BaseTool):
 
             with open(fpath, "r") as f:
                 input_data = f.read()
+            input_fingerprint = get_data_fingerprint(input_data)
 
             truncated_msg = ""
             # truncate input_data to avoid too long input token
@@ -120,17 +128,29 @@ for this example input data.
 }
 ```
 """
-        model, api_url, api_key = get_llm_params()
-        print(f"Generating OPA Rego policy code with '{model}'")
-        print("Prompt:", prompt)
-        answer = call_llm(prompt, model=model, api_key=api_key, api_url=api_url)
-        code = extract_code(answer, code_type="rego")
         policy_file = policy_file.strip('"').strip("'").lstrip("{").rstrip("}")
         if not policy_file:
             policy_file = "policy.rego"
         opath = os.path.join(self.workdir, policy_file)
+
+        # reuse a policy that was already validated for the same requirement and input data shape
+        store = get_policy_store()
+        store_key = ""
+        code = None
+        if store:
+            store_key = store.make_key(kind=policy_kind_rego, requirement=spec, input_fingerprint=input_fingerprint)
+            code = store.get(store_key)
+            if code:
+                print("Found a validated policy in the policy store")
+
+        if not code:
+            code = self.generate_checked_policy(prompt)
+            if store:
+                store.put_candidate(store_key, code, meta={"requirement": spec})
+
         with open(opath, "w") as f:
             f.write(code)
+        emit_artifact(opath)
         print("Code in answer:", code)
 
         tool_output = f"""The generated policy is below:
@@ -141,3 +161,37 @@ for this example input data.
 This policy file has been saved at {opath}.
 """
         return tool_output
+
+    def generate_checked_policy(self, prompt: str) -> str:
+        """Generate a policy and re-prompt with the errors of `opa check --strict` until it compiles"""
+        model, api_url, api_key = get_llm_params(role=llm_role_generator)
+        max_retries = int(os.getenv("OPA_CHECK_MAX_RETRIES", "2"))
+        _prompt = prompt
+        for attempt in range(max_retries + 1):
+            print(f"Generating OPA Rego policy code with '{model}'")
+            print("Prompt:", _prompt)
+            code = generate_code(_prompt, code_type="rego", model=model, api_key=api_key, api_url=api_url, role=llm_role_generator)
+            errors = check_rego_policy(code)
+            if errors is None:
+                print("`opa` command is not found; the generated policy is not checked")
+                return code
+            if not errors:
+                return code
+            print(f"The generated policy has errors (attempt {attempt + 1}/{max_retries + 1}):\n{errors}")
+            _prompt = (
+                prompt
+                + f"""
+The following policy was generated before, but `opa check --strict` reported errors.
+```rego
+{code}
+```
+
+Errors:
+```
+{errors}
+```
+
+Fix the errors and generate the whole policy again.
+"""
+            )
+        raise ValueError(f"failed to generate a Rego policy which compiles after {max_retries + 1} attempts; the last errors:\n{errors}")
@@ -16,7 +16,9 @@ import json
 import os
 from typing import Callable, Union
 
-from ciso_agent.llm import get_llm_params, call_llm, extract_code
+from ciso_agent.checkpoint import checkpointed_tool
+from ciso_agent.events import emit_artifact, instrumented_tool
+from ciso_agent.llm import generate_code, get_llm_params, llm_role_generator
 from ciso_agent.tools.utils import trim_quote
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
@@ -50,6 +52,8 @@ class GeneratePlaybookTool(BaseTool):
         if "workdir" in kwargs:
             self.workdir = kwargs["workdir"]
 
+    @instrumented_tool
+    @checkpointed_tool()
     def _run(self, sentence: Union[str, dict], playbook_file: str = "playbook.yml") -> str:
         print("GeneratePlaybookTool is called")
         playbook_file = trim_quote(playbook_file)
@@ -85,17 +89,17 @@ Points:
 - If you need command result as a collected data, you should add `ignore_errors: true` to the task.
 - Use Ansible module instead of command, if possible.
 """
-        model, api_url, api_key = get_llm_params()
+        model, api_url, api_key = get_llm_params(role=llm_role_generator)
         print(f"Generating Playbook code with '{model}'")
         print("Prompt:", prompt)
-        answer = call_llm(prompt, model=model, api_key=api_key, api_url=api_url)
-        code = extract_code(answer, code_type="yaml")
+        code = generate_code(prompt, code_type="yaml", model=model, api_key=api_key, api_url=api_url, role=llm_role_generator)
         playbook_file = playbook_file.strip('"').strip("'").lstrip("{").rstrip("}")
         if not playbook_file:
             playbook_file = "playbook.yaml"
         fpath = os.path.join(self.workdir, playbook_file)
         with open(fpath, "w") as f:
             f.write(code)
+        emit_artifact(fpath)
         print("Code in answer:", code)
 
         tool_output = f"""The generated Playbook is below:
@@ -0,0 +1,599 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A local OPA server backend for the Rego evaluation.
+
+With `OPA_BACKEND=server`, one `opa run --server` process is started per workdir (or per process with
+`OPA_SERVER_SCOPE=process`). Policies are pushed through the Policy API once per content hash and
+evaluated through the Data API over a kept-alive connection, so an evaluation does not spawn a process
+or compile the policy again. If the server cannot be used, the tools fall back to `opa eval`.
+"""
+
+import atexit
+import collections
+import hashlib
+import http.client
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Optional
+
+import yaml
+
+from ciso_agent.tracing import traced_subprocess_run
+
+opa_backend_subprocess = "subprocess"
+opa_backend_server = "server"
+
+# seconds to wait for the server to become healthy
+server_start_timeout = 10.0
+
+# fields tried in order for the ID of a bulk item (besides Kubernetes `metadata`)
+bulk_id_fields = ["id", "name", "host", "hostname"]
+
+# builtins whose result changes between evaluations of the same policy and input; such policies are not cached
+nondeterministic_builtin_pattern = re.compile(r"\b(time\.now_ns|http\.send|rand\.|uuid\.rfc4122|opa\.runtime|net\.lookup_ip_addr)")
+# an eviction removes the disk entries down to this ratio of `max_disk_entries`, so that the following puts do not list again
+eval_cache_evict_low_water = 0.9
+
+
+def get_opa_backend() -> str:
+    backend = os.getenv("OPA_BACKEND", opa_backend_subprocess).lower()
+    if backend not in [opa_backend_subprocess, opa_backend_server]:
+        raise ValueError(f"Env variable `OPA_BACKEND` must be `subprocess` or `server`, but got `{backend}`")
+    return backend
+
+
+def get_policy_id(policy: str) -> str:
+    return "ciso-" + hashlib.sha256(policy.encode("utf-8")).hexdigest()[:32]
+
+
+def parse_input_data(input_data: str):
+    """`opa eval --stdin-input` accepts JSON or YAML, so does this"""
+    try:
+        return json.loads(input_data)
+    except ValueError:
+        return yaml.safe_load(input_data)
+
+
+class OPAServerError(Exception):
+    """The server is not reachable; the caller should fall back to `opa eval`"""
+
+    pass
+
+
+class OPAServer(object):
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, opa_path: str = "opa"):
+        self.host = host
+        self.port = port or _get_free_port(host)
+        self.opa_path = opa_path
+        self.proc = None
+        # policy ID per package; modules of the same package would be merged, so the previous version is replaced
+        self._package_policies = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start(self):
+        cmd = [self.opa_path, "run", "--server", "--addr", f"{self.host}:{self.port}", "--log-level", "error"]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + server_start_timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise OPAServerError(f"`opa run --server` exited with code {self.proc.returncode}")
+            try:
+                status, _ = self.request("GET", "/health")
+                if status == 200:
+                    return self
+            except OPAServerError:
+                pass
+            time.sleep(0.05)
+        self.stop()
+        raise OPAServerError(f"`opa run --server` did not become healthy in {server_start_timeout} seconds")
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+    def is_alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None, content_type: str = "application/json"):
+        """Send a request over the kept-alive connection of this thread; returns `(status, parsed JSON body)`"""
+        headers = {"Content-Type": content_type} if body is not None else {}
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+                self._local.conn = conn
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                return resp.status, _parse_response(data)
+            except (OSError, http.client.HTTPException) as e:
+                # the kept-alive connection may have been closed by the server; reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt == 1:
+                    raise OPAServerError(f"failed to call the OPA server: {e}")
+
+    def put_policy(self, policy: str, pkg_name: str) -> str:
+        """Push the policy unless the same content is already loaded. Caller holds `self._lock`."""
+        policy_id = get_policy_id(policy)
+        old_policy_id = self._package_policies.get(pkg_name)
+        if old_policy_id == policy_id:
+            return policy_id
+        if old_policy_id:
+            self.request("DELETE", f"/v1/policies/{old_policy_id}")
+            del self._package_policies[pkg_name]
+        status, data = self.request("PUT", f"/v1/policies/{policy_id}", body=policy.encode("utf-8"), content_type="text/plain")
+        if status != 200:
+            raise ValueError(f"failed to load the rego policy; error details:\n{json.dumps(data, indent=2)}")
+        self._package_policies[pkg_name] = policy_id
+        return policy_id
+
+    def evaluate(self, policy: str, pkg_name: str, input_data: str):
+        """Return the value of `data.<pkg_name>` for the input, like `opa eval --data <policy> --stdin-input 'data.<pkg_name>'`"""
+        try:
+            input_value = parse_input_data(input_data) if input_data else None
+        except ValueError as e:
+            raise ValueError(f"failed to parse the input data as JSON or YAML: {e}")
+        body = json.dumps({"input": input_value}).encode("utf-8")
+        data_path = "/v1/data/" + pkg_name.replace(".", "/")
+        # keep the policy of the package loaded until the evaluation is done
+        with self._lock:
+            self.put_policy(policy, pkg_name)
+            status, data = self.request("POST", data_path, body=body)
+        if status != 200:
+            raise ValueError(f"failed to evaluate the rego policy; error details:\n{json.dumps(data, indent=2)}")
+        if "result" not in data:
+            raise ValueError(f"`data.{pkg_name}` is undefined for the input; raw output: {json.dumps(data)}")
+        return data["result"]
+
+    def query(self, policies: list, query: str, input_value) -> list:
+        """Run an ad-hoc query with the policies (`(policy, package name)` pairs) loaded (Query API);
+        returns the list of variable bindings"""
+        body = json.dumps({"query": query, "input": input_value}).encode("utf-8")
+        with self._lock:
+            for policy, pkg_name in policies:
+                self.put_policy(policy, pkg_name)
+            status, data = self.request("POST", "/v1/query", body=body)
+        if status != 200:
+            raise ValueError(f"failed to run the query; error details:\n{json.dumps(data, indent=2)}")
+        return data.get("result") or []
+
+
+def run_opa_eval(data_files: list, query: str, input_data: str, workdir: str = "") -> list:
+    """Run `opa eval` once with the data files and the input from stdin; returns the list of results (expressions and bindings)"""
+    cmd = ["opa", "eval", "--format", "json"]
+    for data_file in data_files:
+        cmd += ["--data", data_file]
+    cmd += ["--stdin-input", query]
+    try:
+        proc = traced_subprocess_run(cmd, cwd=workdir or None, input=input_data, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    except FileNotFoundError:
+        raise ValueError("`opa` command is not found")
+    if proc.returncode != 0:
+        raise ValueError(f"failed to run `opa eval` command; error details:\nSTDOUT: {proc.stdout}\nSTDERR: {proc.stderr}")
+    output = json.loads(proc.stdout)
+    if not output.get("result"):
+        raise ValueError(f"`result` field in the output from `opa eval` command has no contents; raw output: {proc.stdout}")
+    return output["result"]
+
+
+def get_bulk_items(data, items_key: str = "", id_field: str = "") -> list:
+    """Return `[{"id": ..., "input": ...}]` for the items of a collection.
+
+    The collection is `data[items_key]` (a dotted path), otherwise the Kubernetes list `items`,
+    a top-level list, or a map of ID to item (e.g. host name to the data collected on the host).
+    """
+    collection = data
+    if items_key:
+        for key in items_key.split("."):
+            if not isinstance(collection, dict) or key not in collection:
+                raise ValueError(f"`{items_key}` is not found in the input data")
+            collection = collection[key]
+    elif isinstance(data, dict) and isinstance(data.get("items"), list):
+        collection = data["items"]
+
+    if isinstance(collection, dict):
+        return [{"id": str(key), "input": item} for key, item in collection.items()]
+    if not isinstance(collection, list):
+        raise ValueError(f"the input data must be a list or a map of items, but got {type(collection).__name__}")
+    return [{"id": get_item_id(item, index=i, id_field=id_field), "input": item} for i, item in enumerate(collection)]
+
+
+def get_item_id(item, index: int, id_field: str = "") -> str:
+    if not isinstance(item, dict):
+        return str(index)
+    if id_field:
+        val = item
+        for key in id_field.split("."):
+            val = val.get(key) if isinstance(val, dict) else None
+        return str(val) if val is not None else str(index)
+    metadata = item.get("metadata")
+    if isinstance(metadata, dict) and metadata.get("name"):
+        return f"{metadata['namespace']}/{metadata['name']}" if metadata.get("namespace") else metadata["name"]
+    for key in bulk_id_fields:
+        if isinstance(item.get(key), (str, int)):
+            return str(item[key])
+    return str(index)
+
+
+def build_bulk_query(pkg_name: str) -> str:
+    """A query which evaluates `data.<pkg_name>` with each `input.items[_].input` as the input"""
+    return f'bulk_results := [{{"id": item.id, "value": value}} | item := input.items[_]; value := data.{pkg_name} with input as item.input]'
+
+
+def summarize_bulk_results(item_ids: list, bulk_results: list) -> dict:
+    """Compact per-item verdicts: `result` of the policy, `null` if undefined.
+    If the policy has no `result` rule at all (no item has it), the whole value of the package is the verdict."""
+    values = {r["id"]: r["value"] for r in bulk_results}
+    has_result_rule = any([isinstance(v, dict) and "result" in v for v in values.values()])
+    results = []
+    for item_id in item_ids:
+        value = values.get(item_id)
+        if value is None or value == {}:
+            verdict = None
+        elif has_result_rule:
+            verdict = value.get("result") if isinstance(value, dict) else None
+        else:
+            verdict = value
+        results.append({"id": item_id, "result": verdict})
+    verdicts = [r["result"] for r in results]
+    summary = {
+        "total": len(results),
+        "passed": len([v for v in verdicts if v is True]),
+        "failed": len([v for v in verdicts if v is False]),
+        "undefined": len([v for v in verdicts if v is None]),
+    }
+    return {"summary": summary, "results": results}
+
+
+def make_unique_item_ids(items: list) -> list:
+    """Suffix the duplicated IDs (e.g. the same name in different places) with the position; unique IDs are kept"""
+    counts = collections.Counter([item["id"] for item in items])
+    return [dict(item, id=f"{item['id']}#{i}") if counts[item["id"]] > 1 else item for i, item in enumerate(items)]
+
+
+def evaluate_bulk(policy_file: str, items: list, workdir: str = "") -> dict:
+    """Evaluate the policy for each item (`{"id": ..., "input": ...}`) in a single OPA pass"""
+    fpath = os.path.join(workdir, policy_file)
+    with open(fpath, "r") as f:
+        policy = f.read()
+    pkg_name = get_package_name(policy)
+    if not pkg_name:
+        raise ValueError("`package` must be defined in the rego policy file")
+    items = make_unique_item_ids(items)
+    input_value = {"items": items}
+    query = build_bulk_query(pkg_name)
+
+    bulk_results = None
+    if get_opa_backend() == opa_backend_server:
+        server = get_opa_server(workdir=workdir)
+        if server:
+            try:
+                bindings = server.query(policies=[(policy, pkg_name)], query=query, input_value=input_value)
+                bulk_results = bindings[0]["bulk_results"] if bindings else []
+            except OPAServerError as e:
+                print(f"[opa] {e}; falling back to `opa eval`")
+    if bulk_results is None:
+        results = run_opa_eval([policy_file], query=query, input_data=json.dumps(input_value), workdir=workdir)
+        bulk_results = results[0].get("bindings", {}).get("bulk_results", [])
+    return summarize_bulk_results([item["id"] for item in items], bulk_results)
+
+
+_opa_major_version = None
+
+
+def get_opa_major_version() -> int:
+    global _opa_major_version
+
+    if _opa_major_version is None:
+        proc = subprocess.run(["opa", "version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        match = re.search(r"^Version:\s*v?(\d+)\.", proc.stdout, flags=re.M)
+        _opa_major_version = int(match.group(1)) if match else 1
+    return _opa_major_version
+
+
+def check_rego_policy(policy: str) -> Optional[str]:
+    """Parse and type-check the policy with `opa check --strict` (Rego v1 syntax).
+
+    Returns the error messages, an empty string if the policy compiles, or None if `opa` is not installed.
+    """
+    if not shutil.which("opa"):
+        return None
+    cmd = ["opa", "check", "--strict"]
+    if get_opa_major_version() < 1:
+        cmd.append("--v1-compatible")
+    with tempfile.TemporaryDirectory(prefix="ciso-opa-check-") as tmpdir:
+        fpath = os.path.join(tmpdir, "policy.rego")
+        with open(fpath, "w") as f:
+            f.write(policy)
+        proc = traced_subprocess_run(cmd + [fpath], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if proc.returncode == 0:
+        return ""
+    errors = (proc.stderr + proc.stdout).strip() or f"`opa check` exited with code {proc.returncode}"
+    return errors.replace(fpath, "policy.rego")
+
+
+def get_requirement_package_name(requirement_id: str) -> str:
+    return "check_" + re.sub(r"[^A-Za-z0-9_]", "_", requirement_id)
+
+
+def rename_package(policy: str, pkg_name: str) -> str:
+    """Move the policy to another package; references to its own package (`data.<old>`) are renamed too"""
+    old_pkg_name = get_package_name(policy)
+    if not old_pkg_name:
+        raise ValueError("`package` must be defined in the rego policy file")
+    policy = re.sub(r"^(\s*)package\s+" + re.escape(old_pkg_name) + r"\s*$", lambda m: f"{m.group(1)}package {pkg_name}", policy, count=1, flags=re.M)
+    return re.sub(r"\bdata\." + re.escape(old_pkg_name) + r"\b", f"data.{pkg_name}", policy)
+
+
+def build_multi_query(pkg_names: dict) -> str:
+    """A query which returns the map of requirement ID to the value of its package"""
+    entries = ", ".join([f"{json.dumps(req_id)}: data.{pkg_name}" for req_id, pkg_name in pkg_names.items()])
+    return f"multi_results := {{{entries}}}"
+
+
+def evaluate_multi(policy_files: dict, input_data: str, workdir: str = "") -> dict:
+    """Evaluate many policies (requirement ID to the policy file) against one input in a single OPA pass.
+
+    Generated policies all use `package check`, so each one is loaded as `package check_<requirement ID>`.
+    """
+    policies = []
+    pkg_names = {}
+    for req_id, policy_file in policy_files.items():
+        with open(os.path.join(workdir, policy_file), "r") as f:
+            policy = f.read()
+        pkg_name = get_requirement_package_name(str(req_id))
+        if pkg_name in pkg_names.values():
+            raise ValueError(f"requirement ID `{req_id}` conflicts with another ID after it is converted to the package name `{pkg_name}`")
+        pkg_names[str(req_id)] = pkg_name
+        policies.append((rename_package(policy, pkg_name), pkg_name))
+    query = build_multi_query(pkg_names)
+
+    values = None
+    if get_opa_backend() == opa_backend_server:
+        server = get_opa_server(workdir=workdir)
+        if server:
+            try:
+                input_value = parse_input_data(input_data) if input_data else None
+                bindings = server.query(policies=policies, query=query, input_value=input_value)
+                values = bindings[0]["multi_results"] if bindings else {}
+            except OPAServerError as e:
+                print(f"[opa] {e}; falling back to `opa eval`")
+    if values is None:
+        with tempfile.TemporaryDirectory(prefix="ciso-opa-multi-") as tmpdir:
+            data_files = []
+            for policy, pkg_name in policies:
+                fpath = os.path.join(tmpdir, f"{pkg_name}.rego")
+                with open(fpath, "w") as f:
+                    f.write(policy)
+                data_files.append(fpath)
+            results = run_opa_eval(data_files, query=query, input_data=input_data, workdir=workdir)
+        values = results[0].get("bindings", {}).get("multi_results", {})
+
+    verdicts = {req_id: value.get("result") if isinstance(value, dict) else value for req_id, value in values.items()}
+    return {"results": verdicts, "values": values}
+
+
+def get_package_name(policy: str) -> str:
+    prefix = "package "
+    for line in policy.splitlines():
+        _line = line.strip()
+        if _line.startswith(prefix):
+            return _line[len(prefix) :].strip()
+    return ""
+
+
+class OPAEvalCache(object):
+    """LRU cache of evaluation results keyed by the SHA-256 of the policy, the input and the query.
+
+    The key is computed from the file contents, so an entry is not used once either file changes.
+    If `cache_dir` is set, the entries are also stored there as JSON files and survive the process;
+    above `max_disk_entries` files, the least recently used ones (by access time) are evicted.
+    Policies using non-deterministic builtins (see `is_cacheable_policy()`) must not be cached.
+    """
+
+    def __init__(self, max_entries: int = 256, cache_dir: str = "", max_disk_entries: int = 4096):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # number of files in `cache_dir`; None until the first put lists it
+        self._disk_entries = None
+        self._disk_lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(policy: str, input_data: str, query: str) -> str:
+        hashes = [hashlib.sha256(v.encode("utf-8")).hexdigest() for v in [policy, input_data, query]]
+        return hashlib.sha256("\n".join(hashes).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.cache_dir:
+            fpath = os.path.join(self.cache_dir, f"{key}.json")
+            try:
+                with open(fpath, "r") as f:
+                    entry = json.load(f)
+                # access time is the LRU clock of the disk store
+                os.utime(fpath)
+            except (OSError, ValueError):
+                entry = None
+            if entry is not None:
+                self._put_memory(key, entry)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: dict):
+        self._put_memory(key, entry)
+        if self.cache_dir:
+            fpath = os.path.join(self.cache_dir, f"{key}.json")
+            is_new = not os.path.exists(fpath)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, fpath)
+            if self.max_disk_entries:
+                self._evict_if_needed(added=1 if is_new else 0)
+
+    def _evict_if_needed(self, added: int):
+        # the directory is listed only for the first put and when the running count goes over the limit
+        with self._disk_lock:
+            if self._disk_entries is not None:
+                self._disk_entries += added
+                if self._disk_entries <= self.max_disk_entries:
+                    return
+            self.evict(target_entries=int(self.max_disk_entries * eval_cache_evict_low_water))
+
+    def evict(self, target_entries: int = 0):
+        """Remove the least recently used disk entries above `target_entries` (default: `max_disk_entries`)"""
+        target_entries = target_entries or self.max_disk_entries
+        fnames = [fname for fname in os.listdir(self.cache_dir) if fname.endswith(".json")]
+        self._disk_entries = len(fnames)
+        if not self.max_disk_entries or len(fnames) <= self.max_disk_entries:
+            return
+        entries = []
+        for fname in fnames:
+            fpath = os.path.join(self.cache_dir, fname)
+            try:
+                entries.append((os.stat(fpath).st_atime, fpath))
+            except OSError:
+                continue
+        entries.sort()
+        for _, fpath in entries[: len(entries) - target_entries]:
+            try:
+                os.remove(fpath)
+                self._disk_entries -= 1
+            except OSError:
+                pass
+
+    def get_stats(self, hit: bool) -> dict:
+        with self._lock:
+            return {"hit": hit, "hits": self.hits, "misses": self.misses}
+
+    def _put_memory(self, key: str, entry: dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def is_cacheable_policy(policy: str) -> bool:
+    """False if the policy calls a builtin like `time.now_ns` or `http.send`, whose result is not a function of the input"""
+    return not nondeterministic_builtin_pattern.search(policy)
+
+
+_eval_cache = None
+_eval_cache_config = None
+_eval_cache_lock = threading.Lock()
+
+
+def get_opa_eval_cache() -> Optional[OPAEvalCache]:
+    """Return the evaluation result cache, or None if it is disabled.
+
+    - OPA_EVAL_CACHE_SIZE: max number of results kept in memory (default 256; 0 disables the cache)
+    - OPA_EVAL_CACHE_DIR: directory to persist the results (optional)
+    - OPA_EVAL_CACHE_DISK_SIZE: max number of results kept in the directory (default 4096; 0: unlimited)
+    """
+    global _eval_cache, _eval_cache_config
+
+    max_entries = int(os.getenv("OPA_EVAL_CACHE_SIZE", "256"))
+    if max_entries <= 0:
+        return None
+    config = (max_entries, os.getenv("OPA_EVAL_CACHE_DIR", ""), int(os.getenv("OPA_EVAL_CACHE_DISK_SIZE", "4096")))
+    with _eval_cache_lock:
+        if _eval_cache is None or _eval_cache_config != config:
+            _eval_cache = OPAEvalCache(max_entries=config[0], cache_dir=config[1], max_disk_entries=config[2])
+            _eval_cache_config = config
+    return _eval_cache
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def get_opa_server(workdir: str = "") -> Optional[OPAServer]:
+    """Return the running server for the workdir (or the process), starting it on first use.
+    None is returned if `opa` is not installed or the server cannot be started."""
+    scope = os.getenv("OPA_SERVER_SCOPE", "workdir").lower()
+    key = "" if scope == "process" else os.path.abspath(workdir or ".")
+    with _servers_lock:
+        server = _servers.get(key)
+        if server and server.is_alive():
+            return server
+        opa_path = shutil.which("opa")
+        if not opa_path:
+            print("[opa] `opa` command is not found; using `opa eval` instead of the server")
+            return None
+        try:
+            server = OPAServer(opa_path=opa_path).start()
+        except (OSError, OPAServerError) as e:
+            print(f"[opa] failed to start the OPA server; using `opa eval` instead: {e}")
+            return None
+        _servers[key] = server
+        return server
+
+
+@atexit.register
+def stop_opa_servers(workdir: str = ""):
+    """Stop the servers of the workdir and its sub-workdirs (the parallel branches), or all servers if `workdir` is empty.
+    The server of `OPA_SERVER_SCOPE=process` is stopped only with all servers."""
+    with _servers_lock:
+        if workdir:
+            root = os.path.abspath(workdir)
+            keys = [k for k in _servers if k and (k == root or k.startswith(root + os.sep))]
+        else:
+            keys = list(_servers)
+        for key in keys:
+            _servers.pop(key).stop()
+
+
+def _parse_response(data: bytes) -> dict:
+    if not data:
+        return {}
+    try:
+        return json.loads(data)
+    except ValueError:
+        return {"raw": data.decode("utf-8", errors="replace")}
+
+
+def _get_free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
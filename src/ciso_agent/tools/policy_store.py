@@ -0,0 +1,192 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from typing import Optional, Union
+
+policy_kind_rego = "rego"
+policy_kind_kyverno = "kyverno"
+
+# deeper paths rarely matter for the policy logic and make the fingerprint too sensitive
+max_shape_depth = 6
+
+# maps with arbitrary keys (e.g. `metadata.labels.<key>`); their keys are not part of the shape
+free_form_map_keys = ["labels", "annotations", "data", "stringData", "binaryData", "matchLabels", "nodeSelector"]
+schema_field_pattern = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def normalize_requirement(requirement: Union[str, dict]) -> str:
+    if isinstance(requirement, dict):
+        requirement = json.dumps(requirement, sort_keys=True)
+    text = str(requirement).lower()
+    text = re.sub(r"[^a-z0-9]+", " ", text)
+    return " ".join(text.split())
+
+
+def get_data_shape(data, path: str = "", depth: int = 0, shape: Optional[set] = None) -> set:
+    """Return a set of `path:type` strings of the data. List indices are collapsed to `[]`,
+    and free-form maps (labels, annotations, host names, ...) to `{}` with the shapes of their values merged."""
+    if shape is None:
+        shape = set()
+    type_name = type(data).__name__
+    shape.add(f"{path}:{type_name}")
+    if depth >= max_shape_depth:
+        return shape
+    if isinstance(data, dict):
+        if is_free_form_map(path, data):
+            for val in data.values():
+                get_data_shape(val, path=f"{path}{{}}", depth=depth + 1, shape=shape)
+        else:
+            for key, val in data.items():
+                get_data_shape(val, path=f"{path}.{key}", depth=depth + 1, shape=shape)
+    elif isinstance(data, list):
+        for val in data:
+            get_data_shape(val, path=f"{path}[]", depth=depth + 1, shape=shape)
+    return shape
+
+
+def is_free_form_map(path: str, data: dict) -> bool:
+    if path.rsplit(".", 1)[-1] in free_form_map_keys:
+        return True
+    return any([not schema_field_pattern.match(str(key)) for key in data])
+
+
+def get_resource_kinds(data) -> set:
+    """`apiVersion/kind` of the Kubernetes resources in the data (a resource or a list of them); empty for other data"""
+    kinds = set()
+    candidates = data if isinstance(data, list) else [data]
+    for obj in candidates:
+        if not isinstance(obj, dict) or not isinstance(obj.get("kind"), str) or not isinstance(obj.get("apiVersion"), str):
+            continue
+        kinds.add(f"{obj['apiVersion']}/{obj['kind']}")
+        items = obj.get("items")
+        if isinstance(items, list):
+            kinds |= get_resource_kinds(items)
+    return kinds
+
+
+def get_data_fingerprint(data_str: str) -> str:
+    """Fingerprint of the input data for the policy store.
+
+    Kubernetes resources are identified only by their `apiVersion/kind`, so optional fields and label keys
+    which differ between clusters do not change it. Other data is fingerprinted by its shape (`get_data_shape()`).
+    """
+    if not data_str:
+        return ""
+    try:
+        data = json.loads(data_str)
+    except ValueError:
+        # non-JSON input (e.g. plain text) is evaluated as a string
+        return "text"
+    kinds = get_resource_kinds(data)
+    shape = sorted(kinds) if kinds else sorted(get_data_shape(data))
+    return hashlib.sha256("\n".join(shape).encode("utf-8")).hexdigest()
+
+
+def get_policy_hash(policy: str) -> str:
+    return hashlib.sha256(policy.strip().encode("utf-8")).hexdigest()
+
+
+class PolicyStore(object):
+    """Store of generated policies keyed by the normalized requirement and the input data shape.
+
+    A generated policy is first saved as a candidate. It becomes a hit for later lookups
+    only after it is validated (e.g. evaluated / deployed successfully), and it is removed
+    again when a validation of the same policy fails.
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.policy_dir = os.path.join(store_dir, "policies")
+        self.candidate_dir = os.path.join(store_dir, "candidates")
+        self.index_dir = os.path.join(store_dir, "index")
+        for d in [self.policy_dir, self.candidate_dir, self.index_dir]:
+            os.makedirs(d, exist_ok=True)
+
+    @staticmethod
+    def make_key(kind: str, requirement: Union[str, dict], input_fingerprint: str = "") -> str:
+        key_str = "\n".join([kind, normalize_requirement(requirement), input_fingerprint])
+        return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._read(os.path.join(self.policy_dir, f"{key}.json"))
+        if not entry:
+            return None
+        return entry.get("policy")
+
+    def put_candidate(self, key: str, policy: str, meta: Optional[dict] = None):
+        entry = {"key": key, "policy": policy, "created": time.time(), "meta": meta or {}}
+        self._write(os.path.join(self.candidate_dir, f"{get_policy_hash(policy)}.json"), entry)
+
+    def mark_validated(self, policy: str) -> bool:
+        policy_hash = get_policy_hash(policy)
+        candidate_path = os.path.join(self.candidate_dir, f"{policy_hash}.json")
+        entry = self._read(candidate_path)
+        if not entry:
+            return False
+        entry["validated"] = time.time()
+        self._write(os.path.join(self.policy_dir, f"{entry['key']}.json"), entry)
+        self._write(os.path.join(self.index_dir, f"{policy_hash}.json"), {"key": entry["key"]})
+        self._remove(candidate_path)
+        return True
+
+    def invalidate(self, policy: str) -> bool:
+        policy_hash = get_policy_hash(policy)
+        self._remove(os.path.join(self.candidate_dir, f"{policy_hash}.json"))
+        index_path = os.path.join(self.index_dir, f"{policy_hash}.json")
+        index = self._read(index_path)
+        if not index:
+            return False
+        self._remove(os.path.join(self.policy_dir, f"{index['key']}.json"))
+        self._remove(index_path)
+        return True
+
+    def _read(self, fpath: str) -> Optional[dict]:
+        try:
+            with open(fpath, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, fpath: str, entry: dict):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(fpath), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, fpath)
+
+    def _remove(self, fpath: str):
+        try:
+            os.remove(fpath)
+        except OSError:
+            pass
+
+
+_policy_store = None
+
+
+def get_policy_store() -> Optional[PolicyStore]:
+    """Return the policy store at `POLICY_STORE_DIR`, or None if the env variable is not set"""
+    global _policy_store
+
+    store_dir = os.getenv("POLICY_STORE_DIR", "")
+    if not store_dir:
+        return None
+    if _policy_store is None or _policy_store.store_dir != store_dir:
+        _policy_store = PolicyStore(store_dir=store_dir)
+    return _policy_store
@@ -13,12 +13,16 @@
 # limitations under the License.
 
 import os
+import shlex
 import subprocess
 from typing import Callable
 
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
+from ciso_agent.events import emit_artifact, instrumented_tool
+from ciso_agent.tools.policy_store import get_policy_store
 from ciso_agent.tools.utils import trim_quote
+from ciso_agent.tracing import traced_subprocess_run
 
 
 class RunKubectlToolInput(BaseModel):
@@ -63,6 +67,8 @@ Hint:
         if "read_only" in kwargs:
             self.read_only = kwargs["read_only"]
 
+    # not checkpointed: the result depends on the live cluster state, so a retried run must execute it again
+    @instrumented_tool
     def _run(self, args: str, output_file: str, return_output: str = "False", script_file: str = "") -> str:
         print("RunKubectlTool is called")
         output_file = trim_quote(output_file)
@@ -86,7 +92,7 @@ Hint:
 
         cmd_str = f"kubectl {args}"
         print("[DEBUG] Running this command:", cmd_str)
-        proc = subprocess.run(
+        proc = traced_subprocess_run(
             cmd_str,
             shell=True,
             cwd=self.workdir,
@@ -110,10 +116,13 @@ Hint:
         # if proc.returncode != 0:
         #     raise ValueError(f"failed to run a playbook; stdout: {proc.stdout}, stderr: {proc.stderr}")
 
+        self._update_policy_store(args=args, returncode=proc.returncode)
+
         if output_file:
             opath = os.path.join(self.workdir, output_file)
             with open(opath, "w") as f:
                 f.write(proc.stdout)
+            emit_artifact(opath)
 
         return_output_bool = False
         if return_output:
@@ -139,7 +148,44 @@ Hint:
             with open(spath, "w") as f:
                 f.write(script_body)
             os.chmod(spath, 0o755)
+            emit_artifact(spath)
             
             return_val["script_file"] = spath
 
         return return_val
+
+    def _update_policy_store(self, args: str, returncode: int):
+        # a generated policy is validated when it is deployed to the cluster successfully
+        store = get_policy_store()
+        if not store:
+            return
+        for fpath in get_applied_files(args=args):
+            if not os.path.isabs(fpath):
+                fpath = os.path.join(self.workdir, fpath)
+            if not os.path.isfile(fpath):
+                continue
+            with open(fpath, "r") as f:
+                policy = f.read()
+            if returncode == 0:
+                store.mark_validated(policy)
+            else:
+                store.invalidate(policy)
+        return
+
+
+def get_applied_files(args: str) -> list:
+    try:
+        parts = shlex.split(args)
+    except ValueError:
+        return []
+    if not parts or parts[0] not in ["apply", "create"]:
+        return []
+    files = []
+    for i, part in enumerate(parts):
+        if part in ["-f", "--filename"] and i + 1 < len(parts):
+            files.append(parts[i + 1])
+        elif part.startswith("--filename="):
+            files.append(part[len("--filename=") :])
+        elif part.startswith("-f="):
+            files.append(part[len("-f=") :])
+    return files
@@ -15,11 +15,27 @@
 import json
 import os
 import subprocess
-from typing import Callable
+from typing import Callable, Union
 
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
+from ciso_agent.checkpoint import checkpointed_tool
+from ciso_agent.events import instrumented_tool
+from ciso_agent.tools.opa import (
+    OPAServerError,
+    evaluate_bulk,
+    evaluate_multi,
+    get_bulk_items,
+    get_opa_backend,
+    get_opa_eval_cache,
+    get_opa_server,
+    is_cacheable_policy,
+    opa_backend_server,
+    parse_input_data,
+)
+from ciso_agent.tools.policy_store import get_policy_store
 from ciso_agent.tools.utils import trim_quote
+from ciso_agent.tracing import traced_subprocess_run
 
 
 class RunOPARegoToolInput(BaseModel):
@@ -34,7 +50,7 @@ class RunOPARegoTool(BaseTool):
 
     args_schema: type[BaseModel] = RunOPARegoToolInput
 
-    # disable cache
+    # disable the crewAI cache, which is keyed only by the file names; the results are cached by the file contents in `_eval()`
     cache_function: Callable = lambda _args, _result: False
 
     workdir: str = ""
@@ -45,23 +61,72 @@ class RunOPARegoTool(BaseTool):
         if "workdir" in kwargs:
             self.workdir = kwargs["workdir"]
 
+    @instrumented_tool
+    @checkpointed_tool(input_file_args=("policy_file", "input_file"))
     def _run(self, policy_file: str, input_file: str) -> str:
         print("RunOPARegoTool is called")
         policy_file = trim_quote(policy_file)
         input_file = trim_quote(input_file)
 
+        store = get_policy_store()
+        if not store:
+            return self._eval(policy_file=policy_file, input_file=input_file)
+
+        policy = ""
+        with open(os.path.join(self.workdir, policy_file), "r") as f:
+            policy = f.read()
+        try:
+            eval_result = self._eval(policy_file=policy_file, input_file=input_file)
+        except ValueError:
+            # do not reuse a policy that failed to be evaluated
+            store.invalidate(policy)
+            raise
+        store.mark_validated(policy)
+        return eval_result
+
+    def _eval(self, policy_file: str, input_file: str) -> dict:
         fpath = os.path.join(self.workdir, policy_file)
         rego_pkg_name = get_rego_main_package_name(rego_path=fpath)
         if not rego_pkg_name:
             raise ValueError("`package` must be defined in the rego policy file")
 
+        with open(fpath, "r") as f:
+            policy = f.read()
+
         input_data = ""
         ipath = os.path.join(self.workdir, input_file)
         with open(ipath, "r") as f:
             input_data = f.read()
 
+        cache = get_opa_eval_cache()
+        if not cache or not is_cacheable_policy(policy):
+            return self._eval_opa(policy_file=policy_file, policy=policy, rego_pkg_name=rego_pkg_name, input_data=input_data)
+
+        # keyed by the contents, so that an edited policy or re-collected input is evaluated again
+        cache_key = cache.make_key(policy=policy, input_data=input_data, query=f"data.{rego_pkg_name}")
+        entry = cache.get(cache_key)
+        if entry is not None:
+            eval_result = dict(entry, cache=cache.get_stats(hit=True))
+            print(eval_result)
+            return eval_result
+        eval_result = self._eval_opa(policy_file=policy_file, policy=policy, rego_pkg_name=rego_pkg_name, input_data=input_data)
+        cache.put(cache_key, eval_result)
+        return dict(eval_result, cache=cache.get_stats(hit=False))
+
+    def _eval_opa(self, policy_file: str, policy: str, rego_pkg_name: str, input_data: str) -> dict:
+        if get_opa_backend() == opa_backend_server:
+            server = get_opa_server(workdir=self.workdir)
+            if server:
+                try:
+                    result_value = server.evaluate(policy=policy, pkg_name=rego_pkg_name, input_data=input_data)
+                    eval_result = {"value": result_value, "message": ""}
+                    print(eval_result)
+                    return eval_result
+                except OPAServerError as e:
+                    print(f"[opa] {e}; falling back to `opa eval`")
+
         cmd_str = f"opa eval --data {policy_file} --stdin-input 'data.{rego_pkg_name}'"
-        proc = subprocess.run(
+        proc = traced_subprocess_run(
             cmd_str,
             shell=True,
             cwd=self.workdir,
@@ -112,6 +177,100 @@ class RunOPARegoTool(BaseTool):
         return eval_result
 
 
+class RunOPARegoBulkToolInput(BaseModel):
+    policy_file: str = Field(description="Rego policy filepath to be evaluated. The policy must check ONE item as `input`")
+    input_file: str = Field(description="The filepath to the input data which contains the items (e.g. `kubectl get pods -A -o json`)")
+    items_key: str = Field(
+        default="",
+        description="A dotted path to the list of items in the input data (optional; `items`, a top-level list or a map of hosts by default)",
+    )
+    id_field: str = Field(default="", description="A dotted path to the ID field of an item (optional; Kubernetes namespace/name by default)")
+
+
+class RunOPARegoBulkTool(BaseTool):
+    name: str = "RunOPARegoBulkTool"
+    description: str = (
+        "The tool to run OPA Rego evaluation for each item (e.g. each pod or each host) of the input data in a single pass. "
+        "This tool returns the check result per item ID."
+    )
+
+    args_schema: type[BaseModel] = RunOPARegoBulkToolInput
+
+    # disable cache
+    cache_function: Callable = lambda _args, _result: False
+
+    workdir: str = ""
+
+    def __init__(self, **kwargs):
+        super_args = {k: v for k, v in kwargs.items() if k not in ["workdir"]}
+        super().__init__(**super_args)
+        if "workdir" in kwargs:
+            self.workdir = kwargs["workdir"]
+
+    @instrumented_tool
+    @checkpointed_tool(input_file_args=("policy_file", "input_file"))
+    def _run(self, policy_file: str, input_file: str, items_key: str = "", id_field: str = "") -> str:
+        print("RunOPARegoBulkTool is called")
+        policy_file = trim_quote(policy_file)
+        input_file = trim_quote(input_file)
+
+        with open(os.path.join(self.workdir, input_file), "r") as f:
+            input_data = f.read()
+        try:
+            data = parse_input_data(input_data)
+        except ValueError as e:
+            raise ValueError(f"failed to parse the input data as JSON or YAML: {e}")
+        items = get_bulk_items(data, items_key=trim_quote(items_key), id_field=trim_quote(id_field))
+        eval_result = evaluate_bulk(policy_file=policy_file, items=items, workdir=self.workdir)
+        print(eval_result["summary"])
+        return eval_result
+
+
+class RunOPARegoMultiToolInput(BaseModel):
+    policy_files: Union[dict, list, str] = Field(
+        description="A map of requirement ID to the Rego policy filepath (a list of filepaths uses the file names as the IDs)"
+    )
+    input_file: str = Field(description="The filepath to the input data to be used for checking all the policies")
+
+
+class RunOPARegoMultiTool(BaseTool):
+    name: str = "RunOPARegoMultiTool"
+    description: str = (
+        "The tool to run many OPA Rego policies against the same input data in a single evaluation. "
+        "This tool returns the check result per requirement ID."
+    )
+
+    args_schema: type[BaseModel] = RunOPARegoMultiToolInput
+
+    # disable cache
+    cache_function: Callable = lambda _args, _result: False
+
+    workdir: str = ""
+
+    def __init__(self, **kwargs):
+        super_args = {k: v for k, v in kwargs.items() if k not in ["workdir"]}
+        super().__init__(**super_args)
+        if "workdir" in kwargs:
+            self.workdir = kwargs["workdir"]
+
+    @instrumented_tool
+    @checkpointed_tool(input_file_args=("policy_files", "input_file"))
+    def _run(self, policy_files: Union[dict, list, str], input_file: str) -> str:
+        print("RunOPARegoMultiTool is called")
+        input_file = trim_quote(input_file)
+        if isinstance(policy_files, str):
+            policy_files = json.loads(policy_files)
+        if isinstance(policy_files, list):
+            policy_files = {os.path.splitext(os.path.basename(trim_quote(f)))[0]: f for f in policy_files}
+        policy_files = {str(k): trim_quote(v) for k, v in policy_files.items()}
+
+        with open(os.path.join(self.workdir, input_file), "r") as f:
+            input_data = f.read()
+        eval_result = evaluate_multi(policy_files=policy_files, input_data=input_data, workdir=self.workdir)
+        print(eval_result["results"])
+        return eval_result
+
+
 def get_rego_main_package_name(rego_path: str):
     pkg_name = ""
     with open(rego_path, "r") as file:
@@ -19,7 +19,9 @@ from typing import Callable
 
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field
+from ciso_agent.events import instrumented_tool
 from ciso_agent.tools.utils import trim_quote
+from ciso_agent.tracing import traced_subprocess_run
 
 
 class RunPlaybookToolInput(BaseModel):
@@ -50,6 +52,8 @@ This tool returns the following:
         if "workdir" in kwargs:
             self.workdir = kwargs["workdir"]
 
+    # not checkpointed: the result depends on the live host state, so a retried run must execute it again
+    @instrumented_tool
     def _run(self, host: str, playbook_file: str) -> str:
         print("RunPlaybookTool is called")
         playbook_file = trim_quote(playbook_file)
@@ -70,7 +74,7 @@ This tool returns the following:
         print("[DEBUG] Running this playbook:", code)
 
         cmd_str = f"ansible-playbook {playbook_file} -i inventory.ansible.ini"
-        proc = subprocess.run(
+        proc = traced_subprocess_run(
             cmd_str,
             shell=True,
             cwd=self.workdir,
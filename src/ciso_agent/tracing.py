@@ -0,0 +1,399 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import subprocess
+import threading
+import time
+from typing import Optional
+
+_init_lock = threading.Lock()
+_env_loaded = False
+_langtrace_initialized = False
+
+
+def load_env():
+    """Load `.env` once per process"""
+    global _env_loaded
+
+    with _init_lock:
+        if _env_loaded:
+            return
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _env_loaded = True
+
+
+def init_langtrace():
+    """Initialize Langtrace once per process if `LANGTRACE_API_HOST` is set.
+
+    The SDK is imported only when it is enabled.
+    """
+    global _langtrace_initialized
+
+    load_env()
+    with _init_lock:
+        if _langtrace_initialized:
+            return
+        _langtrace_initialized = True
+        if not os.getenv("LANGTRACE_API_HOST"):
+            return
+        from langtrace_python_sdk import langtrace
+
+        langtrace.init(
+            api_host=os.getenv("LANGTRACE_API_HOST"),
+            api_key=os.getenv("LANGTRACE_API_KEY"),
+        )
+
+
+# hierarchical timing spans (node -> crew -> task -> tool -> subprocess / LLM call), exported to a local file.
+# spans are recorded only if `CISO_TRACE_FILE` is set; otherwise `trace_span()` does nothing.
+trace_format_chrome = "chrome"
+trace_format_otlp = "otlp"
+
+span_kind_internal = "internal"
+span_kind_node = "node"
+span_kind_crew = "crew"
+span_kind_task = "task"
+span_kind_tool = "tool"
+span_kind_llm = "llm"
+span_kind_subprocess = "subprocess"
+
+# OTLP SpanKind: LLM calls are client calls, the others are internal
+otlp_span_kinds = {span_kind_llm: 3}
+
+
+class Span(object):
+    __slots__ = ["name", "kind", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "thread_id", "attributes", "error"]
+
+    def __init__(self, name: str, kind: str, parent: Optional["Span"] = None, attributes: Optional[dict] = None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else ""
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.thread_id = threading.get_ident()
+        self.attributes = dict(attributes or {})
+        self.error = ""
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self):
+        self.end_ns = time.time_ns()
+
+
+chrome_trace_head = '{"displayTimeUnit": "ms", "traceEvents": [\n'
+chrome_trace_tail = "\n]}\n"
+
+
+class Tracer(object):
+    def __init__(self, trace_file: str, trace_format: str = trace_format_chrome):
+        if trace_format not in [trace_format_chrome, trace_format_otlp]:
+            raise ValueError(f"Env variable `CISO_TRACE_FORMAT` must be `chrome` or `otlp`, but got `{trace_format}`")
+        self.trace_file = trace_file
+        self.trace_format = trace_format
+        # spans ended since the last export; exported spans are not kept
+        self.pending = []
+        self._started = False
+        self._has_events = False
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.pending.append(span)
+
+    def export(self):
+        """Append the spans ended since the last export to the trace file.
+
+        The first export of the tracer starts a new file. A Chrome trace stays a valid JSON document
+        (the closing brackets are overwritten on each append); OTLP is written as JSON lines, one request per export.
+        """
+        with self._lock:
+            spans = self.pending
+            self.pending = []
+            if self._started and not spans:
+                return
+            trace_dir = os.path.dirname(self.trace_file)
+            if trace_dir:
+                os.makedirs(trace_dir, exist_ok=True)
+            if self.trace_format == trace_format_otlp:
+                with open(self.trace_file, "a" if self._started else "w") as f:
+                    f.write(json.dumps(to_otlp_json(spans)) + "\n")
+            else:
+                self._append_chrome_events(to_chrome_trace(spans)["traceEvents"])
+            self._started = True
+
+    def _append_chrome_events(self, events: list):
+        body = ",\n".join([json.dumps(e) for e in events])
+        if not self._started:
+            with open(self.trace_file, "w") as f:
+                f.write(chrome_trace_head + body + chrome_trace_tail)
+        else:
+            with open(self.trace_file, "r+b") as f:
+                f.seek(-len(chrome_trace_tail), os.SEEK_END)
+                f.write(((",\n" if self._has_events and events else "") + body + chrome_trace_tail).encode("utf-8"))
+                f.truncate()
+        self._has_events = self._has_events or bool(events)
+
+
+current_span = contextvars.ContextVar("ciso_agent_span", default=None)
+
+_tracer = None
+_tracer_pid = None
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Return the tracer, or None if `CISO_TRACE_FILE` is not set. `{pid}` in the path is replaced with the process ID."""
+    global _tracer, _tracer_pid
+
+    # a forked child (e.g. the batch runner) records its own spans into its own file
+    if _tracer_pid == os.getpid():
+        return _tracer
+    with _init_lock:
+        trace_file = os.getenv("CISO_TRACE_FILE", "")
+        _tracer = None
+        if trace_file:
+            trace_format = os.getenv("CISO_TRACE_FORMAT", trace_format_chrome).lower()
+            _tracer = Tracer(trace_file=trace_file.replace("{pid}", str(os.getpid())), trace_format=trace_format)
+        _tracer_pid = os.getpid()
+        return _tracer
+
+
+@atexit.register
+def _export_at_exit():
+    if _tracer is not None and _tracer_pid == os.getpid():
+        try:
+            _tracer.export()
+        except OSError as e:
+            print(f"failed to write the trace file: {e}")
+
+
+def reset_tracer():
+    global _tracer, _tracer_pid
+
+    with _init_lock:
+        _tracer = None
+        _tracer_pid = None
+
+
+@contextlib.contextmanager
+def trace_span(name: str, kind: str = span_kind_internal, **attributes):
+    """Record a span for the block as a child of the current span; yields the span (None if tracing is disabled)"""
+    tracer = get_tracer()
+    if tracer is None:
+        yield None
+        return
+    span = Span(name=name, kind=kind, parent=current_span.get(), attributes=attributes)
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span.end()
+        try:
+            current_span.reset(token)
+        except ValueError:
+            # the block ended in another context (e.g. a crew callback in another thread)
+            pass
+        tracer.add(span)
+
+
+def export_trace():
+    tracer = get_tracer()
+    if tracer:
+        tracer.export()
+
+
+class CrewTaskSpans(object):
+    """Spans for the sequential tasks of a crew. Pass `callback` to `Crew(task_callback=...)`;
+    each call closes the span of the finished task and opens the next one."""
+
+    def __init__(self, task_names: list):
+        self.task_names = list(task_names)
+        self._index = 0
+        self._span = None
+        self._span_cm = None
+
+    def start(self):
+        self._open()
+
+    def callback(self, output=None):
+        if self._span is not None:
+            raw = getattr(output, "raw", None)
+            self._span.set_attribute("output_size", len(raw) if isinstance(raw, str) else None)
+        self._close()
+        self._index += 1
+        self._open()
+
+    def finish(self):
+        self._close()
+
+    def _open(self):
+        if self._index >= len(self.task_names):
+            return
+        self._span_cm = trace_span(f"task:{self.task_names[self._index]}", kind=span_kind_task)
+        self._span = self._span_cm.__enter__()
+
+    def _close(self):
+        if self._span_cm is not None:
+            self._span_cm.__exit__(None, None, None)
+        self._span_cm = None
+        self._span = None
+
+
+@contextlib.contextmanager
+def trace_crew(name: str, task_names: list):
+    """Span of a crew kickoff with a child span per task; yields the `task_callback` for the crew (None if tracing is disabled)"""
+    if get_tracer() is None:
+        yield None
+        return
+    with trace_span(f"crew:{name}", kind=span_kind_crew, tasks=len(task_names)):
+        task_spans = CrewTaskSpans(task_names)
+        task_spans.start()
+        try:
+            yield task_spans.callback
+        finally:
+            task_spans.finish()
+
+
+def traced_subprocess_run(cmd, **kwargs) -> subprocess.CompletedProcess:
+    """`subprocess.run` with a span which records the command and the payload sizes"""
+    if get_tracer() is None:
+        return run_subprocess(cmd, **kwargs)
+    cmd_str = cmd if isinstance(cmd, str) else " ".join(cmd)
+    with trace_span(f"subprocess:{cmd_str.split(' ')[0]}", kind=span_kind_subprocess, command=cmd_str[:200]) as span:
+        stdin_data = kwargs.get("input")
+        span.set_attribute("input_size", len(stdin_data) if stdin_data is not None else 0)
+        proc = run_subprocess(cmd, **kwargs)
+        span.set_attribute("returncode", proc.returncode)
+        span.set_attribute("stdout_size", len(proc.stdout) if proc.stdout is not None else 0)
+        span.set_attribute("stderr_size", len(proc.stderr) if proc.stderr is not None else 0)
+        return proc
+
+
+def run_subprocess(cmd, **kwargs) -> subprocess.CompletedProcess:
+    """`subprocess.run` which kills the process when the current run is cancelled (e.g. by the job timeout of the service).
+    `CISO_SUBPROCESS_TIMEOUT` (seconds) is the default `timeout`."""
+    # events imports this module
+    from ciso_agent.events import RunCancelledError, cancel_poll_interval, current_event_sink
+
+    if kwargs.get("timeout") is None:
+        timeout = float(os.getenv("CISO_SUBPROCESS_TIMEOUT", "0"))
+        kwargs["timeout"] = timeout if timeout > 0 else None
+    sink = current_event_sink.get()
+    if sink is None:
+        return subprocess.run(cmd, **kwargs)
+
+    timeout = kwargs.pop("timeout")
+    input_data = kwargs.pop("input", None)
+    check = kwargs.pop("check", False)
+    if kwargs.pop("capture_output", False):
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+    if input_data is not None:
+        kwargs["stdin"] = subprocess.PIPE
+    deadline = time.monotonic() + timeout if timeout else None
+    with subprocess.Popen(cmd, **kwargs) as proc:
+        while True:
+            wait = cancel_poll_interval
+            if deadline is not None:
+                wait = min(wait, max(deadline - time.monotonic(), 0.0))
+            try:
+                stdout, stderr = proc.communicate(input=input_data, timeout=wait)
+                break
+            except subprocess.TimeoutExpired:
+                # the input is sent only by the first call
+                input_data = None
+            if sink.cancelled.is_set():
+                proc.kill()
+                proc.communicate()
+                raise RunCancelledError(f"run `{sink.run_id}` is cancelled")
+            if deadline is not None and time.monotonic() >= deadline:
+                proc.kill()
+                stdout, stderr = proc.communicate()
+                raise subprocess.TimeoutExpired(proc.args, timeout, output=stdout, stderr=stderr)
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(proc.args, proc.returncode, stdout, stderr)
+
+
+def to_chrome_trace(spans: list) -> dict:
+    """Chrome trace event format (open with chrome://tracing or https://ui.perfetto.dev)"""
+    pid = os.getpid()
+    events = []
+    for span in spans:
+        args = dict(span.attributes, span_id=span.span_id, parent_id=span.parent_id, trace_id=span.trace_id)
+        if span.error:
+            args["error"] = span.error
+        events.append(
+            {
+                "name": span.name,
+                "cat": span.kind,
+                "ph": "X",
+                "ts": span.start_ns / 1000,
+                "dur": (span.end_ns - span.start_ns) / 1000,
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": args,
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def to_otlp_json(spans: list) -> dict:
+    """OTLP/JSON `ExportTraceServiceRequest`"""
+    otlp_spans = []
+    for span in spans:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": otlp_span_kinds.get(span.kind, 1),
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [_to_otlp_attribute("ciso_agent.span_kind", span.kind)]
+            + [_to_otlp_attribute(k, v) for k, v in span.attributes.items() if v is not None],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        otlp_spans.append(otlp_span)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [_to_otlp_attribute("service.name", "ciso-agent"), _to_otlp_attribute("process.pid", os.getpid())]},
+                "scopeSpans": [{"scope": {"name": "ciso_agent"}, "spans": otlp_spans}],
+            }
+        ]
+    }
+
+
+def _to_otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
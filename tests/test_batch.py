@@ -0,0 +1,81 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import time
+
+from ciso_agent.batch import get_percentile, load_batch_items, prepare_scenario, run_batch
+
+scenario_data = {
+    "goal_template": "Check the cluster with kubeconfig `{{ kubeconfig }}` and the hosts in `{{ path_to_inventory }}`.",
+    "vars": {
+        "kubeconfig": "apiVersion: v1\n",
+        "ansible_ini": '[all]\nhost1 ansible_ssh_private_key_file="/path/to/key"\n',
+        "ansible_user_key": "secret",
+    },
+}
+
+
+def echo_goal(goal: str) -> dict:
+    if "sleep" in goal:
+        time.sleep(30)
+    if "fail" in goal:
+        raise ValueError("failed on purpose")
+    return {"result": {"goal_length": len(goal)}}
+
+
+def test_load_batch_items(tmp_path):
+    scenario_path = tmp_path / "scenario_data.json"
+    scenario_path.write_text(json.dumps(scenario_data))
+    input_path = tmp_path / "goals.jsonl"
+    input_path.write_text("\n".join([json.dumps("a goal"), json.dumps({"id": "s1", "scenario_data": "scenario_data.json"}), json.dumps(scenario_data)]))
+
+    items = load_batch_items(str(input_path))
+    assert [item["id"] for item in items] == ["0000", "s1", "0002"]
+    assert items[0]["goal"] == "a goal"
+    assert items[1]["scenario_data"] == scenario_data
+
+
+def test_prepare_scenario(tmp_path):
+    workdir = str(tmp_path / "w")
+    goal = prepare_scenario({"id": "s1", "goal": "", "scenario_data": scenario_data}, workdir)
+    assert f"`{workdir}/kubeconfig.yaml`" in goal
+    assert f"`{workdir}/ansible.ini`" in goal
+    assert goal.endswith(f"You can use `{workdir}` as your workdir.\n")
+    with open(os.path.join(workdir, "ansible.ini")) as f:
+        assert f'ansible_ssh_private_key_file="{workdir}/user_key"' in f.read()
+    assert os.stat(os.path.join(workdir, "user_key")).st_mode & 0o777 == 0o600
+
+
+def test_run_batch(tmp_path):
+    items = [{"id": name, "goal": name, "scenario_data": None} for name in ["ok", "fail", "sleep"]]
+    summary = run_batch(items, output_dir=str(tmp_path), workers=3, timeout=2, target=echo_goal)
+    assert summary["total"] == 3
+    assert summary["succeeded"] == 1
+    assert summary["failed"] == 1
+    assert summary["timed_out"] == 1
+
+    with open(tmp_path / "results.jsonl") as f:
+        records = [json.loads(line) for line in f]
+    assert [r["status"] for r in records] == ["succeeded", "failed", "timed_out"]
+    assert records[0]["result"]["goal_length"] > 0
+    assert os.path.exists(tmp_path / "0000-ok" / "agent-result.json")
+
+
+def test_get_percentile():
+    values = list(range(1, 101))
+    assert get_percentile(values, 50) == 50
+    assert get_percentile(values, 99) == 99
+    assert get_percentile([], 90) == 0.0
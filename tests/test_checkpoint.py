@@ -0,0 +1,145 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+
+from ciso_agent.checkpoint import RunAttempt, checkpointed_tool, current_attempt, current_run_id, run_with_checkpoint
+
+
+class WriteTool(object):
+    def __init__(self, workdir: str):
+        self.workdir = workdir
+        self.calls = 0
+
+    @checkpointed_tool(input_file_args=("input_file",))
+    def _run(self, policy_file: str, input_file: str = "input.json") -> str:
+        self.calls += 1
+        with open(os.path.join(self.workdir, input_file)) as f:
+            data = f.read()
+        with open(os.path.join(self.workdir, policy_file), "w") as f:
+            f.write(f"policy for {data}")
+        return f"saved {policy_file}"
+
+
+def test_tool_calls_are_replayed_per_run(tmp_path, monkeypatch):
+    monkeypatch.setenv("CISO_CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    workdir = tmp_path / "workdir"
+    workdir.mkdir()
+    (workdir / "input.json").write_text("a")
+    tool = WriteTool(workdir=str(workdir))
+
+    token = current_run_id.set("run-1")
+    try:
+        attempt_token = current_attempt.set(RunAttempt())
+        assert tool._run("policy.rego") == "saved policy.rego"
+        # the same call again in the same attempt is executed, not replayed
+        assert tool._run("policy.rego") == "saved policy.rego"
+        assert tool.calls == 2
+        current_attempt.reset(attempt_token)
+
+        # the failed attempt left a partial output behind; output files are not part of the key
+        (workdir / "policy.rego").write_text("partial")
+        # a retry replays both calls and restores the written file, then runs a third one
+        attempt_token = current_attempt.set(RunAttempt())
+        assert tool._run(policy_file="policy.rego") == "saved policy.rego"
+        assert tool._run("policy.rego") == "saved policy.rego"
+        assert tool.calls == 2
+        assert (workdir / "policy.rego").read_text() == "policy for a"
+        tool._run("policy.rego")
+        assert tool.calls == 3
+
+        # a different input file content is a new call
+        (workdir / "input.json").write_text("b")
+        tool._run("policy.rego")
+        assert tool.calls == 4
+        current_attempt.reset(attempt_token)
+    finally:
+        current_run_id.reset(token)
+
+    # another run ID does not reuse the records
+    token = current_run_id.set("run-2")
+    try:
+        tool._run("policy.rego")
+        assert tool.calls == 5
+    finally:
+        current_run_id.reset(token)
+
+
+class GenerateTool(object):
+    def __init__(self, workdir: str):
+        self.workdir = workdir
+        self.calls = 0
+
+    @checkpointed_tool(data_file_args=("input_file",))
+    def _run(self, policy_file: str, input_file: str) -> str:
+        self.calls += 1
+        return f"saved {policy_file}"
+
+
+def test_live_data_is_keyed_by_fingerprint(tmp_path, monkeypatch):
+    monkeypatch.setenv("CISO_CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    workdir = tmp_path / "workdir"
+    workdir.mkdir()
+    tool = GenerateTool(workdir=str(workdir))
+
+    def collect(kind, name):
+        (workdir / "collected_data.json").write_text(json.dumps({"apiVersion": "v1", "kind": kind, "metadata": {"name": name}}))
+
+    token = current_run_id.set("run-1")
+    try:
+        for kind, name, calls in [("Pod", "a", 1), ("Pod", "b", 1), ("Service", "a", 2)]:
+            # every attempt collects the live data again before generating the policy
+            collect(kind, name)
+            attempt_token = current_attempt.set(RunAttempt())
+            tool._run("policy.rego", "collected_data.json")
+            current_attempt.reset(attempt_token)
+            assert tool.calls == calls
+    finally:
+        current_run_id.reset(token)
+
+
+def test_failed_calls_are_not_recorded(tmp_path, monkeypatch):
+    monkeypatch.setenv("CISO_CHECKPOINT_DIR", str(tmp_path))
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ValueError("failed")
+        return {"result": {"ok": True}}
+
+    token = current_run_id.set("run-1")
+    try:
+        for _ in range(3):
+            attempt_token = current_attempt.set(RunAttempt())
+            try:
+                output = run_with_checkpoint("nodes", "node", {"goal": "g"}, "", func)
+            except ValueError:
+                continue
+            finally:
+                current_attempt.reset(attempt_token)
+    finally:
+        current_run_id.reset(token)
+    assert output == {"result": {"ok": True}}
+    assert len(calls) == 2
+
+
+def test_no_checkpoint_without_run_id(tmp_path, monkeypatch):
+    monkeypatch.setenv("CISO_CHECKPOINT_DIR", str(tmp_path))
+    calls = []
+    for _ in range(2):
+        run_with_checkpoint("nodes", "node", {}, "", lambda: calls.append(1))
+    assert len(calls) == 2
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,81 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from ciso_agent.code_fence import CodeFenceParser
+from ciso_agent.llm import extract_code_block
+
+answer = """Here is the policy:
+```rego
+package check
+import rego.v1
+
+default result := true
+```
+
+Explanation: this policy checks ...
+"""
+
+
+def feed_by_chunk(parser: CodeFenceParser, text: str, size: int):
+    for i in range(0, len(text), size):
+        if parser.feed(text[i : i + size]):
+            return True
+    return False
+
+
+def test_parser_stops_at_closing_fence():
+    for size in [1, 2, 3, 7, len(answer)]:
+        parser = CodeFenceParser(code_type="rego")
+        assert feed_by_chunk(parser, answer, size)
+        assert parser.code == "package check\nimport rego.v1\n\ndefault result := true\n"
+        assert parser.text.endswith("```")
+        assert "Explanation" not in parser.text
+
+
+def test_parser_skips_other_languages():
+    text = "```json\n{\"a\": 1}\n```\nthen\n```yaml\nkind: Pod\n```\n"
+    parser = CodeFenceParser(code_type="yaml")
+    assert feed_by_chunk(parser, text, 4)
+    assert parser.code == "kind: Pod\n"
+
+
+def test_parser_accepts_untagged_block():
+    parser = CodeFenceParser(code_type="yaml")
+    assert parser.feed("```\nkind: Pod\n```")
+    assert parser.code == "kind: Pod\n"
+
+
+def test_parser_incomplete_block():
+    parser = CodeFenceParser(code_type="rego")
+    assert not parser.feed("```rego\npackage check\n")
+    assert not parser.done
+    assert parser.text == "```rego\npackage check\n"
+
+
+def test_extract_code_block_skips_other_languages():
+    text = 'The input looks like:\n```json\n{"items": []}\n```\n' + answer
+    assert extract_code_block(text, code_type="rego").startswith("package check\n")
+    assert extract_code_block("```\nkind: Pod\n```", code_type="yaml") == "kind: Pod\n"
+
+
+def test_parser_accepts_language_aliases():
+    text = "Here it is:\n```json\n{}\n```\n```yml\n- hosts: all\n```\nDone.\n"
+    parser = CodeFenceParser(code_type="yaml")
+    assert feed_by_chunk(parser, text, 4)
+    assert parser.code == "- hosts: all\n"
+    assert parser.text.endswith("```yml\n- hosts: all\n```")
+
+    parser = CodeFenceParser(code_type="shell")
+    assert parser.feed("```bash\nkubectl get pods\n```")
+    assert parser.code == "kubectl get pods\n"
@@ -0,0 +1,140 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+import threading
+
+import pytest
+
+from ciso_agent.events import (
+    EventStream,
+    RunCancelledError,
+    check_cancelled,
+    emit_event,
+    event_node_finished,
+    event_node_started,
+    event_scope,
+    instrumented_tool,
+)
+import ciso_agent.llm as llm
+from ciso_agent.llm import run_llm_coroutine
+
+
+class EchoTool(object):
+    @instrumented_tool
+    def _run(self, text: str) -> str:
+        return text * 2
+
+
+class DictTool(object):
+    @instrumented_tool
+    def _run(self) -> dict:
+        return {"summary": "ok"}
+
+
+def run_nodes():
+    with event_scope(event_node_started, event_node_finished, node="task_selector"):
+        EchoTool()._run("ab")
+    return {"result": {"ok": True}}
+
+
+def test_stream_yields_events_and_writes_jsonl(tmp_path):
+    events_file = tmp_path / "events.jsonl"
+    stream = EventStream(run_nodes, run_id="run-1", events_file=str(events_file))
+    events = list(stream)
+    assert [e["type"] for e in events] == ["node_started", "tool_started", "tool_finished", "node_finished"]
+    assert events[2]["output_size"] == 4
+    assert events[3]["status"] == "ok"
+    assert all(e["run_id"] == "run-1" for e in events)
+    assert stream.wait() == {"result": {"ok": True}}
+
+    with open(events_file) as f:
+        assert [json.loads(line)["type"] for line in f] == [e["type"] for e in events]
+
+
+def test_stream_cancel():
+    started = threading.Event()
+
+    def target():
+        started.set()
+        while True:
+            check_cancelled()
+
+    stream = EventStream(target, run_id="run-2")
+    started.wait()
+    stream.cancel()
+    with pytest.raises(RunCancelledError):
+        stream.wait(timeout=5)
+
+
+def test_output_size_of_non_str_output():
+    events = list(EventStream(lambda: DictTool()._run(), run_id="run-5"))
+    assert events[1]["output_size"] == len('{"summary": "ok"}')
+
+
+class FakeResponse(object):
+    def __init__(self, usage_metadata):
+        self.usage_metadata = usage_metadata
+
+
+def test_llm_call_event_uses_reported_usage():
+    def target():
+        usage = llm.get_usage(FakeResponse({"input_tokens": 120, "output_tokens": 30, "total_tokens": 150}))
+        llm.emit_llm_call_event(role="agent", model="m", duration=0.1, prompts=["p"], answer="a", usage=usage)
+        # no usage report (e.g. a stream stopped early) falls back to the estimate
+        llm.emit_llm_call_event(role="agent", model="m", duration=0.1, prompts=["p"], answer="a", usage=llm.get_usage(FakeResponse(None)))
+
+    events = list(EventStream(target, run_id="run-6"))
+    assert (events[0]["prompt_tokens"], events[0]["completion_tokens"], events[0]["estimated"]) == (120, 30, False)
+    assert events[1]["estimated"] is True
+
+
+def test_async_iteration_and_no_sink():
+    # without a sink, events are dropped
+    assert emit_event("node_started", node="x") is None
+
+    async def consume():
+        return [e["type"] async for e in EventStream(run_nodes, run_id="run-3")]
+
+    assert asyncio.run(consume())[0] == "node_started"
+
+
+def test_llm_coroutines_see_the_caller_context():
+    async def emit():
+        return emit_event("llm_call", role="agent")
+
+    def target():
+        return run_llm_coroutine(emit())
+
+    stream = EventStream(target, run_id="run-4")
+    assert [e["type"] for e in stream] == ["llm_call"]
+    assert stream.wait()["run_id"] == "run-4"
+
+
+def test_structured_output_fallback_does_not_swallow_cancel(monkeypatch):
+    calls = []
+
+    async def cancelled_call(**kwargs):
+        calls.append(kwargs)
+        raise RunCancelledError("run `x` is cancelled")
+
+    monkeypatch.setattr(llm, "acall_llm", cancelled_call)
+    monkeypatch.setenv("LLM_STRUCTURED_OUTPUT", "true")
+    with pytest.raises(RunCancelledError):
+        run_llm_coroutine(llm.acall_llm_json(prompt="p", schema={"type": "object"}, model="gpt-4o"))
+    with pytest.raises(RunCancelledError):
+        run_llm_coroutine(llm.agenerate_code(prompt="p", code_type="rego", model="gpt-4o"))
+    # no second call for the free-text fallback
+    assert len(calls) == 2
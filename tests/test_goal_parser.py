@@ -0,0 +1,82 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from ciso_agent.goal_parser import extract_paths_from_goal, select_agent_nodes
+
+kyverno_goal = """I would like to check if the following condition is satisfiled, given a Kubernetes cluster with `kubeconfig.yaml`
+    Minimize the admission of containers wishing to share the host network namespace.
+
+To check the condition, do the following steps.
+- deploy a Kyverno policy to the cluster
+- chcek if the policy is correctly deployed.
+
+If deploying the policy failed and if you can fix the issue, you will do it and try deploying again.
+Once you get a final answer, you can quit the work.
+
+The cluster's kubeconfig is at `/tmp/agent/20250101000000/kubeconfig.yaml`.
+You can use `/tmp/agent/20250101000000` as your workdir.
+"""
+
+rhel_goal = """I would like to check if the following condition is satisfiled, given a host name `rhel9_servers`
+    Ensure cron daemon is enabled
+
+for those steps, you need to create ansible playbook `playbook.yml` and OPA rego policy `policy.rego`.
+You can use the inventory file `inventory.ansible.ini` to access `rhel9_servers`.
+
+The path to the inventory file is /tmp/agent/20250101000000/ansible.ini.
+You can use `/tmp/agent/20250101000000` as your workdir.
+"""
+
+
+def test_extract_paths_from_kubernetes_goal():
+    data = extract_paths_from_goal(kyverno_goal)
+    assert data == {
+        "kubeconfig": "/tmp/agent/20250101000000/kubeconfig.yaml",
+        "ansible_inventory": "",
+        "workdir": "/tmp/agent/20250101000000",
+    }
+
+
+def test_extract_paths_from_rhel_goal():
+    data = extract_paths_from_goal(rhel_goal)
+    assert data == {
+        "kubeconfig": "",
+        "ansible_inventory": "/tmp/agent/20250101000000/ansible.ini",
+        "workdir": "/tmp/agent/20250101000000",
+    }
+
+
+def test_extract_nothing():
+    data = extract_paths_from_goal("Check if the cluster-admin role is only used where required.")
+    assert not any(data.values())
+
+
+def test_select_agent_nodes_keeps_the_first_match():
+    assert select_agent_nodes(kyverno_goal, kubeconfig="/tmp/kubeconfig.yaml") == ["kubernetes_kyverno"]
+    assert select_agent_nodes(rhel_goal, ansible_inventory="/tmp/ansible.ini") == ["rhel_playbook_opa"]
+    # overlapping keywords select only the crew of the highest priority
+    goal = "Deploy a Kyverno policy, or check it with kubectl and OPA; a playbook for RHEL is not needed"
+    assert select_agent_nodes(goal, kubeconfig="/tmp/kubeconfig.yaml") == ["kubernetes_kyverno"]
+    # a word which merely contains a keyword does not match
+    assert select_agent_nodes("Check the pod capacity with kubectl and an opaque token") == []
+
+
+def test_select_agent_nodes_fans_out_only_for_two_targets():
+    goal = kyverno_goal + rhel_goal
+    paths = extract_paths_from_goal(goal)
+    assert select_agent_nodes(goal, kubeconfig=paths["kubeconfig"], ansible_inventory=paths["ansible_inventory"]) == [
+        "kubernetes_kyverno",
+        "rhel_playbook_opa",
+    ]
+    assert select_agent_nodes(goal, kubeconfig=paths["kubeconfig"]) == ["kubernetes_kyverno"]
@@ -0,0 +1,95 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from ciso_agent.graph_render import (
+    get_graph_filename,
+    get_graph_render_mode,
+    install_graph_file,
+    render_graph,
+    reset_graph_render_failures,
+)
+
+
+class Graph(object):
+    def __init__(self, mermaid: str, fail: bool = False):
+        self.mermaid = mermaid
+        self.fail = fail
+        self.png_calls = 0
+
+    def draw_mermaid(self):
+        return self.mermaid
+
+    def draw_mermaid_png(self):
+        self.png_calls += 1
+        if self.fail:
+            raise ConnectionError("mermaid.ink is not reachable")
+        return b"png:" + self.mermaid.encode("utf-8")
+
+
+def test_render_graph_is_cached_per_structure(tmp_path):
+    reset_graph_render_failures()
+    graph = Graph("graph TD; a-->b;")
+    path1 = render_graph(graph, mode="api", cache_dir=str(tmp_path))
+    path2 = render_graph(graph, mode="api", cache_dir=str(tmp_path))
+    assert path1 == path2
+    assert path1.endswith(".png")
+    assert graph.png_calls == 1
+
+    other = Graph("graph TD; a-->c;")
+    assert render_graph(other, mode="api", cache_dir=str(tmp_path)) != path1
+
+
+def test_render_graph_mermaid_mode_and_fallback(tmp_path):
+    reset_graph_render_failures()
+    graph = Graph("graph TD; a-->b;", fail=True)
+    mmd_path = render_graph(graph, mode="mermaid", cache_dir=str(tmp_path))
+    assert mmd_path.endswith(".mmd")
+    assert graph.png_calls == 0
+    with open(mmd_path) as f:
+        assert f.read() == "graph TD; a-->b;"
+
+    # rendering failure falls back to the Mermaid text
+    assert get_graph_filename("api") == "graph.png"
+    assert render_graph(graph, mode="api", cache_dir=str(tmp_path)) == mmd_path
+    assert graph.png_calls == 1
+
+    # the failure is remembered in the process, even for another graph
+    other = Graph("graph TD; a-->c;", fail=True)
+    assert render_graph(other, mode="api", cache_dir=str(tmp_path)).endswith(".mmd")
+    assert other.png_calls == 0
+    assert get_graph_filename("api") == "graph.mmd"
+    reset_graph_render_failures()
+
+
+def test_graph_render_mode_defaults_to_offline(monkeypatch):
+    monkeypatch.delenv("GRAPH_RENDER_MODE", raising=False)
+    assert get_graph_render_mode() == "mermaid"
+
+
+def test_install_graph_file(tmp_path):
+    src = tmp_path / "cached.png"
+    src.write_bytes(b"png")
+    dest = tmp_path / "workdir" / "graph.png"
+    install_graph_file(str(src), str(dest))
+    install_graph_file(str(src), str(dest))
+    assert dest.read_bytes() == b"png"
+    assert os.path.exists(src)
+
+    # rewriting the workdir file in place must not change the cached file
+    with open(dest, "r+b") as f:
+        f.write(b"PNG")
+    assert dest.read_bytes() == b"PNG"
+    assert src.read_bytes() == b"png"
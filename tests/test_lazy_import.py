@@ -0,0 +1,45 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+
+import ciso_agent
+
+heavy_packages = ["crewai", "langchain", "langchain_core", "langchain_openai", "langchain_ibm", "langtrace_python_sdk"]
+
+
+def get_imported_packages(module: str) -> list:
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(ciso_agent.__file__)))
+    code = f"""
+import json, sys
+sys.path.insert(0, {src_dir!r})
+import {module}
+print(json.dumps(sorted({{m.split(".")[0] for m in sys.modules}})))
+"""
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def test_llm_module_does_not_import_providers():
+    imported = get_imported_packages("ciso_agent.llm")
+    assert not set(imported) & set(heavy_packages)
+
+
+def test_tracing_module_does_not_import_langtrace():
+    imported = get_imported_packages("ciso_agent.tracing")
+    assert "langtrace_python_sdk" not in imported
+    assert "dotenv" not in imported
@@ -0,0 +1,108 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+
+import pytest
+
+from ciso_agent.llm_cache import LLMCacheMissError, LLMResponseCache, get_llm_cache
+
+
+def test_cache_key_is_content_addressed():
+    messages = [{"role": "human", "content": "Generate a Rego policy"}]
+    key_1 = LLMResponseCache.make_key(model="gpt-4o-mini", messages=messages, params={"temperature": 0.0})
+    key_2 = LLMResponseCache.make_key(model="gpt-4o-mini", messages=list(messages), params={"temperature": 0.0})
+    key_3 = LLMResponseCache.make_key(model="gpt-4o-mini", messages=messages, params={"temperature": 0.5})
+    assert key_1 == key_2
+    assert key_1 != key_3
+
+
+def test_cache_put_and_get(tmp_path):
+    cache = LLMResponseCache(cache_dir=str(tmp_path))
+    key = LLMResponseCache.make_key(model="m", messages=[{"role": "human", "content": "hi"}])
+    assert cache.get(key) is None
+    cache.put(key, "hello")
+    assert cache.get(key) == "hello"
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = LLMResponseCache(cache_dir=str(tmp_path))
+    keys = [LLMResponseCache.make_key(model="m", messages=[{"role": "human", "content": str(i)}]) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, "x" * 100)
+        # make access times strictly ordered
+        os.utime(cache.get_path(key), (time.time() - 100 + i, time.time()))
+    # entry sizes can differ by a few bytes (timestamps), so allow exactly the two entries to be kept
+    kept_size = os.path.getsize(cache.get_path(keys[0])) + os.path.getsize(cache.get_path(keys[2]))
+
+    # touch the oldest one so that the second one becomes the LRU entry
+    cache.get(keys[0])
+    cache.max_bytes = kept_size
+    cache.evict()
+    assert os.path.exists(cache.get_path(keys[0]))
+    assert not os.path.exists(cache.get_path(keys[1]))
+    assert os.path.exists(cache.get_path(keys[2]))
+
+
+def test_cache_put_scans_only_when_over_the_limit(tmp_path, monkeypatch):
+    cache = LLMResponseCache(cache_dir=str(tmp_path), max_bytes=10000)
+    evict = cache.evict
+    scans = []
+    monkeypatch.setattr(cache, "evict", lambda **kwargs: scans.append(1) or evict(**kwargs))
+    for i in range(5):
+        cache.put(LLMResponseCache.make_key(model="m", messages=[{"role": "human", "content": str(i)}]), "x" * 100)
+    # only the first put scans the directory to learn the total size
+    assert len(scans) == 1
+
+    cache.put(LLMResponseCache.make_key(model="m", messages=[]), "x" * 10000)
+    assert len(scans) == 2
+    total_size = sum([os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(tmp_path) for f in files])
+    assert total_size <= 10000
+
+
+def test_cache_expires_old_entries(tmp_path):
+    cache = LLMResponseCache(cache_dir=str(tmp_path), max_age=60)
+    key = LLMResponseCache.make_key(model="m", messages=[])
+    cache.put(key, "old")
+    old = time.time() - 120
+    os.utime(cache.get_path(key), (old, old))
+    assert cache.get(key) is None
+    assert not os.path.exists(cache.get_path(key))
+
+
+def test_cache_replay_mode_fails_on_miss(tmp_path):
+    key = LLMResponseCache.make_key(model="m", messages=[{"role": "human", "content": "hi"}])
+    LLMResponseCache(cache_dir=str(tmp_path)).put(key, "hello")
+
+    cache = LLMResponseCache(cache_dir=str(tmp_path), replay_only=True)
+    assert cache.get(key) == "hello"
+    with pytest.raises(LLMCacheMissError):
+        cache.get(LLMResponseCache.make_key(model="m", messages=[]))
+
+
+def test_get_llm_cache_from_env(tmp_path, monkeypatch):
+    monkeypatch.delenv("LLM_CACHE_DIR", raising=False)
+    assert get_llm_cache() is None
+
+    monkeypatch.setenv("LLM_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("LLM_CACHE_MODE", "replay")
+    cache = get_llm_cache()
+    assert cache is not None
+    assert cache.replay_only
+
+    monkeypatch.setenv("LLM_CACHE_MODE", "off")
+    assert get_llm_cache() is None
@@ -0,0 +1,88 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import urllib.request
+
+import pytest
+
+from ciso_agent.code_fence import CodeFenceParser
+from ciso_agent.mock_llm_server import MockLLMFixtures, MockLLMServer, get_prompt_hash
+
+rego_answer = """```rego
+package check
+import rego.v1
+
+default result := true
+```
+
+This policy always passes.
+"""
+
+
+@pytest.fixture
+def server(tmp_path):
+    messages = [{"role": "user", "content": "Say hello"}]
+    fixture_file = tmp_path / "fixtures.json"
+    fixture_file.write_text(
+        json.dumps(
+            {
+                "default": "default answer",
+                "responses": [
+                    {"prompt_hash": get_prompt_hash(messages), "response": "hello"},
+                    {"contains": "OPA Rego policy", "response": rego_answer},
+                ],
+            }
+        )
+    )
+    _server = MockLLMServer(fixtures=MockLLMFixtures(fixture_file=str(fixture_file))).start()
+    yield _server
+    _server.stop()
+
+
+def post(server: MockLLMServer, body: dict):
+    req = urllib.request.Request(
+        server.base_url + "/chat/completions",
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    return urllib.request.urlopen(req)
+
+
+def test_scripted_responses(server):
+    with post(server, {"model": "mock", "messages": [{"role": "user", "content": "Say hello"}]}) as resp:
+        data = json.loads(resp.read())
+    assert data["choices"][0]["message"]["content"] == "hello"
+    assert data["usage"]["completion_tokens"] > 0
+
+    with post(server, {"model": "mock", "messages": [{"role": "user", "content": "unknown prompt"}]}) as resp:
+        data = json.loads(resp.read())
+    assert data["choices"][0]["message"]["content"] == "default answer"
+    assert server.request_count == 2
+
+
+def test_streaming_response(server):
+    body = {"model": "mock", "stream": True, "messages": [{"role": "user", "content": "Generate an OPA Rego policy"}]}
+    parser = CodeFenceParser(code_type="rego")
+    with post(server, body) as resp:
+        for line in resp:
+            line = line.decode("utf-8").strip()
+            if not line.startswith("data: ") or line == "data: [DONE]":
+                continue
+            chunk = json.loads(line[len("data: ") :])
+            if parser.feed(chunk["choices"][0]["delta"].get("content", "")):
+                break
+    assert parser.code.startswith("package check")
+    assert "always passes" not in parser.text
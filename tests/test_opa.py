@@ -0,0 +1,263 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ciso_agent.tools import opa
+from ciso_agent.tools.opa import (
+    OPAEvalCache,
+    OPAServer,
+    build_multi_query,
+    check_rego_policy,
+    evaluate_bulk,
+    evaluate_multi,
+    get_bulk_items,
+    get_opa_backend,
+    get_opa_server,
+    get_policy_id,
+    is_cacheable_policy,
+    make_unique_item_ids,
+    parse_input_data,
+    rename_package,
+    stop_opa_servers,
+    summarize_bulk_results,
+)
+
+policy_v1 = "package check\n\ndefault result := false\n"
+policy_v2 = "package check\n\ndefault result := true\n"
+
+
+class StubOPAHandler(BaseHTTPRequestHandler):
+    """Minimal Policy / Data API: `data.check.result` is true if the loaded policy says so"""
+
+    protocol_version = "HTTP/1.1"
+    policies = {}
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", "0")))
+
+    def _send(self, status: int, data: dict):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._send(200, {})
+
+    def do_PUT(self):
+        self.requests.append(("PUT", self.path))
+        self.policies[self.path] = self._read().decode("utf-8")
+        self._send(200, {})
+
+    def do_DELETE(self):
+        self.requests.append(("DELETE", self.path))
+        self.policies.pop(self.path, None)
+        self._send(200, {})
+
+    def do_POST(self):
+        body = json.loads(self._read())
+        assert len(self.policies) == 1
+        policy = list(self.policies.values())[0]
+        self._send(200, {"result": {"result": "true" in policy, "input": body["input"]}})
+
+
+@pytest.fixture
+def stub_server():
+    StubOPAHandler.policies = {}
+    StubOPAHandler.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubOPAHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield OPAServer(port=httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_backend_env(monkeypatch):
+    monkeypatch.delenv("OPA_BACKEND", raising=False)
+    assert get_opa_backend() == "subprocess"
+    monkeypatch.setenv("OPA_BACKEND", "grpc")
+    with pytest.raises(ValueError):
+        get_opa_backend()
+
+
+def test_parse_input_data():
+    assert parse_input_data('{"a": 1}') == {"a": 1}
+    assert parse_input_data("a: 1\nb: [x]\n") == {"a": 1, "b": ["x"]}
+
+
+def test_policy_is_pushed_once_per_content(stub_server):
+    assert stub_server.evaluate(policy_v1, "check", '{"x": 1}') == {"result": False, "input": {"x": 1}}
+    assert stub_server.evaluate(policy_v1, "check", '{"x": 2}')["input"] == {"x": 2}
+    assert StubOPAHandler.requests == [("PUT", f"/v1/policies/{get_policy_id(policy_v1)}")]
+
+    # a new version of the same package replaces the old module
+    assert stub_server.evaluate(policy_v2, "check", "{}")["result"] is True
+    assert StubOPAHandler.requests[1:] == [("DELETE", f"/v1/policies/{get_policy_id(policy_v1)}"), ("PUT", f"/v1/policies/{get_policy_id(policy_v2)}")]
+
+
+def test_eval_cache_lru_and_disk(tmp_path):
+    cache = OPAEvalCache(max_entries=2, cache_dir=str(tmp_path))
+    keys = [cache.make_key(policy=policy_v1, input_data=f'{{"x": {i}}}', query="data.check") for i in range(3)]
+    assert len(set(keys)) == 3
+    assert cache.make_key(policy=policy_v2, input_data='{"x": 0}', query="data.check") != keys[0]
+    assert cache.get(keys[0]) is None
+
+    for i, key in enumerate(keys):
+        cache.put(key, {"value": {"result": i}, "message": ""})
+    assert list(cache._entries) == keys[1:]
+    assert cache.get(keys[2]) == {"value": {"result": 2}, "message": ""}
+    assert cache.get_stats(hit=True) == {"hit": True, "hits": 1, "misses": 1}
+
+    # evicted from the memory, but still on the disk; a new process reads the disk too
+    assert cache.get(keys[0])["value"] == {"result": 0}
+    assert OPAEvalCache(max_entries=2, cache_dir=str(tmp_path)).get(keys[1])["value"] == {"result": 1}
+
+
+def test_eval_cache_disk_is_bounded(tmp_path, monkeypatch):
+    listdir_calls = []
+    listdir = os.listdir
+    monkeypatch.setattr(os, "listdir", lambda path: listdir_calls.append(path) or listdir(path))
+
+    cache = OPAEvalCache(max_entries=1, cache_dir=str(tmp_path), max_disk_entries=10)
+    keys = [cache.make_key(policy=policy_v1, input_data=f'{{"x": {i}}}', query="data.check") for i in range(11)]
+    for i, key in enumerate(keys[:10]):
+        cache.put(key, {"value": {"result": i}, "message": ""})
+        os.utime(tmp_path / f"{key}.json", (i + 1, i + 1))
+    # only the first put lists the directory; the others keep a running count
+    assert len(listdir_calls) == 1
+    # the first entry is read from the disk, so the second and third ones are the least recently used
+    assert cache.get(keys[0])["value"] == {"result": 0}
+    cache.put(keys[10], {"value": {"result": 10}, "message": ""})
+    # over the limit, the entries are evicted down to the low water mark
+    assert len(listdir_calls) == 2
+    assert sorted(os.listdir(tmp_path)) == sorted([f"{key}.json" for key in [keys[0]] + keys[3:]])
+
+
+def test_nondeterministic_policy_is_not_cacheable():
+    assert is_cacheable_policy(policy_v1)
+    assert not is_cacheable_policy("package check\nimport rego.v1\nresult if time.now_ns() > 0")
+    assert not is_cacheable_policy('package check\nresp := http.send({"method": "get", "url": "http://x"})')
+    assert not is_cacheable_policy("package check\nn := rand.intn(\"x\", 10)")
+
+
+def test_bulk_items():
+    pods = {"kind": "List", "items": [{"metadata": {"namespace": "ns", "name": "a"}}, {"metadata": {"name": "b"}}, {"spec": {}}]}
+    assert [i["id"] for i in get_bulk_items(pods)] == ["ns/a", "b", "2"]
+    hosts = {"host-1": {"sshd": "yes"}, "host-2": {"sshd": "no"}}
+    assert get_bulk_items(hosts) == [{"id": "host-1", "input": {"sshd": "yes"}}, {"id": "host-2", "input": {"sshd": "no"}}]
+    nested = {"data": {"servers": [{"fqdn": {"value": "x"}}]}}
+    assert get_bulk_items(nested, items_key="data.servers", id_field="fqdn.value")[0]["id"] == "x"
+    with pytest.raises(ValueError):
+        get_bulk_items(nested, items_key="data.missing")
+
+
+def test_summarize_bulk_results():
+    bulk_results = [{"id": "a", "value": {"result": True}}, {"id": "b", "value": {"result": False}}]
+    output = summarize_bulk_results(["a", "b", "c"], bulk_results)
+    assert output["summary"] == {"total": 3, "passed": 1, "failed": 1, "undefined": 1}
+    assert output["results"][2] == {"id": "c", "result": None}
+
+    # a missing `result` is undefined when the policy has a `result` rule; an empty package value is always undefined
+    output = summarize_bulk_results(["a", "b"], [{"id": "a", "value": {"result": True}}, {"id": "b", "value": {"deny": []}}])
+    assert output["results"][1] == {"id": "b", "result": None}
+    assert summarize_bulk_results(["a"], [{"id": "a", "value": {}}])["summary"]["undefined"] == 1
+    # without a `result` rule, the whole value is the verdict
+    assert summarize_bulk_results(["a"], [{"id": "a", "value": {"deny": ["x"]}}])["results"][0]["result"] == {"deny": ["x"]}
+
+
+def test_make_unique_item_ids():
+    items = [{"id": "a", "input": 1}, {"id": "b", "input": 2}, {"id": "a", "input": 3}]
+    assert [item["id"] for item in make_unique_item_ids(items)] == ["a#0", "b", "a#2"]
+
+
+@pytest.mark.skipif(not shutil.which("opa"), reason="opa is not installed")
+def test_real_bulk_eval(tmp_path):
+    policy = "package check\n\nimport rego.v1\n\ndefault result := true\n\nresult := false if input.spec.hostNetwork\n"
+    (tmp_path / "policy.rego").write_text(policy)
+    items = get_bulk_items({"items": [{"metadata": {"name": "a"}, "spec": {"hostNetwork": True}}, {"metadata": {"name": "b"}, "spec": {}}]})
+    output = evaluate_bulk("policy.rego", items, workdir=str(tmp_path))
+    assert output["results"] == [{"id": "a", "result": False}, {"id": "b", "result": True}]
+
+
+def test_rename_package():
+    policy = "package check\nimport rego.v1\n\nresult := data.check.allowed\nallowed := data.check_other.x\n"
+    renamed = rename_package(policy, "check_req_1")
+    assert renamed == "package check_req_1\nimport rego.v1\n\nresult := data.check_req_1.allowed\nallowed := data.check_other.x\n"
+    with pytest.raises(ValueError):
+        rename_package("result := true\n", "check_req_1")
+
+
+def test_multi_query():
+    assert build_multi_query({"req-1": "check_req_1", "req-2": "check_req_2"}) == 'multi_results := {"req-1": data.check_req_1, "req-2": data.check_req_2}'
+
+
+@pytest.mark.skipif(not shutil.which("opa"), reason="opa is not installed")
+def test_real_multi_eval(tmp_path):
+    (tmp_path / "a.rego").write_text("package check\n\nimport rego.v1\n\nresult := input.x > 1\n")
+    (tmp_path / "b.rego").write_text("package check\n\nimport rego.v1\n\nresult := input.x > 5\n")
+    output = evaluate_multi({"req-a": "a.rego", "req-b": "b.rego"}, input_data='{"x": 2}', workdir=str(tmp_path))
+    assert output["results"] == {"req-a": True, "req-b": False}
+
+
+def test_no_opa_binary(monkeypatch, tmp_path):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    assert get_opa_server(workdir=str(tmp_path)) is None
+    # the check is skipped
+    assert check_rego_policy(policy_v1) is None
+
+
+class FakeServer(object):
+    def __init__(self):
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+def test_stop_servers_of_workdir(monkeypatch, tmp_path):
+    workdir = str(tmp_path / "run")
+    servers = {"": FakeServer(), workdir: FakeServer(), workdir + "/branch": FakeServer(), workdir + "-other": FakeServer()}
+    monkeypatch.setattr(opa, "_servers", dict(servers))
+    stop_opa_servers(workdir)
+    assert [k for k, server in servers.items() if server.stopped] == [workdir, workdir + "/branch"]
+    assert sorted(opa._servers) == ["", workdir + "-other"]
+    stop_opa_servers()
+    assert opa._servers == {}
+    assert all([server.stopped for server in servers.values()])
+
+
+@pytest.mark.skipif(not shutil.which("opa"), reason="opa is not installed")
+def test_real_check():
+    assert check_rego_policy("package check\n\nimport rego.v1\n\ndefault result := true\n") == ""
+    errors = check_rego_policy("package check\n\nresult := false {\n    input.x\n}\n")
+    assert errors and "policy.rego" in errors
+
+
+@pytest.mark.skipif(not shutil.which("opa"), reason="opa is not installed")
+def test_real_server(tmp_path):
+    server = get_opa_server(workdir=str(tmp_path))
+    policy = "package check\n\nresult := input.x > 1\n"
+    assert server.evaluate(policy, "check", '{"x": 2}') == {"result": True}
@@ -0,0 +1,65 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+from ciso_agent.tools.policy_store import PolicyStore, get_data_fingerprint, normalize_requirement, policy_kind_rego
+
+requirement = "Minimize the admission of containers wishing to share the host network namespace."
+
+
+def test_normalize_requirement():
+    assert normalize_requirement(requirement) == normalize_requirement("  minimize the admission of containers wishing to share the HOST network namespace ")
+
+
+def test_fingerprint_ignores_values():
+    data_1 = {"items": [{"metadata": {"name": "a"}, "spec": {"hostNetwork": True}}]}
+    data_2 = {"items": [{"metadata": {"name": "b"}, "spec": {"hostNetwork": False}}, {"metadata": {"name": "c"}, "spec": {"hostNetwork": True}}]}
+    data_3 = {"items": [{"metadata": {"name": "a"}, "spec": {"hostNetwork": "true"}}]}
+    assert get_data_fingerprint(json.dumps(data_1)) == get_data_fingerprint(json.dumps(data_2))
+    assert get_data_fingerprint(json.dumps(data_1)) != get_data_fingerprint(json.dumps(data_3))
+    assert get_data_fingerprint("plain text") == "text"
+
+
+def test_fingerprint_ignores_free_form_keys_and_optional_fields():
+    pod_1 = {"apiVersion": "v1", "kind": "Pod", "metadata": {"name": "a", "labels": {"app": "web"}}, "spec": {}}
+    pod_2 = {"apiVersion": "v1", "kind": "Pod", "metadata": {"name": "b", "annotations": {"example.com/owner": "x"}}}
+    pod_2["spec"] = {"hostNetwork": True}
+    pods_1 = {"apiVersion": "v1", "kind": "List", "items": [pod_1]}
+    pods_2 = {"apiVersion": "v1", "kind": "List", "items": [pod_2, pod_1]}
+    assert get_data_fingerprint(json.dumps(pods_1)) == get_data_fingerprint(json.dumps(pods_2))
+    deployments = {"apiVersion": "v1", "kind": "List", "items": [dict(pod_1, apiVersion="apps/v1", kind="Deployment")]}
+    assert get_data_fingerprint(json.dumps(pods_1)) != get_data_fingerprint(json.dumps(deployments))
+
+    # host names are map keys; only the shape of the facts matters
+    hosts_1 = {"host-1": {"sshd": "yes"}}
+    hosts_2 = {"rhel9.example.com": {"sshd": "no"}, "host-2": {"sshd": "yes"}}
+    assert get_data_fingerprint(json.dumps(hosts_1)) == get_data_fingerprint(json.dumps(hosts_2))
+    assert get_data_fingerprint(json.dumps({"metadata": {"labels": {"a": "1"}}})) == get_data_fingerprint(json.dumps({"metadata": {"labels": {"b": "2"}}}))
+
+
+def test_policy_is_a_hit_only_after_validation(tmp_path):
+    store = PolicyStore(store_dir=str(tmp_path))
+    key = store.make_key(kind=policy_kind_rego, requirement=requirement, input_fingerprint="abc")
+    policy = "package check\n\ndefault result := true\n"
+
+    store.put_candidate(key, policy)
+    assert store.get(key) is None
+
+    assert store.mark_validated(policy)
+    assert store.get(key) == policy
+
+    # a failed validation removes the policy from the store
+    assert store.invalidate(policy)
+    assert store.get(key) is None
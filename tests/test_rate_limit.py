@@ -0,0 +1,172 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ciso_agent import llm
+from ciso_agent.events import RunCancelledError, event_sink
+from ciso_agent.rate_limit import RateLimiter, call_with_retry, get_backoff_delay, get_retry_after
+
+
+class FakeResponse(object):
+    def __init__(self, status_code: int, headers: dict):
+        self.status_code = status_code
+        self.headers = headers
+
+
+class FakeRateLimitError(Exception):
+    def __init__(self, retry_after: str = ""):
+        super().__init__("429 Too Many Requests")
+        self.response = FakeResponse(429, {"retry-after": retry_after} if retry_after else {})
+
+
+def test_request_bucket_is_shared_by_limiters(tmp_path):
+    limiter_1 = RateLimiter(name="endpoint", requests_per_minute=2, state_dir=str(tmp_path))
+    # another instance (e.g. in another process) with the same state dir shares the bucket
+    limiter_2 = RateLimiter(name="endpoint", requests_per_minute=2, state_dir=str(tmp_path))
+    assert limiter_1.try_acquire() == 0
+    assert limiter_2.try_acquire() == 0
+    wait = limiter_1.try_acquire()
+    assert 0 < wait <= 30
+
+
+def test_token_bucket(tmp_path):
+    limiter = RateLimiter(name="endpoint", tokens_per_minute=1000, state_dir=str(tmp_path))
+    assert limiter.try_acquire(tokens=800) == 0
+    assert limiter.try_acquire(tokens=800) > 0
+    assert limiter.try_acquire(tokens=100) == 0
+
+
+def test_penalize_blocks_limiter(tmp_path):
+    limiter = RateLimiter(name="endpoint", requests_per_minute=100, state_dir=str(tmp_path))
+    limiter.penalize(10)
+    assert 9 < limiter.try_acquire() <= 10
+
+
+def test_backoff_respects_retry_after():
+    assert get_retry_after(FakeRateLimitError(retry_after="7")) == 7.0
+    assert 7.0 <= get_backoff_delay(0, base_delay=0.5, retry_after=7.0) <= 7.5
+    for attempt in range(5):
+        assert 0 <= get_backoff_delay(attempt, base_delay=1.0, max_delay=4.0) <= 4.0
+
+
+def test_retry_after_ms_is_clamped():
+    error = FakeRateLimitError()
+    error.response.headers = {"retry-after-ms": "-500"}
+    assert get_retry_after(error) == 0.0
+    error.response.headers = {"retry-after-ms": "soon"}
+    assert get_retry_after(error) is None
+    error.response.headers = {"retry-after-ms": "nan"}
+    assert get_retry_after(error) is None
+    assert get_backoff_delay(0, base_delay=0.001, max_delay=2.0, retry_after=1e9) <= 2.001
+
+
+def test_retry_backoff_stops_on_cancel(monkeypatch):
+    monkeypatch.setenv("LLM_MAX_RETRIES", "3")
+    monkeypatch.setenv("LLM_RETRY_MAX_DELAY", "30")
+
+    def limited():
+        raise FakeRateLimitError(retry_after="30")
+
+    start = time.monotonic()
+    with event_sink(run_id="run-1") as sink:
+        threading.Timer(0.1, sink.cancel).start()
+        with pytest.raises(RunCancelledError):
+            call_with_retry(limited)
+    assert time.monotonic() - start < 5
+
+
+def test_call_with_retry(monkeypatch):
+    monkeypatch.setenv("LLM_MAX_RETRIES", "3")
+    monkeypatch.setenv("LLM_RETRY_BASE_DELAY", "0.001")
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise FakeRateLimitError(retry_after="0")
+        return "ok"
+
+    assert call_with_retry(flaky) == "ok"
+    assert len(calls) == 3
+
+    def broken():
+        raise ValueError("not retryable")
+
+    with pytest.raises(ValueError):
+        call_with_retry(broken)
+
+
+def test_aacquire_does_not_block_event_loop(tmp_path):
+    limiter = RateLimiter(name="endpoint", requests_per_minute=100, state_dir=str(tmp_path))
+    ticks = []
+
+    async def ticker():
+        for _ in range(3):
+            ticks.append(1)
+            await asyncio.sleep(0)
+
+    async def main():
+        # hold the file lock, so that `aacquire` has to wait for it
+        with limiter._locked_state():
+            task = asyncio.create_task(limiter.aacquire())
+            await ticker()
+            assert not task.done()
+        return await task
+
+    assert asyncio.run(main()) >= 0
+    assert len(ticks) == 3
+
+
+class FakeMessage(object):
+    type = "human"
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeChatClient(object):
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    async def ainvoke(self, messages):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.05)
+        self.running -= 1
+        return FakeMessage(f"answer to {messages[0].content}")
+
+
+def test_acall_llm_concurrency_is_limited_per_endpoint(monkeypatch):
+    client = FakeChatClient()
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "2")
+    monkeypatch.delenv("LLM_CACHE_DIR", raising=False)
+    monkeypatch.delenv("LLM_RATE_LIMIT_RPM", raising=False)
+    monkeypatch.delenv("LLM_RATE_LIMIT_TPM", raising=False)
+    monkeypatch.setattr(llm, "build_llm_messages", lambda prompt, model="": [FakeMessage(prompt)])
+    monkeypatch.setattr(llm, "get_llm_client", lambda **kwargs: client)
+
+    async def gather():
+        # the semaphore is per endpoint; a new URL gets a fresh one with the limit above
+        requests = [llm.acall_llm(prompt=str(i), model="m", api_url="http://concurrency-test", api_key="k") for i in range(6)]
+        return await asyncio.gather(*requests)
+
+    answers = llm.run_llm_coroutine(gather())
+    assert answers == [f"answer to {i}" for i in range(6)]
+    assert client.max_running == 2
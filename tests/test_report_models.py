@@ -0,0 +1,31 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+pytest.importorskip("pydantic")
+
+from ciso_agent.agents.report_models import KubernetesKubectlOPAReport, KubernetesKyvernoReport, RHELPlaybookOPAReport, dump_report  # noqa: E402
+
+
+def test_report_keeps_the_free_form_shape():
+    # a cluster-scoped resource has no `namespace`
+    raw = {"deployed_resource": {"kind": "ClusterPolicy", "name": "disallow-host-network"}, "path_to_generated_kyverno_policy": "policy.yaml"}
+    assert dump_report(KubernetesKyvernoReport.model_validate(raw)) == raw
+
+    # a missing path stays missing, and extra keys are kept
+    raw = {"path_to_generated_rego_policy": "policy.rego", "path_to_collected_data_by_script": "collected_data.json", "note": "no script"}
+    assert dump_report(KubernetesKubectlOPAReport.model_validate(raw)) == raw
+
+    assert dump_report(RHELPlaybookOPAReport.model_validate({})) == {}
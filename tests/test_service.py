@@ -0,0 +1,154 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import http.client
+import json
+import sys
+import threading
+import time
+
+import pytest
+
+from ciso_agent.events import EventStream, check_cancelled, emit_event
+from ciso_agent.service import AgentService, make_http_server
+from ciso_agent.tracing import traced_subprocess_run
+
+
+class FakeManager(object):
+    """Runs a goal like `wait:<seconds>` (checking for cancellation), `sleep` (a hung subprocess) or `fail`"""
+
+    def __init__(self):
+        self.order = []
+        self.release = threading.Event()
+
+    def stream(self, state, run_id: str = "", events_file: str = ""):
+        return EventStream(lambda: self._run(state["goal"]), run_id=run_id)
+
+    def _run(self, goal: str):
+        self.order.append(goal)
+        emit_event("node_started", node="task_selector")
+        if goal == "fail":
+            raise ValueError("boom")
+        if goal.startswith("wait"):
+            deadline = time.monotonic() + float(goal.split(":")[1])
+            while time.monotonic() < deadline:
+                check_cancelled()
+                time.sleep(0.01)
+        if goal == "blocker":
+            self.release.wait(5)
+        if goal == "sleep":
+            traced_subprocess_run([sys.executable, "-c", "import time; time.sleep(30)"], capture_output=True, text=True)
+        return {"result": {"goal": goal}}
+
+
+def wait_for(job, statuses, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while job.status not in statuses:
+        assert time.monotonic() < deadline, f"job status is `{job.status}`"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def service():
+    manager = FakeManager()
+    service = AgentService(workers=1, queue_size=3, manager=manager).start()
+    yield service
+    manager.release.set()
+    service.stop(timeout=5)
+
+
+def test_priority_and_queue_bound(service):
+    blocker = service.submit("blocker")
+    wait_for(blocker, ["running"])
+    low = service.submit("low", priority=0)
+    high = service.submit("high", priority=5)
+    other = service.submit("other")
+    with pytest.raises(Exception, match="full"):
+        service.submit("overflow")
+    service.manager.release.set()
+    wait_for(other, ["succeeded"])
+    assert service.manager.order == ["blocker", "high", "low", "other"]
+    assert high.result == {"result": {"goal": "high"}}
+    assert low.event_count == 1
+
+
+def test_cancel_timeout_and_failure(service):
+    running = service.submit("wait:5")
+    queued = service.submit("wait:5")
+    wait_for(running, ["running"])
+    service.cancel(queued.id)
+    assert queued.status == "cancelled"
+    service.cancel(running.id)
+    wait_for(running, ["cancelled"])
+    assert "RunCancelledError" in running.error
+
+    timed_out = service.submit("wait:5", timeout=0.1)
+    wait_for(timed_out, ["timed_out"])
+    failed = service.submit("fail")
+    wait_for(failed, ["failed"])
+    assert failed.error == "ValueError: boom"
+
+
+def test_cancelled_queued_job_frees_the_slot(service):
+    blocker = service.submit("blocker")
+    wait_for(blocker, ["running"])
+    queued = [service.submit(f"job-{i}") for i in range(3)]
+    with pytest.raises(Exception, match="full"):
+        service.submit("overflow")
+    service.cancel(queued[0].id)
+    assert service.submit("next").status == "queued"
+
+
+def test_timeout_kills_hung_subprocess(service):
+    start = time.monotonic()
+    job = service.submit("sleep", timeout=0.2)
+    wait_for(job, ["timed_out"])
+    assert time.monotonic() - start < 5
+    assert "RunCancelledError" in job.error
+
+
+def test_http_api(service, tmp_path):
+    httpd = make_http_server(service, port=0)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    host, port = httpd.server_address[:2]
+
+    def request(method, path, body=None):
+        conn = http.client.HTTPConnection(host, port, timeout=5)
+        conn.request(method, path, body=json.dumps(body) if body is not None else None)
+        resp = conn.getresponse()
+        data = json.loads(resp.read())
+        conn.close()
+        return resp.status, data
+
+    try:
+        output = tmp_path / "agent-result.json"
+        status, data = request("POST", "/jobs", {"goal": "hello", "id": "job-1", "output": str(output)})
+        assert status == 202 and data["id"] == "job-1"
+        assert request("POST", "/jobs", {"goal": ""})[0] == 400
+        assert request("GET", "/jobs/unknown")[0] == 404
+
+        wait_for(service.get_job("job-1"), ["succeeded"])
+        status, data = request("GET", "/jobs/job-1/result")
+        assert status == 200 and data["result"] == {"result": {"goal": "hello"}}
+        assert json.loads(output.read_text()) == {"result": {"goal": "hello"}}
+        assert request("GET", "/jobs/job-1/events")[1]["events"][0]["type"] == "node_started"
+        assert request("GET", "/health")[1]["succeeded"] == 1
+
+        status, data = request("POST", "/jobs", {"goal": "wait:5", "id": "job-2"})
+        assert request("GET", "/jobs/job-2/result")[0] == 409
+        assert request("POST", "/jobs/job-2/cancel")[0] == 200
+        wait_for(service.get_job("job-2"), ["cancelled"])
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
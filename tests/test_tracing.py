@@ -0,0 +1,130 @@
+# Copyright contributors to the ITBench project. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import sys
+
+import pytest
+
+from ciso_agent.events import instrumented_tool
+from ciso_agent.llm import run_llm_coroutine
+from ciso_agent.tracing import export_trace, get_tracer, reset_tracer, trace_crew, trace_span, traced_subprocess_run
+
+
+class EchoTool(object):
+    @instrumented_tool
+    def _run(self, text: str) -> str:
+        return text * 2
+
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    path = tmp_path / "trace.json"
+    monkeypatch.setenv("CISO_TRACE_FILE", str(path))
+    monkeypatch.delenv("CISO_TRACE_FORMAT", raising=False)
+    reset_tracer()
+    yield path
+    reset_tracer()
+
+
+def load_spans(path) -> dict:
+    with open(path) as f:
+        return {e["name"]: e for e in json.load(f)["traceEvents"]}
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.delenv("CISO_TRACE_FILE", raising=False)
+    reset_tracer()
+    with trace_span("node:test") as span:
+        assert span is None
+    assert EchoTool()._run("ab") == "abab"
+
+
+def test_nested_spans_chrome(trace_file):
+    with trace_span("node:test", kind="node"):
+        with trace_crew("TestCrew", task_names=["target_task", "report_task"]) as task_callback:
+            EchoTool()._run("ab")
+            task_callback(None)
+            traced_subprocess_run([sys.executable, "-c", "print('hello')"], capture_output=True, text=True)
+    export_trace()
+
+    spans = load_spans(trace_file)
+    node = spans["node:test"]
+    crew = spans["crew:TestCrew"]
+    task1 = spans["task:target_task"]
+    task2 = spans["task:report_task"]
+    assert node["ph"] == "X" and node["args"]["parent_id"] == ""
+    assert crew["args"]["parent_id"] == node["args"]["span_id"]
+    assert task1["args"]["parent_id"] == crew["args"]["span_id"]
+    assert task2["args"]["parent_id"] == crew["args"]["span_id"]
+    assert spans["tool:EchoTool"]["args"]["parent_id"] == task1["args"]["span_id"]
+    assert spans["tool:EchoTool"]["args"]["output_size"] == 4
+
+    proc = [s for name, s in spans.items() if name.startswith("subprocess:")][0]
+    assert proc["args"]["parent_id"] == task2["args"]["span_id"]
+    assert proc["args"]["returncode"] == 0
+    assert proc["args"]["stdout_size"] == len("hello\n")
+    assert node["dur"] >= crew["dur"]
+
+
+def test_span_in_llm_loop_keeps_parent(trace_file):
+    async def child():
+        with trace_span("llm:test", kind="llm"):
+            pass
+
+    with trace_span("node:test"):
+        run_llm_coroutine(child())
+    export_trace()
+
+    spans = load_spans(trace_file)
+    assert spans["llm:test"]["args"]["parent_id"] == spans["node:test"]["args"]["span_id"]
+
+
+def test_otlp_format_and_error(trace_file, monkeypatch):
+    monkeypatch.setenv("CISO_TRACE_FORMAT", "otlp")
+    reset_tracer()
+    with pytest.raises(ValueError):
+        with trace_span("node:test", kind="node", attempt=1):
+            raise ValueError("boom")
+    export_trace()
+
+    with open(trace_file) as f:
+        data = json.loads(f.readline())
+    span = data["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert span["name"] == "node:test"
+    assert len(span["traceId"]) == 32 and len(span["spanId"]) == 16
+    assert "parentSpanId" not in span
+    assert span["status"] == {"code": 2, "message": "ValueError: boom"}
+    assert {"key": "attempt", "value": {"intValue": "1"}} in span["attributes"]
+
+
+def test_export_appends_only_new_spans(trace_file, monkeypatch):
+    for i in range(3):
+        with trace_span(f"run:{i}"):
+            pass
+        export_trace()
+        # the exported spans are dropped from the tracer, so each export writes only the latest run
+        assert get_tracer().pending == []
+    export_trace()
+    assert list(load_spans(trace_file)) == ["run:0", "run:1", "run:2"]
+
+    monkeypatch.setenv("CISO_TRACE_FORMAT", "otlp")
+    reset_tracer()
+    for i in range(2):
+        with trace_span(f"run:{i}"):
+            pass
+        export_trace()
+    with open(trace_file) as f:
+        lines = f.read().splitlines()
+    assert [json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["name"] for line in lines] == ["run:0", "run:1"]